@@ -1,6 +1,6 @@
 import argparse
 from init_db import add_admin, init_db
-from main import Session, Admin
+from database import Session, Admin, bump_version
 
 
 def list_admins():
@@ -33,6 +33,7 @@ def remove_admin(user_id: int):
         return
     
     session.delete(admin)
+    session.execute(bump_version('admins'))
     session.commit()
     print(f"Администратор {admin.username} (ID: {user_id}) успешно удален")
     session.close()
@@ -48,6 +49,7 @@ def toggle_admin(user_id: int):
     
     admin.is_active = not admin.is_active
     status = "активирован" if admin.is_active else "деактивирован"
+    session.execute(bump_version('admins'))
     session.commit()
     print(f"Администратор {admin.username} (ID: {user_id}) успешно {status}")
     session.close()
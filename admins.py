@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from sqlalchemy import select
+
+import config
+from database import async_session, Admin, CacheVersion
+
+
+class AdminCache:
+    """Множество id активных администраторов в памяти процесса.
+
+    Проверка роли - поиск в множестве без запроса к базе. admin_manager.py
+    увеличивает версию 'admins' в таблице cache_versions при каждом изменении;
+    фоновая задача раз в refresh_interval секунд сравнивает версию и при
+    расхождении перечитывает список, поэтому изменения применяются без
+    перезапуска бота с задержкой не больше refresh_interval.
+    """
+
+    def __init__(self, refresh_interval=None):
+        self.refresh_interval = refresh_interval or config.ADMIN_REFRESH_INTERVAL
+        self.version = None
+        self._ids = frozenset()
+        self._task = None
+
+    def __contains__(self, user_id):
+        return user_id in self._ids
+
+    async def _get_version(self, session):
+        result = await session.execute(select(CacheVersion.version).where(CacheVersion.name == 'admins'))
+        return result.scalar()
+
+    async def load(self):
+        """Перечитывает список активных администраторов"""
+        async with async_session() as session:
+            version = await self._get_version(session)
+            result = await session.execute(select(Admin.user_id).where(Admin.is_active.is_(True)))
+            self._ids = frozenset(result.scalars().all())
+        self.version = version
+        logging.info(f"Загружено администраторов: {len(self._ids)}")
+
+    async def refresh(self):
+        """Перечитывает список, если версия в базе изменилась"""
+        async with async_session() as session:
+            version = await self._get_version(session)
+        if version != self.version:
+            await self.load()
+
+    async def start(self):
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Ошибка при обновлении списка администраторов: {e}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+
+admin_cache = AdminCache()
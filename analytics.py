@@ -0,0 +1,127 @@
+from collections import defaultdict
+from sqlalchemy import select, func
+
+from catalog import catalog
+from database import async_session, SalesDaily, DemandHourly
+
+# Ширина столбика почасового графика в символах
+CHART_WIDTH = 12
+
+CATEGORY_NAMES = {
+    'sweet': "Сладкие пироги",
+    'savory': "Сытные пироги",
+}
+
+
+def _criteria(day_column, report_filter):
+    criteria = []
+    if report_filter.date_from:
+        criteria.append(day_column >= report_filter.date_from)
+    if report_filter.date_to:
+        criteria.append(day_column <= report_filter.date_to)
+    return criteria
+
+
+async def sales_stats(report_filter):
+    """Считает статистику продаж по дневным сводкам.
+
+    Два агрегирующих запроса: по sales_daily в разрезе товара и акции и по
+    demand_hourly в разрезе часа суток. Размер сводок зависит от числа дней
+    и товаров, а не от числа заказов; остальные разрезы складываются из
+    нескольких десятков сгруппированных строк.
+    """
+    async with async_session() as session:
+        rows = (await session.execute(
+            select(
+                SalesDaily.product_id,
+                SalesDaily.promo,
+                SalesDaily.category,
+                func.sum(SalesDaily.units),
+                func.sum(SalesDaily.revenue),
+                func.sum(SalesDaily.hours),
+            )
+            .where(*_criteria(SalesDaily.day, report_filter))
+            .group_by(SalesDaily.product_id, SalesDaily.promo, SalesDaily.category)
+        )).all()
+        by_hour = (await session.execute(
+            select(DemandHourly.hour, func.sum(DemandHourly.units))
+            .where(*_criteria(DemandHourly.day, report_filter))
+            .group_by(DemandHourly.hour)
+        )).all()
+
+    by_product = defaultdict(lambda: [0, 0.0])
+    by_category = defaultdict(lambda: [0, 0.0])
+    promo = []
+    for product_id, is_promo, category, units, revenue, hours in rows:
+        for totals in (by_product[product_id], by_category[category]):
+            totals[0] += units
+            totals[1] += revenue
+        promo.append((product_id, bool(is_promo), units, hours))
+
+    def ranked(totals):
+        return sorted(((key, units, revenue) for key, (units, revenue) in totals.items()), key=lambda row: -row[2])
+
+    return {
+        'units': sum(units for units, _ in by_product.values()),
+        'revenue': sum(revenue for _, revenue in by_product.values()),
+        'by_product': ranked(by_product),
+        'by_category': ranked(by_category),
+        'by_hour': dict(by_hour),
+        'promo': promo,
+    }
+
+
+def _product_name(product_id):
+    product = catalog.get(product_id)
+    return product.name if product else f"Товар #{product_id}"
+
+
+def _uplift(promo_rows):
+    """Прирост продаж в час по акции относительно обычных часов с продажами"""
+    rates = {}
+    for product_id, is_promo, units, hours in promo_rows:
+        if hours:
+            rates.setdefault(product_id, {})[is_promo] = units / hours
+    result = []
+    for product_id, rate in rates.items():
+        if True in rate and False in rate and rate[False]:
+            result.append((product_id, rate[True], rate[False], rate[True] / rate[False] - 1))
+    result.sort(key=lambda row: row[3], reverse=True)
+    return result
+
+
+def format_stats(stats):
+    """Формирует текст отчета для администратора"""
+    if not stats['units']:
+        return "Продаж за период нет"
+
+    text = (
+        "📊 Статистика продаж\n\n"
+        f"💰 Выручка: {stats['revenue']:.2f} руб.\n"
+        f"📦 Продано: {stats['units']} шт.\n"
+    )
+
+    text += "\nПо категориям:\n"
+    for category, units, revenue in stats['by_category']:
+        text += f"• {CATEGORY_NAMES.get(category, category)}: {units} шт., {revenue:.2f} руб.\n"
+
+    text += "\nПо товарам:\n"
+    for product_id, units, revenue in stats['by_product']:
+        text += f"• {_product_name(product_id)}: {units} шт., {revenue:.2f} руб.\n"
+
+    by_hour = stats['by_hour']
+    peak = max(by_hour.values())
+    text += "\nСпрос по часам:\n"
+    for hour in range(24):
+        units = by_hour.get(hour, 0)
+        if units:
+            bar = "▇" * max(1, round(units / peak * CHART_WIDTH))
+            text += f"{hour:02d}:00 {bar} {units}\n"
+
+    uplift = _uplift(stats['promo'])
+    if uplift:
+        text += "\nЭффект акций (продажи в час по акции / без акции):\n"
+        for product_id, promo_rate, regular_rate, change in uplift:
+            text += f"• {_product_name(product_id)}: {promo_rate:.1f} / {regular_rate:.1f} ({change:+.0%})\n"
+
+    return text
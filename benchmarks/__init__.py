@@ -0,0 +1,8 @@
+"""Микробенчмарки отдельных оптимизаций.
+
+Запускаются из корня репозитория как модули, например:
+    python -m benchmarks.keyboards
+
+Каждый бенчмарк работает со своей временной базой SQLite (или с базой из
+BENCH_DATABASE_URL) и не обращается к Telegram.
+"""
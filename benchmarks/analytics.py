@@ -0,0 +1,160 @@
+"""Статистика продаж по сводкам против агрегатов по таблице заказов.
+
+Заполняет базу несколькими миллионами заказов с позициями за год, строит
+сводки sales_daily и demand_hourly той же функцией, что и миграция 10, и
+меряет отчет администратора (sales_stats) за весь период, за месяц и за
+день. Для сравнения те же разрезы считаются агрегирующими запросами
+напрямую по order_items и orders.
+
+Запуск:
+    python -m benchmarks.analytics --orders 2000000
+"""
+from benchmarks import env  # noqa: F401  окружение задается до импорта модулей бота
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import Integer, cast, delete, extract, func, insert, select, text
+
+from analytics import sales_stats
+from catalog import catalog
+from database import engine, async_session, Order, OrderItem, Product, SalesDaily, DemandHourly
+from init_db import init_db
+from migrations import _sales_rollups
+from reports import ReportFilter
+
+FIRST_DAY = date(2024, 1, 1)
+CHUNK = 50000
+# Доля позиций, проданных по акции
+PROMO_SHARE = 0.1
+
+
+def seed(orders, days):
+    rng = random.Random(1)
+    with engine.begin() as conn:
+        products = conn.execute(select(Product.id, Product.price)).all()
+        for start in range(0, orders, CHUNK):
+            count = min(CHUNK, orders - start)
+            created = [
+                datetime.combine(FIRST_DAY, datetime.min.time())
+                + timedelta(seconds=(start + i) * days * 86400 // orders)
+                for i in range(count)
+            ]
+            conn.execute(insert(Order), [
+                {'user_id': rng.randint(1, 100000), 'status': 'completed', 'total': 0.0, 'created_at': created_at}
+                for created_at in created
+            ])
+            first_id = conn.execute(text("SELECT MAX(id) FROM orders")).scalar() - count + 1
+            items = []
+            for i in range(count):
+                for product_id, price in rng.sample(products, rng.randint(1, 3)):
+                    discount = 0.2 if rng.random() < PROMO_SHARE else 0.0
+                    items.append({
+                        'order_id': first_id + i, 'product_id': product_id, 'name': "Пирог",
+                        'quantity': rng.randint(1, 3), 'unit_price': price * (1 - discount), 'discount': discount,
+                    })
+            conn.execute(insert(OrderItem), items)
+        return conn.execute(select(func.count()).select_from(OrderItem)).scalar()
+
+
+def build_rollups():
+    """Пересчитывает сводки по всем заказам, как миграция 10 для существующей базы"""
+    with engine.begin() as conn:
+        conn.execute(delete(SalesDaily))
+        conn.execute(delete(DemandHourly))
+        _sales_rollups(conn)
+        conn.execute(text("ANALYZE"))
+
+
+def _day_criteria(report_filter):
+    criteria = []
+    if report_filter.date_from:
+        criteria.append(Order.created_at >= report_filter.date_from)
+    if report_filter.date_to:
+        criteria.append(Order.created_at < report_filter.date_to + timedelta(days=1))
+    return criteria
+
+
+async def direct_stats(report_filter):
+    """Те же разрезы агрегатами по позициям заказов, без сводок"""
+    joined = OrderItem.__table__.join(Order.__table__, Order.id == OrderItem.order_id)
+    async with async_session() as session:
+        rows = (await session.execute(
+            select(
+                OrderItem.product_id,
+                OrderItem.discount > 0,
+                func.sum(OrderItem.quantity),
+                func.sum(OrderItem.quantity * OrderItem.unit_price),
+            )
+            .select_from(joined)
+            .where(*_day_criteria(report_filter))
+            .group_by(OrderItem.product_id, OrderItem.discount > 0)
+        )).all()
+        by_hour = (await session.execute(
+            select(cast(extract('hour', Order.created_at), Integer), func.sum(OrderItem.quantity))
+            .select_from(joined)
+            .where(*_day_criteria(report_filter))
+            .group_by(cast(extract('hour', Order.created_at), Integer))
+        )).all()
+    return rows, by_hour
+
+
+def cases(days):
+    last_day = FIRST_DAY + timedelta(days=days - 1)
+    return [
+        ("Весь период", ReportFilter()),
+        ("Последние 30 дней", ReportFilter(date_from=last_day - timedelta(days=29), date_to=last_day)),
+        ("Один день", ReportFilter(date_from=last_day, date_to=last_day)),
+    ]
+
+
+async def measure(stats, report_filter, samples):
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        await stats(report_filter)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+async def run(days, samples, direct_samples):
+    await catalog.reload()
+    results = []
+    for name, report_filter in cases(days):
+        # Сводки должны сходиться с заказами, иначе сравнивать нечего
+        rows, _ = await direct_stats(report_filter)
+        units = (await sales_stats(report_filter))['units']
+        assert units == sum(row[2] for row in rows), (name, units)
+        rollups = await measure(sales_stats, report_filter, samples)
+        direct = await measure(direct_stats, report_filter, direct_samples)
+        results.append((name, rollups, direct))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк статистики продаж')
+    parser.add_argument('--orders', type=int, default=2000000, help='Оформленных заказов')
+    parser.add_argument('--days', type=int, default=365, help='За сколько дней распределены заказы')
+    parser.add_argument('--samples', type=int, default=50, help='Замеров отчета по сводкам')
+    parser.add_argument('--direct-samples', type=int, default=3, help='Замеров агрегатов по заказам')
+    args = parser.parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    items = seed(args.orders, args.days)
+    print(f"База заполнена за {time.perf_counter() - started:.1f} с: {args.orders} заказов, {items} позиций")
+    started = time.perf_counter()
+    build_rollups()
+    print(f"Сводки построены за {time.perf_counter() - started:.1f} с")
+
+    results = asyncio.run(run(args.days, args.samples, args.direct_samples))
+    print(f"\n{'Период':<20} {'сводки, мс (p50/max)':>22} {'по заказам, мс (p50/max)':>26}")
+    for name, rollups, direct in results:
+        print(f"{name:<20} {rollups[0]:>12.2f} / {rollups[1]:<7.2f} {direct[0]:>14.1f} / {direct[1]:<7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Маршрутизация обновлений: поиск по словарю против цепочки фильтров.
+
+Смесь обновлений записывается сценариями пользователей из нагрузочного
+теста (меню, категории, товары, добавление, корзина, оформление) с
+фиксированным seed и может быть сохранена в JSON и воспроизведена. Оба
+диспетчера получают одни и те же обновления и вызывают пустые обработчики,
+поэтому в замер попадают только выбор обработчика и накладные расходы
+aiogram:
+
+- "словарь" - маршрутизатор Routes с маршрутами из main.py;
+- "фильтры" - те же маршруты, зарегистрированные по одному обработчику с
+  лямбда-фильтром, как было до маршрутизатора; aiogram проверяет их по
+  порядку.
+
+Запуск:
+    python -m benchmarks.dispatch --users 200 --repeat 20
+    python -m benchmarks.dispatch --save mix.json
+    python -m benchmarks.dispatch --load mix.json
+"""
+from benchmarks import env  # noqa: F401  окружение задается до импорта модулей бота
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import time
+from types import SimpleNamespace
+from aiogram import Bot, Dispatcher, F
+from aiogram.filters import Command
+from aiogram.types import Update
+
+import config
+from main import FeedbackStates, routes as bot_routes
+from catalog import catalog
+from init_db import init_db
+from loadtest import UserSession
+from routing import Routes
+
+MENU_TEXTS = ["🛒 Корзина", "🎁 Акции", "🚚 Условия доставки", "ℹ️ О нас", "📝 Оставить отзыв"]
+
+
+def record(users, seed):
+    """Смесь обновлений: сценарий каждого пользователя и случайные нажатия меню и −/+"""
+    random.seed(seed)
+    # Кнопки нажимаются под выдуманным сообщением: ответы бота не нужны
+    api = SimpleNamespace(last_message={})
+    updates = []
+    for user_id in range(1, users + 1):
+        session = UserSession(user_id, api)
+        steps = [step() for step in session.script()]
+        product_id = random.choice(catalog.all()).id
+        steps += [session.message(random.choice(MENU_TEXTS)) for _ in range(2)]
+        steps += [session.callback(f"cqty:{product_id}:{random.choice([-1, 1])}") for _ in range(2)]
+        updates += steps
+    random.shuffle(updates)
+    return updates
+
+
+async def noop(event, callback_data=None, state=None):
+    pass
+
+
+def with_routes():
+    dp = Dispatcher()
+    routes = Routes()
+    routes.setup(dp)
+    for text in bot_routes._texts:
+        routes.text(text)(noop)
+    for factory, _ in bot_routes._callbacks.values():
+        routes.callback(factory)(noop)
+    dp.message.register(noop, Command("start"))
+    dp.message.register(noop, FeedbackStates.waiting, F.text)
+    return dp
+
+
+def _prefix_filter(prefix):
+    # Фабрики без полей упаковываются в один префикс, остальные - в "префикс:поля"
+    return lambda callback: callback.data == prefix or callback.data.startswith(prefix + ":")
+
+
+def with_filters():
+    dp = Dispatcher()
+    dp.message.register(noop, Command("start"))
+    for text in bot_routes._texts:
+        dp.message.register(noop, lambda message, text=text: message.text == text)
+    for factory, _ in bot_routes._callbacks.values():
+        dp.callback_query.register(noop, _prefix_filter(factory.__prefix__))
+    dp.message.register(noop, FeedbackStates.waiting, F.text)
+    return dp
+
+
+async def measure(dp, bot, updates, repeat):
+    """Время обработки одного обновления, мкс"""
+    for update in updates:
+        await dp.feed_update(bot, update)
+    timings = []
+    for _ in range(repeat):
+        for update in updates:
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            timings.append((time.perf_counter() - started) * 1e6)
+    return timings
+
+
+async def run(args):
+    await catalog.reload()
+    if args.load:
+        with open(args.load, encoding='utf-8') as file:
+            updates = [Update.model_validate(item) for item in json.load(file)]
+    else:
+        updates = record(args.users, args.seed)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump([update.model_dump(mode='json', exclude_none=True) for update in updates], file, ensure_ascii=False)
+
+    # Пустые обработчики не обращаются к Bot API
+    bot = Bot(token=config.BOT_TOKEN)
+    try:
+        results = {}
+        for name, build in (("словарь", with_routes), ("фильтры", with_filters)):
+            results[name] = await measure(build(), bot, updates, args.repeat)
+    finally:
+        await bot.session.close()
+    return len(updates), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк маршрутизации обновлений')
+    parser.add_argument('--users', type=int, default=200, help='Пользователей в записанной смеси')
+    parser.add_argument('--seed', type=int, default=1, help='Seed генератора смеси')
+    parser.add_argument('--repeat', type=int, default=20, help='Повторов смеси')
+    parser.add_argument('--save', help='Сохранить смесь обновлений в JSON')
+    parser.add_argument('--load', help='Воспроизвести смесь обновлений из JSON')
+    args = parser.parse_args()
+
+    # Строка лога на каждое обновление заняла бы большую часть замера
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    init_db()
+    count, results = asyncio.run(run(args))
+    print(f"Обновлений в смеси: {count}, повторов: {args.repeat}")
+    print(f"{'':<10} {'среднее, мкс':>13} {'p50, мкс':>9} {'p99, мкс':>9}")
+    for name, timings in results.items():
+        p99 = statistics.quantiles(timings, n=100)[98]
+        print(f"{name:<10} {statistics.mean(timings):>13.1f} {statistics.median(timings):>9.1f} {p99:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
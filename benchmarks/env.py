@@ -0,0 +1,9 @@
+"""Окружение бенчмарков; импортируется до модулей бота.
+
+База - BENCH_DATABASE_URL или новая база SQLite во временном каталоге.
+"""
+import os
+
+from isolated_env import configure, temp_database_url
+
+configure(os.getenv("BENCH_DATABASE_URL") or temp_database_url("bakery-bench-"), token="123456:bench")
@@ -0,0 +1,90 @@
+"""Запись отзывов: пачками через FeedbackWriter против коммита на каждый отзыв.
+
+M отзывов приходят от C одновременных пользователей. В варианте "по одному"
+каждый отзыв записывается своей транзакцией, как до буферизации; в варианте
+"пачками" обработчик только кладет отзыв в буфер FeedbackWriter, а замер
+заканчивается, когда все отзывы записаны.
+
+Запуск:
+    python -m benchmarks.feedback --messages 5000 --concurrency 50
+"""
+from benchmarks import env  # noqa: F401  окружение задается до импорта модулей бота
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from sqlalchemy import func, insert, select
+
+from database import async_session, Feedback
+from feedback import FeedbackWriter
+from init_db import init_db
+
+
+async def write_one(user_id, text):
+    async with async_session() as session:
+        await session.execute(insert(Feedback).values(
+            user_id=user_id, username=f"user{user_id}", text=text, created_at=datetime.now(),
+        ))
+        await session.commit()
+
+
+async def per_message(messages, concurrency):
+    async def user(user_id):
+        for i in range(user_id, messages, concurrency):
+            await write_one(user_id, f"отзыв {i}")
+
+    await asyncio.gather(*(user(user_id) for user_id in range(concurrency)))
+
+
+async def batched(messages, concurrency, batch_size, flush_interval):
+    writer = FeedbackWriter(batch_size=batch_size, flush_interval=flush_interval)
+
+    async def user(user_id):
+        for i in range(user_id, messages, concurrency):
+            writer.add(user_id, f"user{user_id}", f"отзыв {i}")
+            # Отзывы приходят отдельными обновлениями
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(user(user_id) for user_id in range(concurrency)))
+    await writer.stop()
+
+
+async def count():
+    async with async_session() as session:
+        return (await session.execute(select(func.count()).select_from(Feedback))).scalar()
+
+
+async def run(args):
+    results = {}
+    for name, scenario in (
+        ("по одному", lambda: per_message(args.messages, args.concurrency)),
+        ("пачками", lambda: batched(args.messages, args.concurrency, args.batch_size, args.flush_interval)),
+    ):
+        before = await count()
+        started = time.perf_counter()
+        await scenario()
+        duration = time.perf_counter() - started
+        written = await count() - before
+        assert written == args.messages, (name, written)
+        results[name] = args.messages / duration
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк записи отзывов')
+    parser.add_argument('--messages', type=int, default=5000, help='Отзывов')
+    parser.add_argument('--concurrency', type=int, default=50, help='Одновременных пользователей')
+    parser.add_argument('--batch-size', type=int, default=50, help='Размер пачки FeedbackWriter')
+    parser.add_argument('--flush-interval', type=float, default=2.0, help='Пауза записи неполной пачки, секунд')
+    args = parser.parse_args()
+
+    init_db()
+    results = asyncio.run(run(args))
+    for name, rate in results.items():
+        print(f"{name:<10} {rate:>10.0f} отзывов/с")
+    print(f"Ускорение: x{results['пачками'] / results['по одному']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Задержка поиска корзины и заказов на большой базе с индексами и без них.
+
+Заполняет базу миллионом оформленных заказов (по позиции в каждом) и
+корзинами пользователей, затем меряет запросы бота сначала без индексов
+горячих путей, затем с ними:
+    корзина пользователя (load_summary), отчет по корзинам пользователя,
+    страница заказов пользователя, страница заказов за день, выручка за день.
+
+Запуск:
+    python -m benchmarks.indexes --orders 1000000 --users 100000
+"""
+from benchmarks import env  # noqa: F401  окружение задается до импорта модулей бота
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert, text
+
+from cart_service import load_summary
+from database import engine, async_session, Cart, CartItem, Order, OrderItem
+from init_db import init_db
+from reports import ReportFilter, build_page, revenue
+
+# Индексы, которые сравниваются; уникальность carts.user_id - ограничение, а не индекс
+INDEXED_TABLES = (Order.__table__, OrderItem.__table__, CartItem.__table__)
+FIRST_DAY = date(2024, 1, 1)
+CHUNK = 50000
+
+
+def seed(orders, users, days):
+    rng = random.Random(1)
+    with engine.begin() as conn:
+        for start in range(0, orders, CHUNK):
+            count = min(CHUNK, orders - start)
+            rows = [
+                {
+                    'user_id': rng.randint(1, users),
+                    'status': 'completed',
+                    'total': 42.0,
+                    'created_at': datetime.combine(FIRST_DAY, datetime.min.time())
+                    + timedelta(seconds=(start + i) * days * 86400 // orders),
+                }
+                for i in range(count)
+            ]
+            conn.execute(insert(Order), rows)
+            first_id = conn.execute(text("SELECT MAX(id) FROM orders")).scalar() - count + 1
+            conn.execute(insert(OrderItem), [
+                {'order_id': first_id + i, 'product_id': 1, 'name': "Пирог", 'quantity': 1, 'unit_price': 42.0, 'discount': 0.0}
+                for i in range(count)
+            ])
+        now = datetime.now()
+        conn.execute(insert(Cart), [
+            {'user_id': user_id, 'created_at': now, 'updated_at': now, 'version': 1} for user_id in range(1, users + 1)
+        ])
+        cart_ids = dict(conn.execute(text("SELECT user_id, id FROM carts")).all())
+        for start in range(1, users + 1, CHUNK):
+            conn.execute(insert(CartItem), [
+                {'cart_id': cart_ids[user_id], 'product_id': product_id, 'quantity': 1, 'created_at': now}
+                for user_id in range(start, min(start + CHUNK, users + 1))
+                for product_id in (1, 2, 3)
+            ])
+
+
+def set_indexes(enabled):
+    with engine.begin() as conn:
+        for table in INDEXED_TABLES:
+            for index in table.indexes:
+                if enabled:
+                    index.create(conn, checkfirst=True)
+                else:
+                    index.drop(conn, checkfirst=True)
+        # Статистика планировщика должна соответствовать набору индексов
+        conn.execute(text("ANALYZE"))
+
+
+async def _summary(user_id):
+    async with async_session() as session:
+        await load_summary(session, user_id)
+
+
+def cases(users, days):
+    rng = random.Random(2)
+
+    def user():
+        return rng.randint(1, users)
+
+    def day():
+        return FIRST_DAY + timedelta(days=rng.randrange(days))
+
+    return [
+        ("Корзина пользователя", lambda: _summary(user())),
+        ("Отчет: корзина пользователя", lambda: build_page('c', ReportFilter(user_id=user()))),
+        ("Отчет: заказы пользователя", lambda: build_page('o', ReportFilter(user_id=user()))),
+        ("Отчет: заказы за день", lambda: build_page('o', ReportFilter(date_from=(d := day()), date_to=d))),
+        ("Выручка за день", lambda: revenue(ReportFilter(date_from=(d := day()), date_to=d))),
+    ]
+
+
+async def measure(users, days, samples):
+    results = {}
+    for name, make in cases(users, days):
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            await make()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = (statistics.median(timings), statistics.quantiles(timings, n=20)[-1])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк индексов на большой базе')
+    parser.add_argument('--orders', type=int, default=1000000, help='Оформленных заказов')
+    parser.add_argument('--users', type=int, default=100000, help='Пользователей с корзинами')
+    parser.add_argument('--days', type=int, default=365, help='За сколько дней распределены заказы')
+    parser.add_argument('--samples', type=int, default=50, help='Замеров каждого запроса')
+    args = parser.parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    seed(args.orders, args.users, args.days)
+    print(f"База заполнена за {time.perf_counter() - started:.1f} с: {args.orders} заказов, {args.users} корзин")
+
+    set_indexes(False)
+    before = asyncio.run(measure(args.users, args.days, args.samples))
+    set_indexes(True)
+    after = asyncio.run(measure(args.users, args.days, args.samples))
+
+    print(f"\n{'Запрос':<30} {'без индексов, мс (p50/p95)':>28} {'с индексами, мс (p50/p95)':>28}")
+    for name in before:
+        print(f"{name:<30} {before[name][0]:>18.2f} / {before[name][1]:<7.2f} {after[name][0]:>18.2f} / {after[name][1]:<7.2f}")
+
+
+if __name__ == "__main__":
+    main()
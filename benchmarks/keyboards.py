@@ -0,0 +1,79 @@
+"""Клавиатуры из реестра против сборки при каждом нажатии.
+
+Для каждой клавиатуры обработчиков меряется время вызова (timeit) и память,
+выделяемая за один вызов (пик tracemalloc). "Сборка" - та же функция с
+реестром, который ничего не хранит, и прямой вызов построителей статических
+клавиатур, как было до кэширования.
+
+Запуск:
+    python -m benchmarks.keyboards --number 20000
+"""
+from benchmarks import env  # noqa: F401  окружение задается до импорта модулей бота
+
+import argparse
+import asyncio
+import timeit
+import tracemalloc
+
+import keyboards
+from catalog import catalog
+from init_db import init_db
+
+
+class NoCacheRegistry(keyboards.KeyboardRegistry):
+    """Реестр, собирающий клавиатуру при каждом обращении"""
+
+    def get(self, key, build):
+        return build()
+
+
+def _allocated(func, samples=200):
+    """Средний пик памяти, выделяемой за один вызов, в байтах"""
+    func()
+    total = 0
+    tracemalloc.start()
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        func()
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк кэширования клавиатур')
+    parser.add_argument('--number', type=int, default=20000, help='Вызовов каждой клавиатуры')
+    args = parser.parse_args()
+
+    init_db()
+    asyncio.run(catalog.reload())
+    product = catalog.by_category('sweet')[0]
+
+    cases = [
+        ("Главное меню", lambda: keyboards.get_main_keyboard(False), lambda: keyboards._build_main_keyboard(False)),
+        ("Категории", keyboards.get_category_keyboard, keyboards._build_category_keyboard),
+        ("Товары категории", lambda: keyboards.get_products_keyboard('sweet'), None),
+        ("Товар", lambda: keyboards.get_product_keyboard(product), None),
+        ("Действия корзины", lambda: keyboards.get_cart_actions_keyboard('sweet'), None),
+    ]
+    cached_registry = keyboards.registry
+    uncached_registry = NoCacheRegistry()
+
+    print(f"{'Клавиатура':<18} {'кэш, мкс':>10} {'сборка, мкс':>12} {'кэш, Б':>8} {'сборка, Б':>10}")
+    for name, get, build in cases:
+        keyboards.registry = cached_registry
+        cached_time = timeit.timeit(get, number=args.number) / args.number * 1e6
+        cached_memory = _allocated(get)
+        if build is None:
+            # Та же функция, но реестр собирает клавиатуру заново
+            keyboards.registry = uncached_registry
+            build = get
+        built_time = timeit.timeit(build, number=args.number) / args.number * 1e6
+        built_memory = _allocated(build)
+        keyboards.registry = cached_registry
+        print(f"{name:<18} {cached_time:>10.2f} {built_time:>12.2f} {cached_memory:>8.0f} {built_memory:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
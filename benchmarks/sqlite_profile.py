@@ -0,0 +1,145 @@
+"""Пропускная способность оформления заказов с профилем SQLite и без него.
+
+N оформлений заказа выполняются в C одновременных задачах, пока R задач
+читают корзины других пользователей, как обработчики просмотра. Каждый
+вариант запускается в отдельном процессе со своей базой: профиль
+применяется при создании движка (SQLITE_TUNING).
+
+Запуск:
+    python -m benchmarks.sqlite_profile --checkouts 2000 --concurrency 50 --readers 20
+"""
+from benchmarks import env  # noqa: F401  окружение задается до импорта модулей бота
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from sqlalchemy import insert
+
+from cart_service import add_item, claim_checkout, load_summary, place_order
+from database import engine, async_session, Cart
+from init_db import init_db
+
+
+def seed(users):
+    # Корзины создаются заранее, в замер попадает только оформление
+    with engine.begin() as conn:
+        conn.execute(insert(Cart), [{'user_id': user_id, 'version': 0} for user_id in range(1, users + 1)])
+
+
+async def fill_carts(users):
+    for start in range(1, users + 1, 500):
+        async with async_session() as session:
+            for user_id in range(start, min(start + 500, users + 1)):
+                await add_item(session, user_id, 1)
+                await add_item(session, user_id, 2, quantity=2)
+            await session.commit()
+
+
+async def checkout(user_id):
+    async with async_session() as session:
+        checkout_id, _ = await claim_checkout(session, user_id, f"bench:{user_id}")
+        await place_order(session, user_id, checkout_id)
+        await session.commit()
+
+
+def describe(error):
+    # У ошибок SQLAlchemy текст драйвера, например "database is locked", лежит в orig
+    return str(getattr(error, 'orig', error))
+
+
+async def run(checkouts, concurrency, readers):
+    await fill_carts(checkouts)
+    queue = asyncio.Queue()
+    for user_id in range(1, checkouts + 1):
+        queue.put_nowait(user_id)
+    errors = 0
+    error_messages = set()
+    reads = 0
+    latencies = []
+    done = asyncio.Event()
+
+    async def writer():
+        nonlocal errors
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                await checkout(user_id)
+            except Exception as e:
+                errors += 1
+                error_messages.add(describe(e))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    async def reader(offset):
+        nonlocal errors, reads
+        user_id = offset
+        while not done.is_set():
+            try:
+                async with async_session() as session:
+                    await load_summary(session, user_id % checkouts + 1)
+                reads += 1
+            except Exception as e:
+                errors += 1
+                error_messages.add(describe(e))
+            user_id += readers
+
+    reader_tasks = [asyncio.create_task(reader(i)) for i in range(readers)]
+    started = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+    done.set()
+    await asyncio.gather(*reader_tasks)
+    return {
+        'checkouts_per_sec': round(checkouts / duration, 1),
+        'reads_per_sec': round(reads / duration, 1),
+        'checkout_p99_ms': round(statistics.quantiles(latencies, n=100)[98], 1),
+        'errors': errors,
+        'error_messages': sorted(error_messages),
+        'duration_s': round(duration, 2),
+    }
+
+
+def child(args):
+    init_db()
+    seed(args.checkouts)
+    result = asyncio.run(run(args.checkouts, args.concurrency, args.readers))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк профиля SQLite под конкурентной нагрузкой')
+    parser.add_argument('--checkouts', type=int, default=2000, help='Оформлений заказа')
+    parser.add_argument('--concurrency', type=int, default=50, help='Одновременных оформлений')
+    parser.add_argument('--readers', type=int, default=20, help='Одновременных читателей корзин')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    results = {}
+    for name, tuning in (("без профиля", "0"), ("с профилем", "1")):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.sqlite_profile", "--child",
+             "--checkouts", str(args.checkouts), "--concurrency", str(args.concurrency), "--readers", str(args.readers)],
+            env=dict(os.environ, SQLITE_TUNING=tuning), capture_output=True, text=True, check=True,
+        ).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'':<14} {'оформлений/с':>13} {'p99, мс':>9} {'чтений/с':>10} {'ошибок':>7}")
+    for name, result in results.items():
+        print(
+            f"{name:<14} {result['checkouts_per_sec']:>13} {result['checkout_p99_ms']:>9}"
+            f" {result['reads_per_sec']:>10} {result['errors']:>7}"
+        )
+        for message in result['error_messages']:
+            print(f"  {name}: {message}")
+
+
+if __name__ == "__main__":
+    main()
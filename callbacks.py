@@ -0,0 +1,55 @@
+from typing import Optional
+from aiogram.filters.callback_data import CallbackData
+
+
+# Фабрики callback_data для inline-кнопок. Префиксы должны быть уникальными:
+# по ним маршрутизатор находит обработчик нажатия.
+
+class CategoryCallback(CallbackData, prefix="cat"):
+    category: str
+
+
+class ProductsCallback(CallbackData, prefix="prods"):
+    """Возврат к списку товаров категории"""
+    category: str
+
+
+class ProductCallback(CallbackData, prefix="prod"):
+    product_id: int
+
+
+class AddCallback(CallbackData, prefix="add"):
+    product_id: int
+
+
+class CartQuantityCallback(CallbackData, prefix="cqty"):
+    """Кнопки −/+ в корзине: изменение количества товара на delta"""
+    product_id: int
+    delta: int
+
+
+class SetQuantityCallback(CallbackData, prefix="setq"):
+    """Ввод количества товара в корзине числом"""
+    product_id: int
+
+
+class CategoriesCallback(CallbackData, prefix="categories"):
+    """Возврат к выбору категории"""
+
+
+class CheckoutCallback(CallbackData, prefix="checkout"):
+    """Оформление заказа"""
+
+
+class ClearCartCallback(CallbackData, prefix="clear_cart"):
+    """Очистка корзины"""
+
+
+class ReportCallback(CallbackData, prefix="rep"):
+    """Страница отчета администратора: вид, направление, курсор и фильтр"""
+    kind: str
+    direction: str
+    cursor: int
+    user_id: Optional[int] = None
+    date_from: Optional[str] = None  # ГГГГММДД
+    date_to: Optional[str] = None  # ГГГГММДД
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from aiogram.exceptions import TelegramBadRequest
+
+import config
+from cart_service import cart_summaries, load_summary, set_quantities, format_lines
+from database import async_session
+from keyboards import get_cart_actions_keyboard, get_category_keyboard, MAX_QUANTITY
+from navigation import Screen, render, shown_screen
+from outbox import outbox
+
+
+def cart_screen(summary, category=None):
+    """Экран корзины с кнопками −/+ для позиций"""
+    lines = summary.lines()
+    if not lines:
+        return Screen("В корзине ничего нет", get_category_keyboard())
+    items_text, _ = format_lines(lines, bullet="• ")
+    text = "🛒 Ваша корзина:\n\n" + items_text
+    text += f"\n💰 Итого к оплате: {summary.total:.2f} руб."
+    # Ключ с версией корзины: по нему видно, что в сообщении показана корзина
+    return Screen(text, get_cart_actions_keyboard(category, summary.quantities), key=f"cart:{summary.version}")
+
+
+class PendingEdit:
+    def __init__(self):
+        self.quantities = {}
+        self.callback = None
+        self.state = None
+        self.category = None
+        self.deadline = 0.0
+        self.markup_dirty = False
+
+
+class CartEditor:
+    """Изменение количества товаров кнопками −/+ с отложенной записью.
+
+    Нажатие сразу меняет кнопки сообщения корзины одним
+    edit_message_reply_markup, а новое количество копится в памяти. Через
+    delay секунд после последнего нажатия все изменения пользователя
+    записываются одной транзакцией, и сообщение перерисовывается с новой
+    суммой. Пока правка кнопок ждет очереди отправки, новые нажатия не
+    ставят в очередь свои правки, а обновляют следующую.
+
+    Кнопка передает изменение (+1/−1), а не итоговое количество: кнопки
+    нарисованы до предыдущих нажатий, и быстрые нажатия на одну кнопку
+    несли бы одно и то же значение.
+    """
+
+    def __init__(self, delay=None):
+        self.delay = delay or config.CART_EDIT_DELAY
+        self._pending = {}
+        # Изменения, которые сейчас записываются: сводка их еще не учитывает
+        self._writing = {}
+        self._tasks = {}
+        self._showing = set()
+
+    async def _quantity(self, user_id, product_id):
+        """Количество товара с учетом еще не записанных изменений"""
+        summary = cart_summaries.get(user_id)
+        if summary is None:
+            async with async_session() as session:
+                summary = await load_summary(session, user_id)
+        # Сводка не учитывает изменения, которые ждут записи или записываются
+        pending = self._pending.get(user_id)
+        if pending is not None and product_id in pending.quantities:
+            return pending.quantities[product_id]
+        writing = self._writing.get(user_id, {})
+        if product_id in writing:
+            return writing[product_id]
+        return summary.quantities.get(product_id, 0)
+
+    async def set(self, user_id, product_id, delta, callback, state, category=None):
+        """Меняет количество на delta и откладывает запись до паузы в нажатиях"""
+        quantity = min(max(await self._quantity(user_id, product_id) + delta, 0), MAX_QUANTITY)
+        pending = self._pending.get(user_id)
+        if pending is None:
+            pending = self._pending[user_id] = PendingEdit()
+        pending.quantities[product_id] = quantity
+        pending.callback = callback
+        pending.state = state
+        pending.category = category
+        pending.deadline = time.monotonic() + self.delay
+        if user_id not in self._tasks:
+            self._tasks[user_id] = asyncio.create_task(self._flush_later(user_id))
+
+    async def show(self, user_id):
+        """Обновляет кнопки корзины; одновременно в очереди не больше одной правки"""
+        pending = self._pending.get(user_id)
+        if pending is None:
+            return
+        pending.markup_dirty = True
+        if user_id in self._showing:
+            return
+        self._showing.add(user_id)
+        try:
+            # После записи сообщение перерисует _flush_later, правки кнопок больше не нужны
+            while pending.markup_dirty and self._pending.get(user_id) is pending:
+                pending.markup_dirty = False
+                summary = cart_summaries.get(user_id)
+                if summary is None:
+                    async with async_session() as session:
+                        summary = await load_summary(session, user_id)
+                quantities = {**summary.quantities, **self._writing.get(user_id, {}), **pending.quantities}
+                keyboard = get_cart_actions_keyboard(pending.category, quantities)
+                try:
+                    await outbox.send(pending.callback.message.edit_reply_markup(reply_markup=keyboard))
+                except TelegramBadRequest as e:
+                    if "message is not modified" not in str(e):
+                        logging.warning(f"Не удалось обновить кнопки корзины: {e}")
+        finally:
+            self._showing.discard(user_id)
+
+    async def write(self, user_id, quantities=None):
+        """Сразу записывает ожидающие изменения пользователя вместе с quantities.
+
+        Возвращает сводку корзины или None, если записывать нечего.
+        """
+        pending = self._pending.pop(user_id, None)
+        changes = dict(pending.quantities) if pending else {}
+        changes.update(quantities or {})
+        if not changes:
+            return None
+        self._writing[user_id] = changes
+        try:
+            async with async_session() as session:
+                version = await set_quantities(session, user_id, changes)
+                await session.commit()
+                summary = cart_summaries.apply(user_id, version, changes)
+                if summary is None:
+                    summary = await load_summary(session, user_id)
+        finally:
+            if self._writing.get(user_id) is changes:
+                del self._writing[user_id]
+        return summary
+
+    def discard(self, user_id):
+        """Отменяет незаписанные изменения, например при очистке корзины"""
+        self._pending.pop(user_id, None)
+
+    async def _flush(self, user_id):
+        pending = self._pending.get(user_id)
+        summary = await self.write(user_id)
+        if summary is None:
+            return
+        # Если пользователь уже открыл в этом сообщении другой экран, не перерисовываем его
+        shown = await shown_screen(pending.state)
+        message = pending.callback.message
+        if shown and shown.message_id == message.message_id and not (shown.key or "").startswith("cart:"):
+            return
+        await render(pending.callback, cart_screen(summary, pending.category), pending.state)
+
+    async def _flush_later(self, user_id):
+        try:
+            while True:
+                pending = self._pending.get(user_id)
+                if pending is None:
+                    return
+                wait = pending.deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            await self._flush(user_id)
+        except Exception as e:
+            logging.error(f"Ошибка при записи изменений корзины: {e}")
+        finally:
+            self._tasks.pop(user_id, None)
+            # Нажатия во время записи ждут следующей записи
+            if user_id in self._pending:
+                self._tasks[user_id] = asyncio.create_task(self._flush_later(user_id))
+
+    async def stop(self):
+        """Дожидается записи всех накопленных изменений.
+
+        Задачи записи не отменяются: отмена посреди транзакции потеряла бы
+        изменения. Ожидание паузы в нажатиях сокращается до нуля.
+        """
+        for pending in self._pending.values():
+            pending.deadline = 0.0
+        # Задача, заставшая новые нажатия, запускает следующую
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+cart_editor = CartEditor()
@@ -0,0 +1,350 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import select, delete, insert, update, case
+
+import config
+from catalog import catalog, format_price
+from database import dialect_insert, Product, Checkout, Cart, CartItem, Order, OrderItem, SalesDaily, DemandHourly
+
+
+@dataclass(frozen=True)
+class CartLine:
+    product_id: int
+    name: str
+    quantity: int
+    unit_price: float
+    price_text: str
+    discount: float
+    category: str = None
+    is_special: bool = False
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.quantity
+
+
+def _make_line(product, quantity):
+    discount = product.discount or 0.0
+    unit_price, _ = format_price(product.price, discount)
+    return CartLine(
+        product_id=product.id,
+        name=product.name,
+        quantity=quantity,
+        unit_price=unit_price,
+        price_text=f"{unit_price:.2f} руб.",
+        discount=discount,
+        category=product.category,
+        is_special=bool(product.is_special),
+    )
+
+
+class CartSummary:
+    """Количества товаров в корзине и сумма по текущим ценам каталога"""
+
+    def __init__(self, version, quantities):
+        self.version = version
+        # product_id -> количество в порядке добавления
+        self.quantities = quantities
+        self._reprice()
+
+    def _reprice(self):
+        self.catalog_version = catalog.version
+        self.total = 0.0
+        for product_id, quantity in self.quantities.items():
+            item = catalog.get(product_id)
+            if item:
+                self.total += item.display_price * quantity
+
+    def _check_prices(self):
+        # После смены акции сумма пересчитывается по новым ценам один раз
+        if self.catalog_version != catalog.version:
+            self._reprice()
+
+    def set_quantity(self, version, product_id, quantity):
+        self._check_prices()
+        previous = self.quantities.get(product_id, 0)
+        if quantity > 0:
+            self.quantities[product_id] = quantity
+        else:
+            self.quantities.pop(product_id, None)
+            quantity = 0
+        item = catalog.get(product_id)
+        if item:
+            self.total += item.display_price * (quantity - previous)
+        self.version = version
+
+    def lines(self):
+        self._check_prices()
+        lines = []
+        for product_id, quantity in self.quantities.items():
+            item = catalog.get(product_id)
+            if item:
+                lines.append(_make_line(item, quantity))
+        return lines
+
+
+class CartSummaryCache:
+    """Сводки корзин пользователей в памяти процесса.
+
+    Каждое изменение корзины увеличивает carts.version. Изменение одной
+    позиции применяется к сводке без чтения корзины, если его версия ровно
+    на единицу больше версии сводки; иначе корзину меняли в другом процессе
+    или сводки нет, и она перечитывается из базы. Сумма пересчитывается по
+    каталогу только после смены акции.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or config.CART_SUMMARY_CACHE_SIZE
+        self._summaries = OrderedDict()
+
+    def _put(self, user_id, summary):
+        self._summaries[user_id] = summary
+        self._summaries.move_to_end(user_id)
+        while len(self._summaries) > self.max_size:
+            self._summaries.popitem(last=False)
+
+    def get(self, user_id):
+        summary = self._summaries.get(user_id)
+        if summary is not None:
+            self._summaries.move_to_end(user_id)
+        return summary
+
+    def apply(self, user_id, version, quantities):
+        """Применяет новые количества товаров (product_id -> количество).
+
+        Возвращает обновленную сводку или None, если ее нужно перечитать.
+        """
+        summary = self._summaries.get(user_id)
+        if summary is None or version > summary.version + 1:
+            self._summaries.pop(user_id, None)
+            return None
+        # Сводка с версией не меньше уже учитывает это изменение
+        if version == summary.version + 1:
+            for product_id, quantity in quantities.items():
+                summary.set_quantity(version, product_id, quantity)
+        self._summaries.move_to_end(user_id)
+        return summary
+
+    def store(self, user_id, summary):
+        current = self._summaries.get(user_id)
+        if current is None or current.version <= summary.version:
+            self._put(user_id, summary)
+
+    def forget(self, user_id):
+        self._summaries.pop(user_id, None)
+
+
+cart_summaries = CartSummaryCache()
+
+
+async def load_summary(session, user_id):
+    """Читает версию и позиции корзины одним запросом и обновляет сводку в памяти"""
+    result = await session.execute(
+        select(Cart.version, CartItem.product_id, CartItem.quantity)
+        .outerjoin(CartItem, CartItem.cart_id == Cart.id)
+        .where(Cart.user_id == user_id)
+        .order_by(CartItem.id)
+    )
+    rows = result.all()
+    version = rows[0][0] if rows else 0
+    summary = CartSummary(version, {product_id: quantity for _, product_id, quantity in rows if product_id is not None})
+    cart_summaries.store(user_id, summary)
+    return summary
+
+
+async def _touch_cart(session, user_id, now):
+    """Создает корзину или увеличивает версию существующей; возвращает (id, версия)"""
+    stmt = dialect_insert(Cart).values(user_id=user_id, created_at=now, updated_at=now, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Cart.user_id],
+        set_={'updated_at': now, 'version': Cart.version + 1},
+    )
+    return (await session.execute(stmt.returning(Cart.id, Cart.version))).one()
+
+
+async def add_item(session, user_id, product_id, quantity=1):
+    """Увеличивает количество товара в корзине одним INSERT ... ON CONFLICT DO UPDATE.
+
+    Одновременные нажатия не теряют приращения: конфликт по уникальному
+    индексу корзины разрешается в базе, без чтения строки в Python.
+    Возвращает (новая версия корзины, новое количество товара).
+    """
+    now = datetime.now()
+    cart_id, version = await _touch_cart(session, user_id, now)
+
+    stmt = dialect_insert(CartItem).values(
+        cart_id=cart_id,
+        product_id=product_id,
+        quantity=quantity,
+        created_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItem.cart_id, CartItem.product_id],
+        set_={'quantity': CartItem.quantity + stmt.excluded.quantity},
+    )
+    new_quantity = (await session.execute(stmt.returning(CartItem.quantity))).scalar()
+    return version, new_quantity
+
+
+async def set_quantities(session, user_id, quantities):
+    """Устанавливает количества товаров (product_id -> количество, 0 - убрать).
+
+    Все изменения применяются с одним увеличением версии корзины: позиции
+    с количеством записываются одним upsert, нулевые удаляются одним DELETE.
+    Возвращает новую версию корзины.
+    """
+    now = datetime.now()
+    cart_id, version = await _touch_cart(session, user_id, now)
+    rows = [
+        {'cart_id': cart_id, 'product_id': product_id, 'quantity': quantity, 'created_at': now}
+        for product_id, quantity in quantities.items() if quantity > 0
+    ]
+    if rows:
+        stmt = dialect_insert(CartItem).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.cart_id, CartItem.product_id],
+            set_={'quantity': stmt.excluded.quantity},
+        )
+        await session.execute(stmt)
+    removed = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+    if removed:
+        await session.execute(
+            delete(CartItem).where(CartItem.cart_id == cart_id, CartItem.product_id.in_(removed))
+        )
+    return version
+
+
+async def _bump_cart(session, user_id):
+    """Увеличивает версию корзины; возвращает (id, версия) или None, если корзины нет"""
+    result = await session.execute(
+        update(Cart)
+        .where(Cart.user_id == user_id)
+        .values(version=Cart.version + 1, updated_at=datetime.now())
+        .returning(Cart.id, Cart.version)
+    )
+    return result.one_or_none()
+
+
+async def clear_cart(session, user_id):
+    """Очищает корзину и возвращает ее новую версию (None, если корзины нет)"""
+    cart = await _bump_cart(session, user_id)
+    if cart is None:
+        return None
+    await session.execute(delete(CartItem).where(CartItem.cart_id == cart.id))
+    return cart.version
+
+
+async def claim_checkout(session, user_id, key):
+    """Регистрирует оформление заказа по ключу идемпотентности.
+
+    Возвращает (id оформления, None) для нового оформления или
+    (id, текст подтверждения), если с этим ключом заказ уже оформлен.
+    """
+    result = await session.execute(
+        dialect_insert(Checkout)
+        .values(idempotency_key=key, user_id=user_id, created_at=datetime.now())
+        .on_conflict_do_nothing(index_elements=[Checkout.idempotency_key])
+        .returning(Checkout.id)
+    )
+    checkout_id = result.scalar()
+    if checkout_id is not None:
+        return checkout_id, None
+    result = await session.execute(
+        select(Checkout.id, Checkout.text).where(Checkout.idempotency_key == key)
+    )
+    return tuple(result.one())
+
+
+async def place_order(session, user_id, checkout_id):
+    """Оформляет корзину в заказ и возвращает (id заказа, позиции, сумма).
+
+    Позиции забираются из корзины одним DELETE ... RETURNING: если корзину
+    одновременно оформляет другая реплика, каждая позиция достанется только
+    одной из них. Цены и скидки фиксируются в позициях заказа.
+    Для пустой корзины возвращает (None, [], 0).
+    """
+    cart = await _bump_cart(session, user_id)
+    if cart is None:
+        return None, [], 0
+    result = await session.execute(
+        delete(CartItem)
+        .where(CartItem.cart_id == cart.id)
+        .returning(CartItem.product_id, CartItem.quantity)
+    )
+    quantities = dict(result.all())
+    if not quantities:
+        return None, [], 0
+
+    result = await session.execute(select(Product).where(Product.id.in_(quantities)).order_by(Product.id))
+    lines = [_make_line(product, quantities[product.id]) for product in result.scalars()]
+    total = sum(line.line_total for line in lines)
+
+    now = datetime.now()
+    order_id = (await session.execute(
+        insert(Order)
+        .values(user_id=user_id, status='completed', total=total, created_at=now, checkout_id=checkout_id)
+        .returning(Order.id)
+    )).scalar()
+    await session.execute(insert(OrderItem), [
+        {
+            'order_id': order_id,
+            'product_id': line.product_id,
+            'name': line.name,
+            'quantity': line.quantity,
+            'unit_price': line.unit_price,
+            'discount': line.discount,
+        }
+        for line in lines
+    ])
+    await _update_sales(session, now, lines)
+    return order_id, lines, total
+
+
+async def _update_sales(session, now, lines):
+    """Добавляет позиции заказа в сводки продаж (по одному upsert на таблицу)"""
+    day, hour = now.date(), now.hour
+    stmt = dialect_insert(SalesDaily).values([
+        {
+            'day': day,
+            'product_id': line.product_id,
+            'promo': line.is_special,
+            'category': line.category,
+            'units': line.quantity,
+            'revenue': line.line_total,
+            'hours': 1,
+            'last_hour': hour,
+        }
+        for line in lines
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SalesDaily.day, SalesDaily.product_id, SalesDaily.promo],
+        set_={
+            'units': SalesDaily.units + stmt.excluded.units,
+            'revenue': SalesDaily.revenue + stmt.excluded.revenue,
+            # Заказы приходят по времени, поэтому новый час продаж - это час больше последнего
+            'hours': SalesDaily.hours + case((SalesDaily.last_hour < stmt.excluded.last_hour, 1), else_=0),
+            'last_hour': stmt.excluded.last_hour,
+        },
+    )
+    await session.execute(stmt)
+
+    stmt = dialect_insert(DemandHourly).values(day=day, hour=hour, units=sum(line.quantity for line in lines))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DemandHourly.day, DemandHourly.hour],
+        set_={'units': DemandHourly.units + stmt.excluded.units},
+    )
+    await session.execute(stmt)
+
+
+def format_lines(lines, bullet=""):
+    """Формирует текст позиций корзины и итоговую сумму за один проход"""
+    text = ""
+    total = 0
+    for line in lines:
+        text += f"{bullet}{line.name} - {line.quantity} шт. x {line.price_text}"
+        if line.discount > 0:
+            text += f" (-{int(line.discount * 100)}%)"
+        text += "\n"
+        total += line.line_total
+    return text, total
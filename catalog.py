@@ -0,0 +1,145 @@
+import asyncio
+from dataclasses import dataclass, replace
+from sqlalchemy import select, update
+
+from database import async_session, Product
+
+
+def format_price(price, discount):
+    """Возвращает цену с учетом скидки и текст для отображения"""
+    display_price = price * (1 - discount) if discount > 0 else price
+    price_text = f"{display_price:.2f} руб."
+    if discount > 0:
+        price_text += f" (-{int(discount * 100)}%)"
+    return display_price, price_text
+
+
+@dataclass(frozen=True)
+class CatalogItem:
+    id: int
+    name: str
+    description: str
+    price: float
+    category: str
+    image_url: str
+    is_special: int
+    discount: float
+    display_price: float
+    price_text: str
+    image_file_id: str = None
+
+    @property
+    def photo(self):
+        """file_id уже загруженного фото или, если его нет, адрес картинки"""
+        return self.image_file_id or self.image_url
+
+
+class Catalog:
+    """Кэш каталога в памяти процесса.
+
+    Меню читается только отсюда, база данных нужна лишь при перестроении
+    кэша после смены акции или изменения товаров.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._state = ({}, {}, ())
+        self._lock = asyncio.Lock()
+
+    async def reload(self):
+        """Перечитывает товары из базы и атомарно подменяет кэш"""
+        async with self._lock:
+            async with async_session() as session:
+                result = await session.execute(select(Product).order_by(Product.id))
+                products = result.scalars().all()
+
+            items = []
+            for product in products:
+                discount = product.discount or 0.0
+                display_price, price_text = format_price(product.price, discount)
+                item = CatalogItem(
+                    id=product.id,
+                    name=product.name,
+                    description=product.description,
+                    price=product.price,
+                    category=product.category,
+                    image_url=product.image_url,
+                    is_special=product.is_special,
+                    discount=discount,
+                    display_price=display_price,
+                    price_text=price_text,
+                    # file_id действителен, только пока не сменился адрес картинки
+                    image_file_id=product.image_file_id if product.image_file_url == product.image_url else None,
+                )
+                items.append(item)
+
+            self._set_items(items)
+            self.version += 1
+
+    def _set_items(self, items):
+        by_id = {}
+        by_category = {}
+        specials = []
+        for item in items:
+            by_id[item.id] = item
+            by_category.setdefault(item.category, []).append(item)
+            if item.is_special:
+                specials.append(item)
+
+        by_category = {category: tuple(items) for category, items in by_category.items()}
+        # Одно присваивание: читатели видят либо старый, либо новый каталог целиком
+        self._state = (by_id, by_category, tuple(specials))
+
+    async def set_discounts(self, discounts):
+        """Меняет скидки отдельных товаров (product_id -> скидка) без чтения базы"""
+        async with self._lock:
+            items = []
+            for item in self.all():
+                discount = discounts.get(item.id)
+                if discount is not None:
+                    display_price, price_text = format_price(item.price, discount)
+                    item = replace(
+                        item,
+                        discount=discount,
+                        is_special=int(discount > 0),
+                        display_price=display_price,
+                        price_text=price_text,
+                    )
+                items.append(item)
+            self._set_items(items)
+            self.version += 1
+
+    async def set_photo_file_id(self, product_id, file_id):
+        """Запоминает file_id загруженного фото товара в базе и в кэше"""
+        async with self._lock:
+            item = self.get(product_id)
+            # Одновременные первые показы товара загружают фото несколько раз;
+            # сохраняется первый file_id, остальные не пишут в базу
+            if item is None or item.image_file_id is not None:
+                return
+            async with async_session() as session:
+                await session.execute(
+                    update(Product)
+                    .where(Product.id == product_id)
+                    .values(image_file_id=file_id, image_file_url=item.image_url)
+                )
+                await session.commit()
+            # Цены и клавиатуры не меняются, поэтому версия каталога остается прежней
+            items = [replace(item, image_file_id=file_id) if item.id == product_id else item for item in self.all()]
+            self._set_items(items)
+
+    def all(self):
+        return list(self._state[0].values())
+
+    def get(self, product_id):
+        return self._state[0].get(product_id)
+
+    def by_category(self, category):
+        return self._state[1].get(category, ())
+
+    def specials(self):
+        """Товары, на которые сейчас действует акция"""
+        return self._state[2]
+
+
+catalog = Catalog()
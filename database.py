@@ -0,0 +1,262 @@
+from datetime import datetime
+from sqlalchemy import create_engine, event, make_url, update, Column, Integer, BigInteger, String, Text, Float, Date, DateTime, Boolean, Index
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+import config
+
+# PRAGMA-команды собираются один раз и выполняются при каждом новом соединении.
+# busy_timeout идет первым: смене journal_mode нужна блокировка базы, и без
+# таймаута соединение, открытое во время чужой записи, сразу получит "database is locked"
+SQLITE_PRAGMAS = [
+    f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT}",
+    f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}",
+    f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}",
+    f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}",
+    f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE}",
+]
+
+
+def _apply_sqlite_profile(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def _setup_engine(sync_engine):
+    if config.SQLITE_TUNING and sync_engine.dialect.name == 'sqlite':
+        event.listen(sync_engine, "connect", _apply_sqlite_profile)
+
+
+# Синхронные драйверы для консольных скриптов вместо асинхронных
+SYNC_DRIVERS = {
+    'aiosqlite': 'pysqlite',
+    'asyncpg': 'psycopg2',
+}
+
+
+def get_sync_url(url):
+    url = make_url(url)
+    driver = SYNC_DRIVERS.get(url.get_driver_name(), url.get_driver_name())
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}")
+
+
+def _engine_options(url):
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        # SQLite пропускает одного писателя за раз: с несколькими соединениями
+        # транзакции ждут блокировку записи внутри busy_timeout и получают
+        # "database is locked", а с одним стоят в очереди пула по порядку
+        return dict(pool_size=1, max_overflow=0, pool_timeout=config.DB_POOL_TIMEOUT)
+    options = dict(
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+    )
+    if backend == 'postgresql':
+        # Соединения через балансировщик могут обрываться, проверяем их перед выдачей
+        options.update(pool_pre_ping=True, pool_recycle=config.DB_POOL_RECYCLE)
+    return options
+
+
+DATABASE_URL = config.DATABASE_URL
+DATABASE_SYNC_URL = config.DATABASE_SYNC_URL or get_sync_url(DATABASE_URL)
+
+# Синхронный движок используется только консольными скриптами (init_db, admin_manager)
+engine = create_engine(DATABASE_SYNC_URL, **_engine_options(DATABASE_SYNC_URL))
+_setup_engine(engine)
+Session = sessionmaker(bind=engine)
+
+# Асинхронный движок для обработчиков бота, чтобы запросы к базе не блокировали event loop
+async_engine = create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+_setup_engine(async_engine.sync_engine)
+async_session = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+def dialect_insert(table):
+    """INSERT с поддержкой ON CONFLICT для диалекта асинхронного движка"""
+    if async_engine.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+Base = declarative_base()
+
+
+# Модели данных
+class Product(Base):
+    __tablename__ = 'products'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    description = Column(String)
+    price = Column(Float)
+    category = Column(String, index=True)
+    image_url = Column(String)
+    is_special = Column(Integer, default=0)
+    discount = Column(Float, default=0.0)  # Добавляем поле для скидки
+    # file_id фото, загруженного в Telegram, и адрес картинки, для которого он получен
+    image_file_id = Column(String, nullable=True)
+    image_file_url = Column(String, nullable=True)
+
+
+class Cart(Base):
+    """Корзина пользователя; одна на пользователя"""
+    __tablename__ = 'carts'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, unique=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now)
+    # Увеличивается при каждом изменении корзины; по ней проверяется сводка корзины в памяти
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+class CartItem(Base):
+    __tablename__ = 'cart_items'
+    id = Column(Integer, primary_key=True)
+    cart_id = Column(Integer, nullable=False)
+    product_id = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        # В корзине может быть только одна строка на товар
+        Index('uq_cart_items_cart_product', 'cart_id', 'product_id', unique=True),
+    )
+
+
+class Order(Base):
+    """Оформленный заказ; сумма фиксируется при оформлении"""
+    __tablename__ = 'orders'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger)  # ID пользователя Telegram не помещается в 32 бита
+    status = Column(String, default='completed')
+    total = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+    checkout_id = Column(Integer, nullable=True)  # оформление, в котором создан заказ
+
+    __table_args__ = (
+        # Отчеты администратора: фильтры по пользователю и датам
+        Index('ix_orders_user_id', 'user_id', 'id'),
+        Index('ix_orders_created_at', 'created_at'),
+        Index('ix_orders_checkout', 'checkout_id'),
+    )
+
+
+class OrderItem(Base):
+    """Позиция заказа с ценой на момент оформления"""
+    __tablename__ = 'order_items'
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, nullable=False, index=True)
+    product_id = Column(Integer)
+    name = Column(String)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Float, nullable=False)  # цена за штуку с учетом скидки
+    discount = Column(Float, default=0.0)
+
+
+class Admin(Base):
+    __tablename__ = 'admins'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, unique=True)
+    username = Column(String)
+    is_active = Column(Boolean, default=True)
+
+
+class ScheduledMessage(Base):
+    """Отложенное сообщение пользователю (например, уведомление о доставке)"""
+    __tablename__ = 'scheduled_messages'
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger)
+    text = Column(String)
+    run_at = Column(DateTime, index=True)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class FsmRecord(Base):
+    """Состояние и данные FSM пользователя"""
+    __tablename__ = 'fsm_states'
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)  # JSON
+    updated_at = Column(DateTime, default=datetime.now, index=True)
+
+
+class Feedback(Base):
+    """Отзыв пользователя"""
+    __tablename__ = 'feedback'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, index=True)
+    username = Column(String, nullable=True)
+    text = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class CacheVersion(Base):
+    """Версия данных, закэшированных в памяти бота.
+
+    Консольные скрипты увеличивают версию при каждом изменении, а бот
+    периодически сравнивает ее со своей и перечитывает данные.
+    """
+    __tablename__ = 'cache_versions'
+    name = Column(String, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+
+def bump_version(name):
+    """UPDATE, увеличивающий версию кэша; выполняется в транзакции изменения"""
+    return update(CacheVersion).where(CacheVersion.name == name).values(version=CacheVersion.version + 1)
+
+
+class Checkout(Base):
+    """Оформление заказа; ключ идемпотентности защищает от повторного нажатия"""
+    __tablename__ = 'checkouts'
+    id = Column(Integer, primary_key=True)
+    idempotency_key = Column(String, unique=True, nullable=False)
+    user_id = Column(BigInteger)
+    text = Column(Text, nullable=True)  # подтверждение, показанное пользователю
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class SalesDaily(Base):
+    """Продажи товара за день: накопительная сводка для аналитики.
+
+    Обновляется при оформлении заказа в той же транзакции, поэтому отчеты
+    считаются по сводке, размер которой не зависит от числа заказов.
+    """
+    __tablename__ = 'sales_daily'
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    promo = Column(Boolean, primary_key=True)  # товар продавался по акции
+    category = Column(String)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    hours = Column(Integer, nullable=False, default=0)  # часов с продажами
+    last_hour = Column(Integer, nullable=False, default=0)  # час последней продажи
+
+
+class DemandHourly(Base):
+    """Количество проданных штук по часам суток для графика спроса"""
+    __tablename__ = 'demand_hourly'
+    day = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    units = Column(Integer, nullable=False, default=0)
+
+
+class Promotion(Base):
+    """Акция: скидка на товар или на все товары категории в интервале времени"""
+    __tablename__ = 'promotions'
+    id = Column(Integer, primary_key=True)
+    title = Column(String, nullable=True)
+    product_id = Column(Integer, nullable=True)
+    category = Column(String, nullable=True)
+    discount = Column(Float, nullable=False)  # доля: 0.2 - скидка 20%
+    starts_at = Column(DateTime, nullable=False)
+    ends_at = Column(DateTime, nullable=False)
+    # Ключ автоматической акции часа: реплики не создадут ее дважды
+    key = Column(String, unique=True, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_promotions_ends_at', 'ends_at'),
+    )
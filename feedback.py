@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from datetime import datetime
+from sqlalchemy import insert
+
+import config
+from database import async_session, Feedback
+
+
+class FeedbackWriter:
+    """Буферизованная запись отзывов.
+
+    Обработчик сообщения только кладет отзыв в буфер; фоновая задача
+    записывает накопленные отзывы одним INSERT на пачку, когда набралось
+    batch_size отзывов или прошло flush_interval секунд с первого из них.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None):
+        self.batch_size = batch_size or config.FEEDBACK_BATCH_SIZE
+        self.flush_interval = flush_interval or config.FEEDBACK_FLUSH_INTERVAL
+        self._buffer = []
+        self._pending = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self.written = 0
+
+    def add(self, user_id, username, text):
+        """Ставит отзыв в очередь на запись, не дожидаясь базы данных"""
+        self._buffer.append({
+            'user_id': user_id,
+            'username': username,
+            'text': text,
+            'created_at': datetime.now(),
+        })
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self._pending.set()
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    async def flush(self):
+        """Записывает все накопленные отзывы"""
+        while self._buffer:
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            try:
+                async with async_session() as session:
+                    # Список словарей выполняется как executemany
+                    await session.execute(insert(Feedback), batch)
+                    await session.commit()
+            except BaseException:
+                # Возвращаем пачку в буфер, чтобы не потерять отзывы (в том числе при остановке)
+                self._buffer[:0] = batch
+                raise
+            self.written += len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                if not self._buffer:
+                    if self._stopping:
+                        return
+                    self._pending.clear()
+                    await self._pending.wait()
+                    continue
+                # Ждем заполнения пачки не дольше flush_interval; при остановке пишем сразу
+                if len(self._buffer) < self.batch_size and not self._stopping:
+                    self._full.clear()
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка при записи отзывов: {e}")
+                if self._stopping:
+                    logging.error(f"Не записано отзывов: {len(self._buffer)}")
+                    return
+                await asyncio.sleep(self.flush_interval)
+
+    async def stop(self):
+        """Дописывает буфер и дожидается завершения фоновой задачи.
+
+        Задача не отменяется: отмена посреди записи пачки потеряла бы ее или,
+        если транзакция успела зафиксироваться, записала бы ее повторно.
+        """
+        self._stopping = True
+        if self._task is None:
+            await self.flush()
+            return
+        self._pending.set()
+        self._full.set()
+        await self._task
+        self._task = None
+
+
+feedback_writer = FeedbackWriter()
@@ -1,7 +1,9 @@
-from main import engine, Base, Product, Session, Admin
+from database import engine, Product, Session, Admin, bump_version
+from migrations import upgrade
 
 def init_db():
-    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        upgrade(conn)
     session = Session()
 
     # Проверяем, есть ли уже данные в базе
@@ -133,6 +135,8 @@ def add_admin(user_id: int, username: str):
             is_active=True
         )
         session.add(new_admin)
+        # Бот перечитает список администраторов без перезапуска
+        session.execute(bump_version('admins'))
         session.commit()
         print(f"Администратор {username} (ID: {user_id}) успешно добавлен")
     else:
@@ -0,0 +1,28 @@
+"""Окружение запусков без Telegram и рабочей базы: тесты и бенчмарки.
+
+Модули бота создают движки базы при импорте, поэтому configure() вызывается
+до их импорта.
+"""
+import os
+import tempfile
+
+
+def temp_database_url(prefix):
+    """Адрес новой базы SQLite во временном каталоге"""
+    return f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix=prefix), 'bakery.db')}"
+
+
+def configure(database_url, token):
+    """Задает базу, токен и снимает ограничения, мешающие замерам и проверкам"""
+    os.environ["BOT_TOKEN"] = token
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["DATABASE_SYNC_URL"] = ""
+    # loadtest.py при импорте подставляет свою базу
+    os.environ["LOADTEST_DATABASE_URL"] = database_url
+    # Ограничения скорости отправки подменили бы время обработчиков
+    os.environ["OUTBOX_GLOBAL_RATE"] = "1000000"
+    os.environ["OUTBOX_CHAT_RATE"] = "1000000"
+    os.environ["OUTBOX_CHAT_BURST"] = "1000000"
+    # Случайная акция часа меняла бы цены между запусками
+    os.environ["PROMO_ROTATION_DISCOUNT"] = "0"
+    os.environ.pop("MEDIA_CHAT_ID", None)
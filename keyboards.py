@@ -0,0 +1,141 @@
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from callbacks import (
+    CategoryCallback, ProductsCallback, ProductCallback, AddCallback,
+    CategoriesCallback, CheckoutCallback, ClearCartCallback,
+    CartQuantityCallback, SetQuantityCallback,
+)
+from catalog import catalog
+
+
+class KeyboardRegistry:
+    """Хранит готовые клавиатуры, построенные для текущей версии каталога.
+
+    Клавиатура собирается один раз, дальше обработчики получают тот же объект.
+    При смене версии каталога (ротация акции) кэш сбрасывается целиком.
+    Возвращаемые клавиатуры общие для всех пользователей, изменять их нельзя.
+    """
+
+    def __init__(self):
+        self._version = None
+        self._cache = {}
+
+    def get(self, key, build):
+        if self._version != catalog.version:
+            self._cache = {}
+            self._version = catalog.version
+        markup = self._cache.get(key)
+        if markup is None:
+            markup = self._cache[key] = build()
+        return markup
+
+
+registry = KeyboardRegistry()
+
+
+def _build_main_keyboard(is_admin):
+    keyboard = [
+        [KeyboardButton(text="🍰 Меню")],
+        [KeyboardButton(text="🎁 Акции")],
+        [KeyboardButton(text="🛒 Корзина")],
+        [KeyboardButton(text="🚚 Условия доставки")],
+        [KeyboardButton(text="ℹ️ О нас")],
+        [KeyboardButton(text="📝 Оставить отзыв")]
+    ]
+
+    if is_admin:
+        keyboard.extend([
+            [KeyboardButton(text="📋 Заказы")],
+            [KeyboardButton(text="🧺 Корзины")],
+            [KeyboardButton(text="💬 Отзывы")],
+            [KeyboardButton(text="📊 Статистика")]
+        ])
+
+    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
+
+
+def _build_category_keyboard():
+    keyboard = InlineKeyboardBuilder()
+    keyboard.add(InlineKeyboardButton(text="🍪 Сладкие пироги", callback_data=CategoryCallback(category="sweet").pack()))
+    keyboard.add(InlineKeyboardButton(text="🥧 Сытные пироги", callback_data=CategoryCallback(category="savory").pack()))
+    return keyboard.adjust(2).as_markup()
+
+
+# Статические клавиатуры не зависят от каталога и строятся один раз при импорте
+_MAIN_KEYBOARD = _build_main_keyboard(False)
+_ADMIN_MAIN_KEYBOARD = _build_main_keyboard(True)
+_CATEGORY_KEYBOARD = _build_category_keyboard()
+
+
+def get_main_keyboard(is_admin=False):
+    return _ADMIN_MAIN_KEYBOARD if is_admin else _MAIN_KEYBOARD
+
+
+def get_category_keyboard():
+    return _CATEGORY_KEYBOARD
+
+
+def get_products_keyboard(category):
+    def build():
+        keyboard = InlineKeyboardBuilder()
+        for product in catalog.by_category(category):
+            # Цена со скидкой заранее посчитана в кэше каталога
+            keyboard.add(InlineKeyboardButton(
+                text=f"{product.name} - {product.price_text}",
+                callback_data=ProductCallback(product_id=product.id).pack()
+            ))
+        keyboard.add(InlineKeyboardButton(text="🔙 Назад", callback_data=CategoriesCallback().pack()))
+        return keyboard.adjust(1).as_markup()
+
+    return registry.get(('products', category), build)
+
+
+def get_product_keyboard(product):
+    def build():
+        keyboard = InlineKeyboardBuilder()
+        keyboard.add(InlineKeyboardButton(text="➕ Добавить в корзину", callback_data=AddCallback(product_id=product.id).pack()))
+        keyboard.add(InlineKeyboardButton(text="🔙 Назад к списку", callback_data=ProductsCallback(category=product.category).pack()))
+        return keyboard.adjust(1).as_markup()
+
+    return registry.get(('product', product.id), build)
+
+
+# Наибольшее количество одного товара в корзине
+MAX_QUANTITY = 99
+# Для скольких позиций корзины показывать кнопки −/+ (Telegram ограничивает число кнопок)
+CART_CONTROLS_LIMIT = 30
+
+
+def get_cart_actions_keyboard(category=None, quantities=None):
+    """Клавиатура корзины; с категорией кнопка «назад» ведет к списку товаров.
+
+    Если переданы quantities (product_id -> количество), над действиями
+    добавляются строки −/количество/+ для позиций корзины. Такая клавиатура
+    своя у каждого пользователя и не кэшируется.
+    """
+    def build():
+        keyboard = InlineKeyboardBuilder()
+        keyboard.add(InlineKeyboardButton(text="✅ Оформить заказ", callback_data=CheckoutCallback().pack()))
+        keyboard.add(InlineKeyboardButton(text="🗑 Очистить корзину", callback_data=ClearCartCallback().pack()))
+        if category:
+            keyboard.add(InlineKeyboardButton(text="🔙 Вернуться к покупкам", callback_data=ProductsCallback(category=category).pack()))
+        else:
+            keyboard.add(InlineKeyboardButton(text="🔙 Назад", callback_data=CategoriesCallback().pack()))
+        return keyboard.adjust(1).as_markup()
+
+    actions = registry.get(('cart_actions', category), build)
+    if not quantities:
+        return actions
+
+    rows = []
+    for product_id, quantity in list(quantities.items())[:CART_CONTROLS_LIMIT]:
+        product = catalog.get(product_id)
+        if product is None:
+            continue
+        rows.append([
+            InlineKeyboardButton(text="➖", callback_data=CartQuantityCallback(product_id=product_id, delta=-1).pack()),
+            InlineKeyboardButton(text=f"{product.name}: {quantity} шт.", callback_data=SetQuantityCallback(product_id=product_id).pack()),
+            InlineKeyboardButton(text="➕", callback_data=CartQuantityCallback(product_id=product_id, delta=1).pack()),
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=rows + actions.inline_keyboard)
@@ -0,0 +1,563 @@
+"""Нагрузочный тест бота без обращения к Telegram.
+
+Поднимает локальный сервер, имитирующий Bot API, направляет в него запросы
+бота через собственный адрес сервера API и прогоняет через диспетчер
+сценарии пользователей: меню -> категория -> товар -> добавление -> оформление.
+Результат (обновлений в секунду, перцентили задержки обработчиков, запросов
+к базе и к API на обновление) печатается и сохраняется в JSON, чтобы
+сравнивать замеры между коммитами.
+
+С --webhook обновления не передаются диспетчеру напрямую, а отправляются
+POST-запросами в приложение WebhookServer, запущенное локально: замер
+включает разбор запроса, очередь и пул обработчиков. Ответы 503 при
+переполнении очереди считаются, и обновление отправляется повторно, как
+это делает Telegram.
+
+Запуск:
+    python loadtest.py --users 50 --rounds 5 --output result.json
+    python loadtest.py --compare result.json
+    python loadtest.py --webhook --workers 16 --queue-size 100
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Настройки задаются до импорта модулей бота. База всегда отдельная (LOADTEST_DATABASE_URL),
+# чтобы тест не затронул рабочую базу из .env; ограничения скорости отправки
+# по умолчанию сняты, чтобы не подменять замер обработчиков
+os.environ["BOT_TOKEN"] = "123456:loadtest"
+os.environ["DATABASE_URL"] = os.getenv("LOADTEST_DATABASE_URL", "sqlite+aiosqlite:///loadtest.db")
+os.environ["DATABASE_SYNC_URL"] = ""
+os.environ.setdefault("OUTBOX_GLOBAL_RATE", "1000000")
+os.environ.setdefault("OUTBOX_CHAT_RATE", "1000000")
+os.environ.setdefault("OUTBOX_CHAT_BURST", "1000000")
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from aiohttp import ClientSession, web
+from sqlalchemy import event, make_url
+
+import config
+import main
+from database import async_engine
+from catalog import catalog
+from init_db import init_db
+from metrics import RequestMetricsMiddleware
+from webhook import SECRET_HEADER, WebhookServer
+
+# Id бота в ответах фейкового API совпадает с первой частью токена
+BOT_ID = int(config.BOT_TOKEN.split(":")[0])
+
+# Методы Bot API, которые возвращают сообщение
+MESSAGE_METHODS = {
+    'sendMessage', 'sendPhoto', 'editMessageText', 'editMessageMedia',
+    'editMessageReplyMarkup', 'editMessageCaption',
+}
+
+
+class FakeBotAPI:
+    """Локальный сервер, отвечающий на запросы Bot API правдоподобными ответами.
+
+    Запоминает id последнего сообщения бота в каждом чате, чтобы сценарий
+    нажимал кнопки под реальным для бота сообщением.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8081):
+        self.host = host
+        self.port = port
+        self.calls = 0
+        self.last_message = {}
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def _message(self, data, method):
+        chat_id = int(data.get('chat_id') or 0)
+        message_id = int(data['message_id']) if 'message_id' in data else next(self._message_ids)
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'loadtest'},
+        }
+        if method in ('sendPhoto', 'editMessageMedia'):
+            message['photo'] = [{'file_id': f"photo{message_id}", 'file_unique_id': f"u{message_id}", 'width': 1, 'height': 1}]
+            message['caption'] = data.get('caption', "")
+        else:
+            message['text'] = data.get('text', "")
+        self.last_message[chat_id] = message
+        return message
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        data = dict(await request.post())
+        self.calls += 1
+        if method in MESSAGE_METHODS:
+            result = self._message(data, method)
+        elif method == 'getMe':
+            result = {'id': BOT_ID, 'is_bot': True, 'first_name': 'loadtest'}
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class StatementCounter:
+    """Считает SQL-запросы асинхронного движка"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+class UserSession:
+    """Сценарий одного пользователя: формирует обновления как Telegram"""
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, user_id, api):
+        self.user_id = user_id
+        self.api = api
+        self._message_ids = itertools.count(1_000_000 * user_id)
+
+    def _user(self):
+        return {'id': self.user_id, 'is_bot': False, 'first_name': f"user{self.user_id}"}
+
+    def message(self, text):
+        return Update.model_validate({
+            'update_id': next(self._update_ids),
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': self.user_id, 'type': 'private'},
+                'from': self._user(),
+                'text': text,
+            },
+        })
+
+    def callback(self, data):
+        # Кнопка нажата под последним сообщением бота в этом чате
+        message = self.api.last_message.get(self.user_id) or {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': self.user_id, 'type': 'private'},
+            'text': "",
+        }
+        return Update.model_validate({
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': str(next(self._update_ids)),
+                'from': self._user(),
+                'chat_instance': str(self.user_id),
+                'data': data,
+                'message': message,
+            },
+        })
+
+    def script(self):
+        """Шаги сценария; callback_data собирается по ответу на предыдущий шаг"""
+        category = random.choice(['sweet', 'savory'])
+        products = [product.id for product in catalog.by_category(category)]
+        first, second = random.sample(products, 2)
+        yield lambda: self.message("/start")
+        yield lambda: self.message("🍰 Меню")
+        yield lambda: self.callback(f"cat:{category}")
+        yield lambda: self.callback(f"prod:{first}")
+        yield lambda: self.callback(f"add:{first}")
+        yield lambda: self.callback(f"prods:{category}")
+        yield lambda: self.callback(f"prod:{second}")
+        yield lambda: self.callback(f"add:{second}")
+        yield lambda: self.callback("checkout")
+
+    def browsing(self):
+        """Бесконечный просмотр меню без покупок"""
+        while True:
+            category = random.choice(['sweet', 'savory'])
+            product = random.choice(catalog.by_category(category)).id
+            yield lambda: self.message("🍰 Меню")
+            yield lambda: self.callback(f"cat:{category}")
+            yield lambda: self.callback(f"prod:{product}")
+            yield lambda: self.callback(f"prods:{category}")
+
+    def buying(self):
+        """Бесконечные покупки: добавление, корзина, оформление.
+
+        Корзина открывается новым сообщением, поэтому у каждого оформления
+        свой ключ идемпотентности и каждый раз создается заказ.
+        """
+        while True:
+            product = random.choice(catalog.all()).id
+            yield lambda: self.callback(f"add:{product}")
+            yield lambda: self.message("🛒 Корзина")
+            yield lambda: self.callback("checkout")
+
+
+class TimedDispatcher:
+    """Обертка диспетчера для WebhookServer: время от отправки обновления до конца обработки"""
+
+    def __init__(self, dp, posted, latencies):
+        self.dp = dp
+        self.posted = posted
+        self.latencies = latencies
+
+    async def feed_update(self, bot, update):
+        try:
+            return await self.dp.feed_update(bot, update)
+        finally:
+            self.latencies.append((time.perf_counter() - self.posted.pop(update.update_id)) * 1000)
+
+
+def _percentile(values, percent):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+def _latency(values):
+    return {
+        'p50': round(_percentile(values, 50), 2),
+        'p95': round(_percentile(values, 95), 2),
+        'p99': round(_percentile(values, 99), 2),
+        'max': round(max(values), 2),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(users, rounds, port):
+    api = FakeBotAPI(port=port)
+    await api.start()
+    bot = Bot(token=config.BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    bot.session.middleware(RequestMetricsMiddleware())
+    statements = StatementCounter(async_engine)
+
+    await catalog.reload()
+    latencies = []
+    errors = 0
+
+    async def user_loop(user_id):
+        nonlocal errors
+        session = UserSession(user_id, api)
+        for _ in range(rounds):
+            for step in session.script():
+                update = step()
+                started = time.perf_counter()
+                try:
+                    await main.dp.feed_update(bot, update)
+                except Exception:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    statements.count = 0
+    api.calls = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop(user_id) for user_id in range(1, users + 1)))
+    duration = time.perf_counter() - started
+
+    await bot.session.close()
+    await api.stop()
+
+    updates = len(latencies)
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'database': make_url(config.DATABASE_URL).get_backend_name(),
+        'users': users,
+        'rounds': rounds,
+        'updates': updates,
+        'errors': errors,
+        'duration_s': round(duration, 3),
+        'updates_per_sec': round(updates / duration, 1),
+        'latency_ms': _latency(latencies),
+        'db_statements_per_update': round(statements.count / updates, 2),
+        'api_calls_per_update': round(api.calls / updates, 2),
+    }
+
+
+async def run_via_webhook(users, rounds, port, webhook_port, workers, queue_size):
+    """Замер режима webhook: обновления отправляются POST-запросами в WebhookServer"""
+    api = FakeBotAPI(port=port)
+    await api.start()
+    bot = Bot(token=config.BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    bot.session.middleware(RequestMetricsMiddleware())
+    statements = StatementCounter(async_engine)
+
+    posted = {}
+    latencies = []
+    server = WebhookServer(TimedDispatcher(main.dp, posted, latencies), bot, workers=workers, queue_size=queue_size)
+    await server.start()
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", webhook_port).start()
+    url = f"http://127.0.0.1:{webhook_port}{config.WEBHOOK_PATH}"
+    headers = {SECRET_HEADER: config.WEBHOOK_SECRET} if config.WEBHOOK_SECRET else {}
+
+    await catalog.reload()
+    responses = []
+    rejected = 0
+    errors = 0
+    max_depth = 0
+
+    async def user_loop(http, user_id):
+        nonlocal rejected, errors, max_depth
+        session = UserSession(user_id, api)
+        for _ in range(rounds):
+            for step in session.script():
+                update = step()
+                payload = update.model_dump(mode='json', exclude_none=True)
+                posted[update.update_id] = time.perf_counter()
+                backoff = 0.05
+                while True:
+                    started = time.perf_counter()
+                    async with http.post(url, json=payload, headers=headers) as response:
+                        status = response.status
+                    responses.append((time.perf_counter() - started) * 1000)
+                    max_depth = max(max_depth, server.queue.qsize())
+                    if status != 503:
+                        break
+                    # Очередь переполнена: Telegram повторит доставку позже, увеличивая паузу
+                    rejected += 1
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 1.0)
+                if status != 200:
+                    errors += 1
+                    posted.pop(update.update_id, None)
+
+    statements.count = 0
+    api.calls = 0
+    started = time.perf_counter()
+    async with ClientSession() as http:
+        await asyncio.gather(*(user_loop(http, user_id) for user_id in range(1, users + 1)))
+        accepted_duration = time.perf_counter() - started
+    await server.queue.join()
+    duration = time.perf_counter() - started
+
+    await runner.cleanup()
+    await server.stop()
+    await bot.session.close()
+    await api.stop()
+
+    updates = len(latencies)
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'database': make_url(config.DATABASE_URL).get_backend_name(),
+        'mode': 'webhook',
+        'users': users,
+        'rounds': rounds,
+        'workers': server.workers,
+        'queue_size': server.queue.maxsize,
+        'updates': updates,
+        'errors': errors,
+        'rejected_503': rejected,
+        'max_queue_depth': max_depth,
+        'duration_s': round(duration, 3),
+        'updates_per_sec': round(updates / duration, 1),
+        'accepted_per_sec': round(updates / accepted_duration, 1),
+        # От отправки обновления до конца обработки, включая ожидание в очереди
+        'latency_ms': _latency(latencies),
+        'response_ms': {
+            'p50': round(_percentile(responses, 50), 2),
+            'p99': round(_percentile(responses, 99), 2),
+        },
+        'db_statements_per_update': round(statements.count / updates, 2),
+        'api_calls_per_update': round(api.calls / updates, 2),
+    }
+
+
+# Покупатели открытого режима не пересекаются с пользователями, просматривающими меню
+BUYER_ID_OFFSET = 100000
+
+
+async def run_open_loop(rate, duration, buyers, port, browsers=200):
+    """Просмотр меню с постоянной частотой поступления без оформлений и с ними.
+
+    Обновления просмотра приходят каждые 1/rate секунды независимо от того,
+    обработаны ли предыдущие, как от множества пользователей Telegram.
+    Задержка считается от запланированного момента поступления, поэтому
+    отставание цикла событий тоже попадает в замер. Во второй фазе buyers
+    пользователей без пауз добавляют товары и оформляют заказы.
+    """
+    api = FakeBotAPI(port=port)
+    await api.start()
+    bot = Bot(token=config.BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    await catalog.reload()
+    sessions = [UserSession(user_id, api).browsing() for user_id in range(1, browsers + 1)]
+
+    async def phase(buyers):
+        latencies = []
+        errors = 0
+        checkouts = 0
+        stop = asyncio.Event()
+
+        async def feed(update):
+            nonlocal errors
+            try:
+                await main.dp.feed_update(bot, update)
+            except Exception:
+                errors += 1
+
+        async def browse(update, scheduled):
+            await feed(update)
+            latencies.append((time.perf_counter() - scheduled) * 1000)
+
+        async def buyer_loop(user_id):
+            nonlocal checkouts
+            steps = UserSession(user_id, api).buying()
+            while not stop.is_set():
+                update = next(steps)()
+                await feed(update)
+                if update.callback_query and update.callback_query.data == "checkout":
+                    checkouts += 1
+
+        buyer_tasks = [asyncio.create_task(buyer_loop(BUYER_ID_OFFSET + i)) for i in range(buyers)]
+        tasks = []
+        started = time.perf_counter()
+        for i in range(int(rate * duration)):
+            scheduled = started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = next(sessions[i % browsers])()
+            tasks.append(asyncio.create_task(browse(update, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*buyer_tasks)
+        return {
+            'buyers': buyers,
+            'browse_updates': len(latencies),
+            'errors': errors,
+            'checkouts_per_sec': round(checkouts / elapsed, 1),
+            'browse_latency_ms': _latency(latencies),
+        }
+
+    try:
+        phases = {
+            'browse_only': await phase(0),
+            'with_checkouts': await phase(buyers),
+        }
+    finally:
+        await bot.session.close()
+        await api.stop()
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'database': make_url(config.DATABASE_URL).get_backend_name(),
+        'mode': 'open-loop',
+        'browse_rate': rate,
+        'duration_s': duration,
+        **phases,
+    }
+
+
+def compare(result, baseline):
+    """Печатает изменение основных показателей относительно прошлого замера"""
+    rows = [
+        ('updates_per_sec', result['updates_per_sec'], baseline['updates_per_sec']),
+        ('db_statements_per_update', result['db_statements_per_update'], baseline['db_statements_per_update']),
+        ('api_calls_per_update', result['api_calls_per_update'], baseline['api_calls_per_update']),
+    ]
+    rows += [(f"latency_ms.{key}", result['latency_ms'][key], baseline['latency_ms'][key]) for key in ('p50', 'p95', 'p99')]
+    print(f"\nСравнение с {baseline.get('commit') or 'прошлым замером'}:")
+    for name, new, old in rows:
+        change = f"{(new - old) / old:+.1%}" if old else "—"
+        print(f"{name:<26} {old:>10} -> {new:<10} {change}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота с фейковым сервером Bot API')
+    parser.add_argument('--users', type=int, default=50, help='Число одновременных пользователей')
+    parser.add_argument('--rounds', type=int, default=5, help='Сколько раз каждый пользователь проходит сценарий')
+    parser.add_argument('--port', type=int, default=8081, help='Порт фейкового сервера Bot API')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно генератора случайных чисел для сценариев')
+    parser.add_argument('--output', help='Файл для сохранения результата в JSON')
+    parser.add_argument('--compare', help='JSON прошлого замера для сравнения')
+    parser.add_argument('--webhook', action='store_true', help='Отправлять обновления POST-запросами в WebhookServer')
+    parser.add_argument('--webhook-port', type=int, default=8082, help='Порт локального webhook-сервера')
+    parser.add_argument('--workers', type=int, default=config.WEBHOOK_WORKERS, help='Обработчиков обновлений в режиме webhook')
+    parser.add_argument('--queue-size', type=int, default=config.WEBHOOK_QUEUE_SIZE, help='Размер очереди обновлений в режиме webhook')
+    parser.add_argument('--open-loop', action='store_true', help='Просмотр меню с постоянной частотой без оформлений и с ними')
+    parser.add_argument('--rate', type=float, default=50, help='Обновлений просмотра в секунду в открытом режиме')
+    parser.add_argument('--duration', type=float, default=20, help='Длительность каждой фазы открытого режима, секунд')
+    parser.add_argument('--buyers', type=int, default=20, help='Одновременно оформляющих заказы в открытом режиме')
+    parser.add_argument('--browse-p99-limit', type=float, default=200, help='Допустимый p99 просмотра в открытом режиме, мс')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # Журнал каждого обновления искажает замер
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    # Замер на SQLite начинается с пустой базы; базу PostgreSQL нужно подготовить заранее
+    url = make_url(config.DATABASE_URL)
+    if url.get_backend_name() == 'sqlite' and url.database:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(url.database + suffix):
+                os.remove(url.database + suffix)
+    init_db()
+
+    if args.open_loop:
+        result = asyncio.run(run_open_loop(args.rate, args.duration, args.buyers, args.port))
+        result['browse_p99_limit_ms'] = args.browse_p99_limit
+        result['within_limit'] = all(
+            result[name]['browse_latency_ms']['p99'] <= args.browse_p99_limit
+            for name in ('browse_only', 'with_checkouts')
+        )
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+        # Превышение границы - ошибка запуска, чтобы замер можно было проверять в CI
+        sys.exit(0 if result['within_limit'] else 1)
+
+    if args.webhook:
+        result = asyncio.run(run_via_webhook(
+            args.users, args.rounds, args.port, args.webhook_port, args.workers, args.queue_size,
+        ))
+    else:
+        result = asyncio.run(run(args.users, args.rounds, args.port))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,521 +1,473 @@
+import argparse
 import asyncio
 import logging
-import random
-from datetime import datetime, timedelta
-from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
-
-# Загрузка переменных окружения
-load_dotenv()
+from aiogram import Bot, Dispatcher, F, types
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from sqlalchemy import update
+
+import config
+from database import async_session, async_engine, Checkout
+from admins import admin_cache
+from promotions import promotion_engine
+from migrations import migrate
+from webhook import run_webhook
+from scheduler import scheduler
+from feedback import feedback_writer
+from outbox import outbox, Priority
+from media import remember_photo, warm_up_photos
+from navigation import Screen, render, remember
+from routing import Routes
+from storage import create_storage
+from metrics import registry, setup_metrics, start_metrics_server
+from callbacks import (
+    CategoryCallback, ProductsCallback, ProductCallback, AddCallback,
+    CategoriesCallback, CheckoutCallback, ClearCartCallback, ReportCallback,
+    CartQuantityCallback, SetQuantityCallback,
+)
+from catalog import catalog
+from cart_service import (
+    CartSummary, cart_summaries, load_summary, format_lines, add_item, clear_cart as clear_cart_items,
+    claim_checkout, place_order,
+)
+from cart_editor import cart_editor, cart_screen
+from reports import ReportFilter, build_page, parse_filter, revenue
+from analytics import sales_stats, format_stats
+from keyboards import (
+    get_main_keyboard, get_category_keyboard, get_products_keyboard,
+    get_product_keyboard, MAX_QUANTITY,
+)
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 
 # Инициализация бота и диспетчера
-bot = Bot(token=os.getenv("BOT_TOKEN"))
-dp = Dispatcher()
-
-# Инициализация базы данных
-engine = create_engine('sqlite:///bakery.db')
-Base = declarative_base()
-Session = sessionmaker(bind=engine)
-
-# Словарь для хранения истории навигации пользователей
-user_navigation_history = {}
-
-# Модели данных
-class Product(Base):
-    __tablename__ = 'products'
-    id = Column(Integer, primary_key=True)
-    name = Column(String)
-    description = Column(String)
-    price = Column(Float)
-    category = Column(String)
-    image_url = Column(String)
-    is_special = Column(Integer, default=0)
-    discount = Column(Float, default=0.0)  # Добавляем поле для скидки
-
-
-class Order(Base):
-    __tablename__ = 'orders'
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer)
-    product_id = Column(Integer)
-    quantity = Column(Integer)
-    created_at = Column(DateTime, default=datetime.now)
-    status = Column(String, default='pending')
-
-
-class Admin(Base):
-    __tablename__ = 'admins'
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, unique=True)
-    username = Column(String)
-    is_active = Column(Boolean, default=True)
-
-# Создание таблиц
-Base.metadata.create_all(engine)
-
-# Клавиатуры
-def get_main_keyboard(user_id=None):
-    session = Session()
-    is_admin = False
-    if user_id:
-        admin = session.query(Admin).filter_by(user_id=user_id, is_active=True).first()
-        is_admin = bool(admin)
-    session.close()
-
-    keyboard = [
-        [KeyboardButton(text="🍰 Меню")],
-        [KeyboardButton(text="🎁 Акции")],
-        [KeyboardButton(text="🛒 Корзина")],
-        [KeyboardButton(text="🚚 Условия доставки")],
-        [KeyboardButton(text="ℹ️ О нас")],
-        [KeyboardButton(text="📝 Оставить отзыв")]
-        
-    ]
-
-    if is_admin:
-        keyboard.extend([
-            [KeyboardButton(text="📋 Заказы")],
-            [KeyboardButton(text="🧺 Корзины")]
-        ])
-
-    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
-
-def get_category_keyboard():
-    keyboard = InlineKeyboardBuilder()
-    keyboard.add(InlineKeyboardButton(text="🍪 Сладкие пироги", callback_data="category_sweet"))
-    keyboard.add(InlineKeyboardButton(text="🥧 Сытные пироги", callback_data="category_savory"))
-    return keyboard.adjust(2).as_markup()
-
-def get_products_keyboard(category):
-    session = Session()
-    products = session.query(Product).filter_by(category=category).all()
-    keyboard = InlineKeyboardBuilder()
-    
-    for product in products:
-        # Учитываем скидку при отображении цены
-        display_price = product.price * (1 - product.discount) if product.discount > 0 else product.price
-        price_text = f"{display_price:.2f} руб."
-        if product.discount > 0:
-            price_text += f" (-{int(product.discount * 100)}%)"
-        
-        keyboard.add(InlineKeyboardButton(
-            text=f"{product.name} - {price_text}",
-            callback_data=f"product_{product.id}"
-        ))
-    
-    keyboard.add(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_categories"))
-    session.close()
-    return keyboard.adjust(1).as_markup()
+bot = Bot(token=config.BOT_TOKEN)
+# Состояния пользователей хранятся в ограниченном хранилище FSM (память или база данных)
+storage = create_storage()
+dp = Dispatcher(storage=storage)
+
+# Кнопки меню и inline-кнопки маршрутизируются поиском по словарю;
+# маршрутизатор подключается первым, чтобы нажатия не проверяли остальные фильтры
+routes = Routes()
+routes.setup(dp)
+
+# Время обработчиков, запросы к Bot API и к базе данных
+setup_metrics(dp, bot, async_engine)
+
+
+@registry.collector
+async def collect_service_metrics():
+    outbox_stats = outbox.stats()
+    storage_stats = await storage.stats()
+    return {
+        'bot_outbox_queue_depth': ("Запросов в очереди отправки", outbox_stats['queue_depth']),
+        'bot_outbox_sent': ("Отправлено запросов через очередь", outbox_stats['sent']),
+        'bot_outbox_failed': ("Запросов с ошибкой", outbox_stats['failed']),
+        'bot_outbox_retries': ("Повторов после RetryAfter", outbox_stats['retries']),
+        'bot_outbox_wait_max_seconds': ("Максимальное ожидание в очереди", outbox_stats['wait_max']),
+        'bot_fsm_keys': ("Пользователей в хранилище состояний", storage_stats['keys']),
+        'bot_fsm_bytes': ("Примерный объем данных хранилища состояний", storage_stats['bytes']),
+        'bot_feedback_written': ("Записано отзывов", feedback_writer.written),
+    }
+
+# Через сколько секунд после оформления заказ считается доставленным
+DELIVERY_DELAY = 5
+
+
+class FeedbackStates(StatesGroup):
+    waiting = State()  # ждем текст отзыва
+
+class CartStates(StatesGroup):
+    quantity = State()  # ждем количество товара, выбранного в корзине
 
-def get_cart_keyboard():
-    keyboard = InlineKeyboardBuilder()
-    keyboard.add(InlineKeyboardButton(text="✅ Оформить заказ", callback_data="checkout"))
-    keyboard.add(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main"))
-    return keyboard.adjust(1).as_markup()
+
+def is_admin(user_id):
+    """Проверяет, является ли пользователь активным администратором"""
+    return user_id in admin_cache
 
 # Обработчики команд
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message):
-    await message.answer(
+    await outbox.send(message.answer(
         "Добро пожаловать в нашу пекарню! 🥖\n"
         "Выберите интересующий вас раздел:",
-        reply_markup=get_main_keyboard(message.from_user.id)
-    )
+        reply_markup=get_main_keyboard(is_admin(message.from_user.id))
+    ))
 
-@dp.message(lambda message: message.text == "🍰 Меню")
+@routes.text("🍰 Меню")
 async def show_menu(message: types.Message):
-    await message.answer(
+    await outbox.send(message.answer(
         "Выберите категорию пирогов:",
         reply_markup=get_category_keyboard()
-    )
+    ))
 
-@dp.message(lambda message: message.text == "🎁 Акции")
+@routes.text("🎁 Акции")
 async def show_specials(message: types.Message):
-    session = Session()
-    special_product = session.query(Product).filter_by(is_special=1).first()
-    if special_product:
-        await message.answer(
-            f"🎉 Специальное предложение!\n\n"
-            f"{special_product.name}\n"
-            f"{special_product.description}\n"
-            f"Цена: {special_product.price * 0.8:.2f} руб. (скидка 20%)"
-        )
+    # Действующие скидки уже применены к каталогу движком акций
+    specials = catalog.specials()
+    if specials:
+        text = "🎉 Специальные предложения!\n"
+        for product in specials:
+            text += (
+                f"\n{product.name}\n"
+                f"{product.description}\n"
+                f"Цена: {product.display_price:.2f} руб. (скидка {int(product.discount * 100)}%)\n"
+            )
+        await outbox.send(message.answer(text))
     else:
-        await message.answer("К сожалению, специальных предложений нет.")
-    session.close()
-
-@dp.message(lambda message: message.text == "🛒 Корзина")
-async def show_cart(message: types.Message):
-    session = Session()
-    orders = session.query(Order).filter_by(user_id=message.from_user.id, status='pending').all()
-    
-    if not orders:
-        await message.answer("В корзине ничего нет")
+        await outbox.send(message.answer("К сожалению, специальных предложений нет."))
+
+@routes.text("🛒 Корзина")
+async def show_cart(message: types.Message, state: FSMContext):
+    # Незаписанные изменения −/+ попадают в корзину до ее показа
+    summary = await cart_editor.write(message.from_user.id)
+    if summary is None:
+        async with async_session() as session:
+            summary = await load_summary(session, message.from_user.id)
+    
+    if not summary.quantities:
+        await outbox.send(message.answer("В корзине ничего нет"))
         return
     
-    total = 0
-    cart_text = "🛒 Ваша корзина:\n\n"
-    
-    for order in orders:
-        product = session.query(Product).get(order.product_id)
-        # Учитываем скидку при расчете цены
-        price = product.price * (1 - product.discount) if product.discount > 0 else product.price
-        cart_text += f"{product.name} - {order.quantity} шт. x {price:.2f} руб."
-        if product.discount > 0:
-            cart_text += f" (-{int(product.discount * 100)}%)"
-        cart_text += "\n"
-        total += price * order.quantity
-    
-    cart_text += f"\n💰 Итого: {total:.2f} руб."
-    
-    keyboard = InlineKeyboardBuilder()
-    keyboard.add(InlineKeyboardButton(text="✅ Оформить заказ", callback_data="checkout"))
-    keyboard.add(InlineKeyboardButton(text="🗑 Очистить корзину", callback_data="clear_cart"))
-    keyboard.add(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_categories"))
-    
-    await message.answer(cart_text, reply_markup=keyboard.adjust(1).as_markup())
-    session.close()
+    screen = cart_screen(summary)
+    sent_message = await outbox.send(message.answer(screen.text, reply_markup=screen.reply_markup))
+    await remember(state, sent_message, screen)
 
-@dp.message(lambda message: message.text == "🚚 Условия доставки")
+@routes.text("🚚 Условия доставки")
 async def show_delivery_info(message: types.Message):
-    await message.answer(
+    await outbox.send(message.answer(
         "Вам нужно выбрать позиции из меню, и мы доставим вам в любую точку города в течение часа ваш заказ."
-    )
+    ))
 
-@dp.message(lambda message: message.text == "ℹ️ О нас")
+@routes.text("ℹ️ О нас")
 async def show_about(message: types.Message):
-    await message.answer(
+    await outbox.send(message.answer(
         "Добро пожаловать в нашу пекарню! 🥖\n\n"
         "Мы - семейная пекарня с многолетней историей, где каждый пирог создается с любовью и заботой. "
         "Используем только натуральные ингредиенты и традиционные рецепты. "
         "Наша миссия - радовать вас вкусной и качественной выпечкой каждый день!"
-    )
+    ))
 
 # Обработчики callback-запросов
-@dp.callback_query(lambda c: c.data.startswith('category_'))
-async def process_category(callback: types.CallbackQuery):
-    category = callback.data.split('_')[1]
-    await callback.message.edit_text(
-        "Выберите пирог:",
-        reply_markup=get_products_keyboard(category)
+@routes.callback(CategoryCallback)
+async def process_category(callback: types.CallbackQuery, callback_data: CategoryCallback, state: FSMContext):
+    category = callback_data.category
+    await render(callback, Screen("Выберите пирог:", get_products_keyboard(category), key=f"products:{category}"), state)
+
+@routes.callback(ProductCallback)
+async def process_product(callback: types.CallbackQuery, callback_data: ProductCallback, state: FSMContext):
+    product_id = callback_data.product_id
+    product = catalog.get(product_id)
+    if product is None:
+        await outbox.send(callback.answer("Товар не найден"))
+        return
+    keyboard = get_product_keyboard(product)
+    text = (
+        f"🥧 {product.name}\n\n"
+        f"📝 {product.description}\n\n"
+        f"💰 Цена: {product.price_text}"
     )
-
-@dp.callback_query(lambda c: c.data.startswith('product_'))
-async def process_product(callback: types.CallbackQuery):
-    product_id = int(callback.data.split('_')[1])
-    session = Session()
-    product = session.query(Product).get(product_id)
-    
-    keyboard = InlineKeyboardBuilder()
-    keyboard.add(InlineKeyboardButton(text="➕ Добавить в корзину", callback_data=f"add_{product_id}"))
-    keyboard.add(InlineKeyboardButton(text="🔙 Назад к списку", callback_data=f"back_to_products_{product.category}"))
-    
-    # Учитываем скидку при отображении цены
-    display_price = product.price * (1 - product.discount) if product.discount > 0 else product.price
-    price_text = f"{display_price:.2f} руб."
-    if product.discount > 0:
-        price_text += f" (-{int(product.discount * 100)}%)"
     
     try:
-        # Сначала удаляем старое сообщение
-        await callback.message.delete()
-        
-        # Отправляем новое сообщение с фото
-        await callback.message.answer_photo(
-            photo=product.image_url,
-            caption=f"🥧 {product.name}\n\n"
-                   f"📝 {product.description}\n\n"
-                   f"💰 Цена: {price_text}",
-            reply_markup=keyboard.adjust(1).as_markup()
-        )
+        # Фото товара; после первой загрузки используется file_id
+        sent_message = await render(callback, Screen(text, keyboard, photo=product.photo, key=f"product:{product_id}"), state)
+        await remember_photo(product, sent_message)
     except Exception as e:
         logging.error(f"Ошибка при отображении продукта: {e}")
         # В случае ошибки с изображением, отправляем только текст
-        await callback.message.edit_text(
-            f"🥧 {product.name}\n\n"
-            f"📝 {product.description}\n\n"
-            f"💰 Цена: {price_text}",
-            reply_markup=keyboard.adjust(1).as_markup()
+        await render(callback, Screen(text, keyboard), state)
+
+def checkout_key(callback: types.CallbackQuery):
+    """Ключ идемпотентности: повторные нажатия на одну версию сообщения с корзиной совпадают"""
+    message = callback.message
+    shown_at = message.edit_date or message.date
+    return f"{message.chat.id}:{message.message_id}:{int(shown_at.timestamp())}"
+
+@routes.callback(CheckoutCallback)
+async def process_checkout(callback: types.CallbackQuery, callback_data: CheckoutCallback, state: FSMContext):
+    # Изменения количества, нажатые перед оформлением, должны попасть в заказ
+    await cart_editor.write(callback.from_user.id)
+    async with async_session() as session:
+        checkout_id, confirmed_text = await claim_checkout(session, callback.from_user.id, checkout_key(callback))
+        if confirmed_text is not None:
+            # Повторное нажатие: показываем то же подтверждение, заказ не дублируется
+            await session.rollback()
+            await render(callback, Screen(confirmed_text), state)
+            await outbox.send(callback.answer("Заказ уже оформлен"))
+            return
+        
+        # Позиции забираются из корзины атомарно, цены фиксируются в заказе
+        order_id, lines, total = await place_order(session, callback.from_user.id, checkout_id)
+        
+        if not lines:
+            await session.rollback()
+            await outbox.send(callback.answer("Корзина пуста!"))
+            return
+        
+        # Формируем текст заказа
+        items_text, _ = format_lines(lines, bullet="• ")
+        order_text = f"📋 Ваш заказ #{order_id}:\n\n" + items_text
+        
+        order_text += f"\n💰 Итого к оплате: {total:.2f} руб."
+        
+        # Имитация доставки: уведомление сохраняется вместе с заказом и отправляется планировщиком
+        delivery_time = await scheduler.schedule(
+            callback.message.chat.id,
+            "🎉 Ваш заказ доставлен! Приятного аппетита!",
+            DELIVERY_DELAY,
+            session=session,
         )
-    
-    session.close()
-
-@dp.callback_query(lambda c: c.data == 'checkout')
-async def process_checkout(callback: types.CallbackQuery):
-    session = Session()
-    orders = session.query(Order).filter_by(user_id=callback.from_user.id, status='pending').all()
-    
-    if not orders:
-        await callback.answer("Корзина пуста!")
-        return
-    
-    # Формируем текст заказа
-    order_text = "📋 Ваш заказ:\n\n"
-    total = 0
-    
-    for order in orders:
-        product = session.query(Product).get(order.product_id)
-        price = product.price * (1 - product.discount) if product.discount > 0 else product.price
-        order_text += f"• {product.name} - {order.quantity} шт. x {price:.2f} руб."
-        if product.discount > 0:
-            order_text += f" (-{int(product.discount * 100)}%)"
-        order_text += "\n"
-        total += price * order.quantity
+        order_text += f"\n\n🚚 Ваш заказ будет доставлен в {delivery_time.strftime('%H:%M:%S')}"
+        confirmed_text = f"✅ Заказ успешно оформлен!\n\n{order_text}"
         
-        # Обновляем статус заказа
-        order.status = 'completed'
-    
-    order_text += f"\n💰 Итого к оплате: {total:.2f} руб."
-    
-    # Время доставки (текущее время + 5 секунд)
-    delivery_time = datetime.now() + timedelta(seconds=5)
-    order_text += f"\n\n🚚 Ваш заказ будет доставлен в {delivery_time.strftime('%H:%M:%S')}"
-    
-    session.commit()
-    session.close()
+        await session.execute(update(Checkout).where(Checkout.id == checkout_id).values(text=confirmed_text))
+        await session.commit()
+    # Корзина оформлена; сводка перечитается при следующем изменении
+    cart_summaries.forget(callback.from_user.id)
     
     # Отправляем подтверждение заказа
-    await callback.message.delete()
-    await callback.message.answer(
-        f"✅ Заказ успешно оформлен!\n\n{order_text}"
-    )
-    
-    # Имитация доставки через 5 секунд
-    await asyncio.sleep(5)
-    await callback.message.answer("🎉 Ваш заказ доставлен! Приятного аппетита!")
-
-@dp.callback_query(lambda c: c.data == 'back_to_categories')
-async def back_to_categories(callback: types.CallbackQuery):
-    await callback.message.delete()
-    await callback.message.answer(
-        "Выберите категорию пирогов:",
-        reply_markup=get_category_keyboard()
-    )
+    await render(callback, Screen(confirmed_text), state)
 
-@dp.callback_query(lambda c: c.data.startswith('back_to_products_'))
-async def back_to_products(callback: types.CallbackQuery):
-    category = callback.data.split('_')[-1]
-    session = Session()
-    products = session.query(Product).filter_by(category=category).all()
-    
-    keyboard = InlineKeyboardBuilder()
-    for product in products:
-        display_price = product.price * (1 - product.discount) if product.discount > 0 else product.price
-        price_text = f"{display_price:.2f} руб."
-        if product.discount > 0:
-            price_text += f" (-{int(product.discount * 100)}%)"
-        
-        keyboard.add(InlineKeyboardButton(
-            text=f"{product.name} - {price_text}",
-            callback_data=f"product_{product.id}"
-        ))
-    
-    keyboard.add(InlineKeyboardButton(text="🔙 Назад к категориям", callback_data="back_to_categories"))
-    
-    await callback.message.delete()
-    await callback.message.answer(
-        "Выберите пирог:",
-        reply_markup=keyboard.adjust(1).as_markup()
-    )
-    session.close()
+@routes.callback(CategoriesCallback)
+async def back_to_categories(callback: types.CallbackQuery, callback_data: CategoriesCallback, state: FSMContext):
+    await render(callback, Screen("Выберите категорию пирогов:", get_category_keyboard(), key="categories"), state)
+
+@routes.callback(ProductsCallback)
+async def back_to_products(callback: types.CallbackQuery, callback_data: ProductsCallback, state: FSMContext):
+    category = callback_data.category
+    await render(callback, Screen("Выберите пирог:", get_products_keyboard(category), key=f"products:{category}"), state)
 
 # Новые обработчики для администратора
-@dp.message(lambda message: message.text == "📋 Заказы")
-async def show_orders(message: types.Message):
-    session = Session()
-    admin = session.query(Admin).filter_by(user_id=message.from_user.id, is_active=True).first()
+async def get_report_filter(message: types.Message, args=None):
+    """Проверяет права и разбирает фильтр отчета; None, если отвечать нечего"""
+    if not is_admin(message.from_user.id):
+        await outbox.send(message.answer("У вас нет прав администратора"))
+        return None
     
-    if not admin:
-        await message.answer("У вас нет прав администратора")
-        return
-    
-    orders = session.query(Order).filter_by(status='completed').all()
-    
-    if not orders:
-        await message.answer("Нет оформленных заказов")
+    try:
+        return parse_filter(args)
+    except ValueError:
+        await outbox.send(message.answer(
+            "Неверный формат фильтра. Пример:\n"
+            "/orders user=123456789 from=2024-01-01 to=2024-01-31"
+        ))
+        return None
+
+async def send_report(message: types.Message, kind, args=None):
+    report_filter = await get_report_filter(message, args)
+    if report_filter is None:
         return
     
-    orders_text = "Список оформленных заказов:\n\n"
-    for order in orders:
-        product = session.query(Product).get(order.product_id)
-        orders_text += (
-            f"Заказ #{order.id}\n"
-            f"Пользователь: {order.user_id}\n"
-            f"Товар: {product.name}\n"
-            f"Количество: {order.quantity}\n"
-            f"Дата: {order.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-            f"Статус: {order.status}\n\n"
-        )
-    
-    await message.answer(orders_text)
-    session.close()
+    text, keyboard = await build_page(kind, report_filter)
+    await outbox.send(message.answer(text, reply_markup=keyboard), priority=Priority.REPORT)
+
+@routes.text("📋 Заказы")
+async def show_orders(message: types.Message):
+    await send_report(message, 'o')
+
+@dp.message(Command("orders"))
+async def cmd_orders(message: types.Message, command: CommandObject):
+    await send_report(message, 'o', command.args)
 
-@dp.message(lambda message: message.text == "🧺 Корзины")
+@routes.text("🧺 Корзины")
 async def show_carts(message: types.Message):
-    session = Session()
-    admin = session.query(Admin).filter_by(user_id=message.from_user.id, is_active=True).first()
-    
-    if not admin:
-        await message.answer("У вас нет прав администратора")
+    await send_report(message, 'c')
+
+@dp.message(Command("carts"))
+async def cmd_carts(message: types.Message, command: CommandObject):
+    await send_report(message, 'c', command.args)
+
+@routes.text("💬 Отзывы")
+async def show_feedback(message: types.Message):
+    await send_report(message, 'f')
+
+@dp.message(Command("feedback"))
+async def cmd_feedback(message: types.Message, command: CommandObject):
+    await send_report(message, 'f', command.args)
+
+@dp.message(Command("revenue"))
+async def cmd_revenue(message: types.Message, command: CommandObject):
+    report_filter = await get_report_filter(message, command.args)
+    if report_filter is None:
         return
     
-    # Получаем все активные корзины (заказы со статусом pending)
-    carts = session.query(Order).filter_by(status='pending').all()
-    
-    if not carts:
-        await message.answer("Нет активных корзин")
+    count, total = await revenue(report_filter)
+    await outbox.send(
+        message.answer(f"💰 Выручка: {total:.2f} руб.\nОформлено заказов: {count}"),
+        priority=Priority.REPORT,
+    )
+
+async def send_stats(message: types.Message, args=None):
+    report_filter = await get_report_filter(message, args)
+    if report_filter is None:
         return
     
-    carts_text = "Список активных корзин:\n\n"
-    for cart in carts:
-        product = session.query(Product).get(cart.product_id)
-        carts_text += (
-            f"Корзина пользователя: {cart.user_id}\n"
-            f"Товар: {product.name}\n"
-            f"Количество: {cart.quantity}\n"
-            f"Дата добавления: {cart.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-        )
+    if report_filter.user_id:
+        # Сводка продаж не хранит пользователей
+        await outbox.send(message.answer("Статистика строится только с фильтром по датам"))
+        return
     
-    await message.answer(carts_text)
-    session.close()
+    stats = await sales_stats(report_filter)
+    await outbox.send(message.answer(format_stats(stats)), priority=Priority.REPORT)
 
-@dp.callback_query(lambda c: c.data == 'clear_cart')
-async def clear_cart(callback: types.CallbackQuery):
-    session = Session()
-    
-    # Удаляем все товары из корзины пользователя
-    session.query(Order).filter_by(
-        user_id=callback.from_user.id,
-        status='pending'
-    ).delete()
-    
-    session.commit()
-    session.close()
+@routes.text("📊 Статистика")
+async def show_stats(message: types.Message):
+    await send_stats(message)
+
+@dp.message(Command("stats"))
+async def cmd_stats(message: types.Message, command: CommandObject):
+    await send_stats(message, command.args)
+
+@dp.message(Command("warmup"))
+async def cmd_warmup(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await outbox.send(message.answer("У вас нет прав администратора"))
+        return
     
-    await callback.message.delete()
-    await callback.message.answer(
-        "🗑 Корзина очищена!",
-        reply_markup=get_category_keyboard()
+    await outbox.send(message.answer("⏳ Загружаю фото товаров..."), priority=Priority.REPORT)
+    uploaded, failed = await warm_up_photos(message.bot, config.MEDIA_CHAT_ID or message.chat.id)
+    await outbox.send(
+        message.answer(f"✅ Загружено фото: {uploaded}, ошибок: {failed}"),
+        priority=Priority.REPORT,
     )
-    await callback.answer("Корзина успешно очищена!")
 
-@dp.callback_query(lambda c: c.data.startswith('add_'))
-async def add_to_cart(callback: types.CallbackQuery):
-    product_id = int(callback.data.split('_')[1])
-    session = Session()
-    
-    # Получаем продукт
-    product = session.query(Product).get(product_id)
-    
-    # Проверяем, есть ли уже такой товар в корзине
-    existing_order = session.query(Order).filter_by(
-        user_id=callback.from_user.id,
-        product_id=product_id,
-        status='pending'
-    ).first()
-    
-    if existing_order:
-        existing_order.quantity += 1
-    else:
-        new_order = Order(
-            user_id=callback.from_user.id,
-            product_id=product_id,
-            quantity=1,
-            status='pending'
-        )
-        session.add(new_order)
-    
-    session.commit()
-    
-    # Получаем все товары в корзине для отображения
-    orders = session.query(Order).filter_by(
-        user_id=callback.from_user.id,
-        status='pending'
-    ).all()
-    
-    total = 0
-    cart_text = "🛒 Ваша корзина:\n\n"
-    
-    for order in orders:
-        product = session.query(Product).get(order.product_id)
-        # Учитываем скидку при расчете цены
-        price = product.price * (1 - product.discount) if product.discount > 0 else product.price
-        cart_text += f"• {product.name} - {order.quantity} шт. x {price:.2f} руб."
-        if product.discount > 0:
-            cart_text += f" (-{int(product.discount * 100)}%)"
-        cart_text += "\n"
-        total += price * order.quantity
+@routes.callback(ReportCallback)
+async def report_page(callback: types.CallbackQuery, callback_data: ReportCallback):
+    if not is_admin(callback.from_user.id):
+        await outbox.send(callback.answer("У вас нет прав администратора"))
+        return
     
-    cart_text += f"\n💰 Итого к оплате: {total:.2f} руб."
+    report_filter = ReportFilter.from_callback(callback_data)
+    text, keyboard = await build_page(callback_data.kind, report_filter, callback_data.cursor, callback_data.direction)
+    await outbox.send(callback.message.edit_text(text, reply_markup=keyboard), priority=Priority.REPORT)
+    await outbox.send(callback.answer())
+
+@routes.callback(ClearCartCallback)
+async def clear_cart(callback: types.CallbackQuery, callback_data: ClearCartCallback, state: FSMContext):
+    cart_editor.discard(callback.from_user.id)
+    async with async_session() as session:
+        # Удаляем все товары из корзины пользователя
+        version = await clear_cart_items(session, callback.from_user.id)
+        await session.commit()
+    if version is not None:
+        cart_summaries.store(callback.from_user.id, CartSummary(version, {}))
+    
+    await render(callback, Screen("🗑 Корзина очищена!", get_category_keyboard()), state)
+    await outbox.send(callback.answer("Корзина успешно очищена!"))
+
+@routes.callback(AddCallback)
+async def add_to_cart(callback: types.CallbackQuery, callback_data: AddCallback, state: FSMContext):
+    product_id = callback_data.product_id
+    added_product = catalog.get(product_id)
+    if added_product is None:
+        await outbox.send(callback.answer("Товар не найден"))
+        return
+    # Незаписанные количества не должны затереть это добавление
+    await cart_editor.write(callback.from_user.id)
+    async with async_session() as session:
+        # Атомарно добавляем товар или увеличиваем его количество в корзине
+        version, quantity = await add_item(session, callback.from_user.id, product_id)
+        await session.commit()
+        
+        # Сводка корзины обновляется по одной позиции; из базы читается, только если устарела
+        summary = cart_summaries.apply(callback.from_user.id, version, {product_id: quantity})
+        if summary is None:
+            summary = await load_summary(session, callback.from_user.id)
     
-    # Создаем клавиатуру с кнопками
-    keyboard = InlineKeyboardBuilder()
-    keyboard.add(InlineKeyboardButton(text="✅ Оформить заказ", callback_data="checkout"))
-    keyboard.add(InlineKeyboardButton(text="🗑 Очистить корзину", callback_data="clear_cart"))
-    keyboard.add(InlineKeyboardButton(text="🔙 Вернуться к покупкам", callback_data=f"back_to_products_{product.category}"))
+    await render(callback, cart_screen(summary, added_product.category), state)
     
-    await callback.message.delete()
-    await callback.message.answer(
-        cart_text,
-        reply_markup=keyboard.adjust(1).as_markup()
-    )
-    
-    session.close()
-    await callback.answer("✅ Товар добавлен в корзину!")
-
-async def update_special_offers():
-    """Обновляет акции каждый час"""
-    while True:
-        try:
-            session = Session()
-            
-            # Сбрасываем все текущие акции
-            session.query(Product).update({Product.is_special: 0, Product.discount: 0.0})
-            
-            # Выбираем случайный продукт для акции
-            all_products = session.query(Product).all()
-            if all_products:
-                special_product = random.choice(all_products)
-                special_product.is_special = 1
-                special_product.discount = 0.2  # 20% скидка
-            
-            session.commit()
-            session.close()
-            
-            # Ждем 1 час перед следующим обновлением
-            await asyncio.sleep(3600)
-        except Exception as e:
-            logging.error(f"Ошибка при обновлении акций: {e}")
-            await asyncio.sleep(60)  # В случае ошибки ждем 1 минуту перед повторной попыткой
-
-
-user_feedback_mode = {}
-
-@dp.message(lambda message: message.text == "📝 Оставить отзыв")
-async def leave_feedback(message: types.Message):
-    user_feedback_mode[message.from_user.id] = True
-    await message.answer("✍️ Напишите ваш отзыв:")
-
-@dp.message(lambda message: message.text and user_feedback_mode.get(message.from_user.id))
-async def handle_feedback(message: types.Message):
-    user_feedback_mode[message.from_user.id] = False
-    await message.answer("✅ Спасибо за ваш отзыв!")
+    await outbox.send(callback.answer("✅ Товар добавлен в корзину!"))
+
+@routes.callback(CartQuantityCallback)
+async def change_quantity(callback: types.CallbackQuery, callback_data: CartQuantityCallback, state: FSMContext):
+    product = catalog.get(callback_data.product_id)
+    if product is None:
+        await outbox.send(callback.answer("Товар не найден"))
+        return
+    # Кнопки меняются сразу, запись в базу и новая сумма - после паузы в нажатиях
+    await cart_editor.set(callback.from_user.id, product.id, callback_data.delta, callback, state, product.category)
+    await outbox.send(callback.answer())
+    await cart_editor.show(callback.from_user.id)
+
+@routes.callback(SetQuantityCallback)
+async def ask_quantity(callback: types.CallbackQuery, callback_data: SetQuantityCallback, state: FSMContext):
+    product = catalog.get(callback_data.product_id)
+    if product is None:
+        await outbox.send(callback.answer("Товар не найден"))
+        return
+    await state.set_state(CartStates.quantity)
+    await state.update_data(quantity_product_id=product.id)
+    await outbox.send(callback.message.answer(
+        f"✍️ Сколько «{product.name}» положить в корзину? Введите число от 0 до {MAX_QUANTITY} (0 - убрать из корзины):"
+    ))
+    await outbox.send(callback.answer())
+
+@dp.message(CartStates.quantity, F.text)
+async def handle_quantity(message: types.Message, state: FSMContext):
+    text = message.text.strip()
+    if not text.isdecimal() or int(text) > MAX_QUANTITY:
+        await outbox.send(message.answer(f"Введите число от 0 до {MAX_QUANTITY}"))
+        return
+    await state.set_state(None)
+    product_id = (await state.get_data()).get('quantity_product_id')
+    await state.update_data(quantity_product_id=None)
+    summary = await cart_editor.write(message.from_user.id, {product_id: int(text)})
+    
+    screen = cart_screen(summary)
+    sent_message = await outbox.send(message.answer(screen.text, reply_markup=screen.reply_markup))
+    await remember(state, sent_message, screen)
+
+@routes.text("📝 Оставить отзыв")
+async def leave_feedback(message: types.Message, state: FSMContext):
+    await state.set_state(FeedbackStates.waiting)
+    await outbox.send(message.answer("✍️ Напишите ваш отзыв:"))
+
+@dp.message(FeedbackStates.waiting, F.text)
+async def handle_feedback(message: types.Message, state: FSMContext):
+    await state.set_state(None)
+    # Отзыв записывается в базу фоновой задачей пачкой вместе с другими
+    feedback_writer.add(message.from_user.id, message.from_user.username, message.text)
+    await outbox.send(message.answer("✅ Спасибо за ваш отзыв!"))
 
 # Запуск бота
-async def main():
-    # Запускаем обновление акций в фоновом режиме
-    asyncio.create_task(update_special_offers())
-    await dp.start_polling(bot)
+async def main(mode="polling"):
+    # Применение миграций схемы
+    await migrate()
+    await catalog.reload()
+    # Загружаем список администраторов и следим за его изменениями
+    await admin_cache.start()
+    # Удаляем состояния пользователей, давно не обращавшихся к боту
+    await storage.cleanup()
+    # Применяем действующие акции и переключаем их по расписанию
+    await promotion_engine.start()
+    # Запускаем отправку отложенных уведомлений
+    await scheduler.start(bot)
+    # Метрики для Prometheus
+    if config.METRICS_PORT:
+        await start_metrics_server()
+    # Предзагружаем фото товаров, чтобы первые просмотры не ждали загрузки по URL
+    warm_up_task = None
+    if config.MEDIA_CHAT_ID:
+        # Ссылка на задачу не дает сборщику мусора удалить ее до завершения
+        warm_up_task = asyncio.create_task(warm_up_photos(bot, config.MEDIA_CHAT_ID))
+    try:
+        if mode == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        if warm_up_task:
+            warm_up_task.cancel()
+        # Дописываем изменения корзин и отзывы, которые не успели попасть в базу
+        await cart_editor.stop()
+        await feedback_writer.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Телеграм бот пекарни')
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default=config.BOT_MODE,
+                        help='Способ получения обновлений (по умолчанию BOT_MODE или polling)')
+    args = parser.parse_args()
+    asyncio.run(main(args.mode)) 
\ No newline at end of file
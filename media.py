@@ -0,0 +1,53 @@
+import logging
+from aiogram.methods import SendPhoto, DeleteMessage
+
+from catalog import catalog
+from outbox import outbox, Priority
+
+
+def get_file_id(message):
+    """Возвращает file_id самого большого размера фото из отправленного сообщения"""
+    if message and message.photo:
+        return message.photo[-1].file_id
+    return None
+
+
+async def remember_photo(product, message):
+    """Сохраняет file_id после первой успешной отправки фото товара по адресу.
+
+    При отправке по file_id Telegram может вернуть другую строку для того же
+    файла, поэтому уже сохраненный file_id не перезаписывается.
+    """
+    if product.image_file_id is not None:
+        return
+    file_id = get_file_id(message)
+    if file_id:
+        await catalog.set_photo_file_id(product.id, file_id)
+
+
+async def warm_up_photos(bot, chat_id):
+    """Заранее загружает в Telegram фото товаров без актуального file_id.
+
+    Фото отправляются в служебный чат и сразу удаляются, а полученные
+    file_id сохраняются. Возвращает число загруженных и неудачных фото.
+    """
+    uploaded = 0
+    failed = 0
+    for product in catalog.all():
+        if product.image_file_id or not product.image_url:
+            continue
+        try:
+            message = await outbox.send(
+                SendPhoto(chat_id=chat_id, photo=product.image_url, disable_notification=True).as_(bot),
+                priority=Priority.REPORT,
+            )
+            await remember_photo(product, message)
+            await outbox.send(
+                DeleteMessage(chat_id=chat_id, message_id=message.message_id).as_(bot),
+                priority=Priority.REPORT,
+            )
+            uploaded += 1
+        except Exception as e:
+            logging.error(f"Не удалось загрузить фото товара {product.id}: {e}")
+            failed += 1
+    return uploaded, failed
@@ -0,0 +1,231 @@
+import bisect
+import logging
+import time
+from contextvars import ContextVar
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+from sqlalchemy import event
+
+import config
+
+# Границы корзин гистограмм, секунд
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Обработчик, в контексте которого выполняется текущий код; запросы к базе
+# из фоновых задач попадают в метрики с меткой background
+current_handler = ContextVar('current_handler', default='background')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # метки -> [счетчики по корзинам..., сумма, количество]
+        self._values = {}
+
+    def observe(self, value, *labels):
+        data = self._values.get(labels)
+        if data is None:
+            data = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            data[index] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, data in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                bucket_labels = _format_labels(self.labels + ('le',), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), labels + ('+Inf',))} {data[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {data[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {data[-1]}")
+        return lines
+
+
+class Registry:
+    """Метрики процесса в текстовом формате Prometheus.
+
+    Счетчики и гистограммы обновляются обработчиками, а показатели других
+    компонентов (очередь отправки, хранилище состояний) собираются функциями
+    сборщиков в момент запроса метрик.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=()):
+        metric = Histogram(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect):
+        """Регистрирует асинхронную функцию, возвращающую {имя: (описание, значение)}"""
+        self._collectors.append(collect)
+        return collect
+
+    async def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                values = await collect()
+            except Exception as e:
+                logging.error(f"Ошибка при сборе метрик: {e}")
+                continue
+            for name, (help, value) in values.items():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_SECONDS = registry.histogram('bot_handler_seconds', "Время работы обработчика", ('handler',))
+HANDLER_ERRORS = registry.counter('bot_handler_errors_total', "Исключения в обработчиках", ('handler',))
+API_SECONDS = registry.histogram('bot_api_request_seconds', "Время запроса к Bot API", ('method',))
+API_ERRORS = registry.counter('bot_api_errors_total', "Ошибки запросов к Bot API", ('method',))
+DB_SECONDS = registry.histogram('bot_db_statement_seconds', "Время SQL-запроса", ('handler', 'statement'))
+
+
+def _handler_name(data):
+    # Для маршрутизатора на словарях настоящий обработчик лежит в route
+    route = data.get('route')
+    if route:
+        return route[0].__name__
+    handler = data.get('handler')
+    return getattr(handler.callback, '__name__', 'unknown') if handler else 'unknown'
+
+
+def _describe(event):
+    """Тип обновления и callback_data для журнала медленных обработчиков"""
+    data = getattr(event, 'data', None)
+    if data is not None:
+        return f"callback_query data={data!r}"
+    text = getattr(event, 'text', None)
+    return f"message text={text[:50]!r}" if text else type(event).__name__
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Замеряет время обработчиков и пишет в журнал медленные обновления"""
+
+    def __init__(self, slow_ms=None):
+        self.slow_ms = config.METRICS_SLOW_HANDLER_MS if slow_ms is None else slow_ms
+
+    async def __call__(self, handler, event, data):
+        name = _handler_name(data)
+        token = current_handler.set(name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            current_handler.reset(token)
+            HANDLER_SECONDS.observe(elapsed, name)
+            if self.slow_ms and elapsed * 1000 >= self.slow_ms:
+                logging.warning(f"Медленный обработчик {name}: {elapsed * 1000:.0f} мс, {_describe(event)}")
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Замеряет запросы к Bot API по методам"""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            API_ERRORS.inc(name)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, name)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    DB_SECONDS.observe(time.perf_counter() - started, current_handler.get(), kind)
+
+
+def _on_error(context):
+    # Для запроса с ошибкой after_cursor_execute не вызывается
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine):
+    """Подключает замер SQL-запросов к синхронному движку (или sync_engine асинхронного)"""
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+    event.listen(engine, "handle_error", _on_error)
+
+
+def setup_metrics(dp, bot, engine):
+    """Подключает сбор метрик к диспетчеру, сессии бота и движку базы данных"""
+    middleware = HandlerMetricsMiddleware()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+    bot.session.middleware(RequestMetricsMiddleware())
+    instrument_engine(engine.sync_engine)
+
+
+async def metrics_handler(request):
+    return web.Response(text=await registry.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(host=None, port=None):
+    """Запускает HTTP-сервер с метриками по адресу /metrics"""
+    host = host or config.METRICS_HOST
+    port = port or config.METRICS_PORT
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,423 @@
+"""Версионные миграции схемы базы данных.
+
+Текущая версия схемы хранится в таблице schema_version. Каждая миграция -
+функция, получающая соединение внутри транзакции. Таблицы миграции описаны
+в ней самой в том виде, какими они были в этой версии схемы, а не берутся
+из моделей database.py: изменение модели не должно менять то, что делает
+уже выпущенная миграция. Новая колонка или индекс модели - новая миграция.
+
+Базы, созданные прежними версиями бота, могли получить таблицы последующих
+миграций раньше времени, поэтому миграции идемпотентны: создают только
+отсутствующие таблицы, колонки и индексы.
+
+Запуск вручную:
+    python migrations.py
+"""
+import logging
+from collections import defaultdict
+from sqlalchemy import (
+    inspect, text, MetaData, Table, Column, Index, Integer, BigInteger, String, Text, Float, Date, DateTime, Boolean,
+)
+
+from catalog import format_price
+from database import engine, async_engine
+
+
+def _table(name, *args):
+    """Таблица, описанная независимо от моделей, в своих метаданных"""
+    return Table(name, MetaData(), *args)
+
+
+def _create_tables(conn, *tables):
+    """Создает отсутствующие таблицы и их индексы"""
+    for table in tables:
+        table.create(conn, checkfirst=True)
+        _create_indexes(conn, table)
+
+
+def _create_indexes(conn, table):
+    """Создает отсутствующие индексы таблицы"""
+    existing = {index['name'] for index in inspect(conn).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(conn)
+
+
+def _add_columns(conn, table_name, *columns):
+    """Добавляет отсутствующие колонки; columns - объекты Column"""
+    existing = {column['name'] for column in inspect(conn).get_columns(table_name)}
+    for column in columns:
+        if column.name in existing:
+            continue
+        ddl = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+        conn.execute(text(ddl))
+
+
+def _is_legacy_orders(conn):
+    # До разделения корзин и заказов строка orders была позицией корзины
+    columns = {column['name'] for column in inspect(conn).get_columns('orders')}
+    return 'product_id' in columns
+
+
+def _initial_schema(conn):
+    # Исходная схема бота; id пользователей Telegram сразу 64-битные
+    _create_tables(
+        conn,
+        _table(
+            'products',
+            Column('id', Integer, primary_key=True),
+            Column('name', String),
+            Column('description', String),
+            Column('price', Float),
+            Column('category', String),
+            Column('image_url', String),
+            Column('is_special', Integer),
+            Column('discount', Float),
+        ),
+        _table(
+            'orders',
+            Column('id', Integer, primary_key=True),
+            Column('user_id', BigInteger),
+            Column('product_id', Integer),
+            Column('quantity', Integer),
+            Column('created_at', DateTime),
+            Column('status', String),
+        ),
+        _table(
+            'admins',
+            Column('id', Integer, primary_key=True),
+            Column('user_id', BigInteger, unique=True),
+            Column('username', String),
+            Column('is_active', Boolean),
+        ),
+    )
+
+
+def _orders_indexes(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_category ON products (category)"))
+    if not _is_legacy_orders(conn):
+        return
+    # Перед созданием уникального индекса объединяем повторяющиеся строки корзины
+    conn.execute(text(
+        "UPDATE orders SET quantity = ("
+        "  SELECT SUM(o.quantity) FROM orders o"
+        "  WHERE o.user_id = orders.user_id AND o.product_id = orders.product_id"
+        "  AND o.status = 'pending'"
+        ") WHERE status = 'pending' AND id IN ("
+        "  SELECT MIN(id) FROM orders WHERE status = 'pending' GROUP BY user_id, product_id"
+        ")"
+    ))
+    conn.execute(text(
+        "DELETE FROM orders WHERE status = 'pending' AND id NOT IN ("
+        "  SELECT MIN(id) FROM orders WHERE status = 'pending' GROUP BY user_id, product_id"
+        ")"
+    ))
+    for name, columns in (
+        ('ix_orders_user_status', 'user_id, status'),
+        ('ix_orders_status_id', 'status, id'),
+    ):
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON orders ({columns})"))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_orders_pending_user_product"
+        " ON orders (user_id, product_id) WHERE status = 'pending'"
+    ))
+
+
+def _scheduled_messages(conn):
+    _create_tables(conn, _table(
+        'scheduled_messages',
+        Column('id', Integer, primary_key=True),
+        Column('chat_id', BigInteger),
+        Column('text', String),
+        Column('run_at', DateTime, index=True),
+        Column('sent_at', DateTime, nullable=True),
+    ))
+
+
+def _product_file_ids(conn):
+    _add_columns(conn, 'products', Column('image_file_id', String), Column('image_file_url', String))
+
+
+def _fsm_states(conn):
+    _create_tables(conn, _table(
+        'fsm_states',
+        Column('key', String, primary_key=True),
+        Column('state', String, nullable=True),
+        Column('data', Text, nullable=True),
+        Column('updated_at', DateTime, index=True),
+    ))
+
+
+def _feedback(conn):
+    _create_tables(conn, _table(
+        'feedback',
+        Column('id', Integer, primary_key=True),
+        Column('user_id', BigInteger, index=True),
+        Column('username', String, nullable=True),
+        Column('text', Text),
+        Column('created_at', DateTime),
+    ))
+
+
+def _cache_versions(conn):
+    _create_tables(conn, _table(
+        'cache_versions',
+        Column('name', String, primary_key=True),
+        Column('version', Integer, nullable=False),
+    ))
+    exists = conn.execute(text("SELECT 1 FROM cache_versions WHERE name = 'admins'")).first()
+    if not exists:
+        conn.execute(text("INSERT INTO cache_versions (name, version) VALUES ('admins', 0)"))
+
+
+def _checkouts(conn):
+    _create_tables(conn, _table(
+        'checkouts',
+        Column('id', Integer, primary_key=True),
+        Column('idempotency_key', String, unique=True, nullable=False),
+        Column('user_id', BigInteger),
+        Column('text', Text, nullable=True),
+        Column('created_at', DateTime),
+    ))
+    _add_columns(conn, 'orders', Column('checkout_id', Integer, nullable=True))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_checkout ON orders (checkout_id)"))
+
+
+def _split_orders(conn):
+    legacy = _is_legacy_orders(conn)
+    if legacy:
+        # Имена индексов общие для всей базы, освобождаем их для новой таблицы orders
+        for name in ('ix_orders_user_status', 'ix_orders_status_id', 'uq_orders_pending_user_product', 'ix_orders_checkout'):
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text("ALTER TABLE orders RENAME TO legacy_orders"))
+    orders = _table(
+        'orders',
+        Column('id', Integer, primary_key=True),
+        Column('user_id', BigInteger),
+        Column('status', String),
+        Column('total', Float, nullable=False),
+        Column('created_at', DateTime),
+        Column('checkout_id', Integer, nullable=True),
+        Index('ix_orders_user_id', 'user_id', 'id'),
+        Index('ix_orders_created_at', 'created_at'),
+        Index('ix_orders_checkout', 'checkout_id'),
+    )
+    order_items = _table(
+        'order_items',
+        Column('id', Integer, primary_key=True),
+        Column('order_id', Integer, nullable=False, index=True),
+        Column('product_id', Integer),
+        Column('name', String),
+        Column('quantity', Integer, nullable=False),
+        Column('unit_price', Float, nullable=False),
+        Column('discount', Float),
+    )
+    _create_tables(
+        conn,
+        _table(
+            'carts',
+            Column('id', Integer, primary_key=True),
+            Column('user_id', BigInteger, unique=True, nullable=False),
+            Column('created_at', DateTime),
+            Column('updated_at', DateTime),
+        ),
+        _table(
+            'cart_items',
+            Column('id', Integer, primary_key=True),
+            Column('cart_id', Integer, nullable=False),
+            Column('product_id', Integer, nullable=False),
+            Column('quantity', Integer, nullable=False),
+            Column('created_at', DateTime),
+            Index('uq_cart_items_cart_product', 'cart_id', 'product_id', unique=True),
+        ),
+        orders,
+        order_items,
+    )
+    if not legacy:
+        return
+
+    # Корзины: строки со статусом pending
+    conn.execute(text(
+        "INSERT INTO carts (user_id, created_at, updated_at)"
+        " SELECT user_id, MIN(created_at), MAX(created_at) FROM legacy_orders"
+        " WHERE status = 'pending' GROUP BY user_id"
+    ))
+    conn.execute(text(
+        "INSERT INTO cart_items (cart_id, product_id, quantity, created_at)"
+        " SELECT carts.id, legacy_orders.product_id, legacy_orders.quantity, legacy_orders.created_at"
+        " FROM legacy_orders JOIN carts ON carts.user_id = legacy_orders.user_id"
+        " WHERE legacy_orders.status = 'pending'"
+    ))
+
+    # Заказы: строки одного оформления объединяются в один заказ, старые строки
+    # без оформления становятся отдельными заказами. Цена прошлых заказов не
+    # сохранялась, поэтому фиксируется текущая цена товара.
+    rows = conn.execute(text(
+        "SELECT o.id, o.user_id, o.product_id, o.quantity, o.created_at, o.checkout_id,"
+        " c.created_at AS checkout_at, p.name, p.price, p.discount"
+        " FROM legacy_orders o"
+        " LEFT JOIN checkouts c ON c.id = o.checkout_id"
+        " LEFT JOIN products p ON p.id = o.product_id"
+        " WHERE o.status <> 'pending' ORDER BY o.id"
+    ).columns(created_at=DateTime, checkout_at=DateTime)).all()
+    groups = defaultdict(list)
+    for row in rows:
+        groups[('checkout', row.checkout_id) if row.checkout_id else ('row', row.id)].append(row)
+
+    for lines in groups.values():
+        first = lines[0]
+        items = []
+        for row in lines:
+            discount = row.discount or 0.0
+            unit_price, _ = format_price(row.price or 0.0, discount)
+            items.append({
+                'product_id': row.product_id,
+                'name': row.name,
+                'quantity': row.quantity,
+                'unit_price': unit_price,
+                'discount': discount,
+            })
+        order_id = conn.execute(
+            orders.insert().returning(orders.c.id),
+            {
+                'user_id': first.user_id,
+                'status': 'completed',
+                'total': sum(item['unit_price'] * item['quantity'] for item in items),
+                'created_at': first.checkout_at or first.created_at,
+                'checkout_id': first.checkout_id,
+            },
+        ).scalar()
+        conn.execute(order_items.insert(), [dict(item, order_id=order_id) for item in items])
+
+    conn.execute(text("DROP TABLE legacy_orders"))
+
+
+def _sales_rollups(conn):
+    _create_tables(
+        conn,
+        _table(
+            'sales_daily',
+            Column('day', Date, primary_key=True),
+            Column('product_id', Integer, primary_key=True),
+            Column('promo', Boolean, primary_key=True),
+            Column('category', String),
+            Column('units', Integer, nullable=False),
+            Column('revenue', Float, nullable=False),
+            Column('hours', Integer, nullable=False),
+            Column('last_hour', Integer, nullable=False),
+        ),
+        _table(
+            'demand_hourly',
+            Column('day', Date, primary_key=True),
+            Column('hour', Integer, primary_key=True),
+            Column('units', Integer, nullable=False),
+        ),
+    )
+    if conn.execute(text("SELECT 1 FROM sales_daily")).first():
+        return
+    # Сводки по уже оформленным заказам; признак акции восстанавливается по скидке
+    if conn.dialect.name == 'postgresql':
+        day, hour = "CAST(o.created_at AS DATE)", "CAST(EXTRACT(HOUR FROM o.created_at) AS INTEGER)"
+    else:
+        day, hour = "date(o.created_at)", "CAST(strftime('%H', o.created_at) AS INTEGER)"
+    conn.execute(text(
+        "INSERT INTO sales_daily (day, product_id, promo, category, units, revenue, hours, last_hour)"
+        f" SELECT {day}, i.product_id, i.discount > 0, MAX(p.category),"
+        f" SUM(i.quantity), SUM(i.quantity * i.unit_price), COUNT(DISTINCT {hour}), MAX({hour})"
+        " FROM order_items i"
+        " JOIN orders o ON o.id = i.order_id"
+        " LEFT JOIN products p ON p.id = i.product_id"
+        f" GROUP BY {day}, i.product_id, i.discount > 0"
+    ))
+    conn.execute(text(
+        "INSERT INTO demand_hourly (day, hour, units)"
+        f" SELECT {day}, {hour}, SUM(i.quantity)"
+        " FROM order_items i JOIN orders o ON o.id = i.order_id"
+        f" GROUP BY {day}, {hour}"
+    ))
+
+
+def _cart_versions(conn):
+    _add_columns(conn, 'carts', Column('version', Integer, nullable=False, server_default='0'))
+    # Колонка без NOT NULL из прежней версии этой миграции
+    conn.execute(text("UPDATE carts SET version = 0 WHERE version IS NULL"))
+
+
+def _promotions(conn):
+    _create_tables(conn, _table(
+        'promotions',
+        Column('id', Integer, primary_key=True),
+        Column('title', String, nullable=True),
+        Column('product_id', Integer, nullable=True),
+        Column('category', String, nullable=True),
+        Column('discount', Float, nullable=False),
+        Column('starts_at', DateTime, nullable=False),
+        Column('ends_at', DateTime, nullable=False),
+        Column('key', String, unique=True, nullable=True),
+        Column('created_at', DateTime),
+        Index('ix_promotions_ends_at', 'ends_at'),
+    ))
+    exists = conn.execute(text("SELECT 1 FROM cache_versions WHERE name = 'promotions'")).first()
+    if not exists:
+        conn.execute(text("INSERT INTO cache_versions (name, version) VALUES ('promotions', 0)"))
+
+
+# Список миграций: (версия, описание, функция). Новые миграции добавляются в конец.
+MIGRATIONS = [
+    (1, "Начальная схема", _initial_schema),
+    (2, "Индексы для корзины, отчетов и категорий", _orders_indexes),
+    (3, "Таблица отложенных сообщений", _scheduled_messages),
+    (4, "Кэш file_id фотографий товаров", _product_file_ids),
+    (5, "Хранилище состояний FSM", _fsm_states),
+    (6, "Отзывы пользователей", _feedback),
+    (7, "Версии кэшей бота", _cache_versions),
+    (8, "Идемпотентное оформление заказов", _checkouts),
+    (9, "Раздельные корзины и заказы с фиксированными ценами", _split_orders),
+    (10, "Сводки продаж для аналитики", _sales_rollups),
+    (11, "Версии корзин", _cart_versions),
+    (12, "Акции по расписанию", _promotions),
+]
+
+
+def get_version(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+
+# Ключ рекомендательной блокировки PostgreSQL, под которой применяются миграции
+MIGRATION_LOCK_ID = 20240101
+
+
+def upgrade(conn):
+    """Применяет все недостающие миграции"""
+    if conn.dialect.name == 'postgresql':
+        # Реплики, запущенные одновременно, применяют миграции по очереди:
+        # следующая прочитает версию после фиксации предыдущей.
+        # Блокировка снимается в конце транзакции
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+    current = get_version(conn)
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        logging.info(f"Применяется миграция {version}: {description}")
+        migration(conn)
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+    return get_version(conn)
+
+
+async def migrate():
+    """Применяет миграции через асинхронный движок при запуске бота"""
+    async with async_engine.begin() as conn:
+        return await conn.run_sync(upgrade)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    with engine.begin() as conn:
+        version = upgrade(conn)
+    print(f"Версия схемы: {version}")
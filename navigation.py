@@ -0,0 +1,101 @@
+import logging
+from dataclasses import dataclass
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputMediaPhoto
+
+from outbox import outbox
+
+# Ключ данных FSM, в котором хранится последний показанный пользователю экран
+NAVIGATION_KEY = 'nav'
+
+
+@dataclass(frozen=True)
+class Screen:
+    text: str
+    reply_markup: object = None
+    photo: str = None
+    key: str = None  # идентификатор экрана, чтобы не перерисовывать одинаковый экран
+
+
+@dataclass(frozen=True)
+class NavigationState:
+    message_id: int
+    has_photo: bool
+    key: str
+
+
+def _is_not_modified(error):
+    return "message is not modified" in str(error)
+
+
+async def _replace(message, screen):
+    """Удаляет сообщение и отправляет экран заново (два запроса к API)"""
+    try:
+        await outbox.send(message.delete())
+    except TelegramBadRequest as e:
+        # Сообщение могло быть уже удалено
+        logging.warning(f"Не удалось удалить сообщение: {e}")
+    if screen.photo:
+        return await outbox.send(message.answer_photo(
+            photo=screen.photo, caption=screen.text, reply_markup=screen.reply_markup
+        ))
+    return await outbox.send(message.answer(screen.text, reply_markup=screen.reply_markup))
+
+
+async def _edit(message, screen):
+    """Изменяет сообщение на месте одним запросом, если позволяют типы сообщений"""
+    has_photo = bool(message.photo)
+    if screen.photo and has_photo:
+        return await outbox.send(message.edit_media(
+            InputMediaPhoto(media=screen.photo, caption=screen.text),
+            reply_markup=screen.reply_markup,
+        ))
+    if not screen.photo and not has_photo:
+        if message.text == screen.text:
+            return await outbox.send(message.edit_reply_markup(reply_markup=screen.reply_markup))
+        return await outbox.send(message.edit_text(screen.text, reply_markup=screen.reply_markup))
+    # Текстовое сообщение нельзя превратить в фото и наоборот
+    return None
+
+
+async def shown_screen(state):
+    """Последний показанный экран: NavigationState или None"""
+    data = (await state.get_data()).get(NAVIGATION_KEY)
+    return NavigationState(*data) if data else None
+
+
+async def render(callback, screen, state):
+    """Показывает экран в ответ на нажатие кнопки и возвращает сообщение с ним.
+
+    Сообщение редактируется на месте, когда текущий и новый экран одного
+    типа, иначе старое сообщение удаляется и отправляется новое.
+    Последний экран запоминается в хранилище FSM пользователя.
+    """
+    message = callback.message
+    shown = await shown_screen(state)
+    if screen.key and shown and shown.message_id == message.message_id and shown.key == screen.key:
+        # Экран уже показан в этом сообщении
+        return message
+
+    try:
+        result = await _edit(message, screen)
+    except TelegramBadRequest as e:
+        if _is_not_modified(e):
+            result = message
+        else:
+            logging.warning(f"Не удалось изменить сообщение, отправляем новое: {e}")
+            result = None
+
+    if result is None:
+        result = await _replace(message, screen)
+    elif result is True:
+        # Для сообщений не от бота Telegram возвращает True вместо сообщения
+        result = message
+
+    await remember(state, result, screen)
+    return result
+
+
+async def remember(state, message, screen):
+    """Запоминает экран, отправленный новым сообщением, как текущий"""
+    await state.update_data({NAVIGATION_KEY: [message.message_id, bool(screen.photo), screen.key]})
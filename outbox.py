@@ -0,0 +1,198 @@
+import asyncio
+import itertools
+import logging
+import time
+from enum import IntEnum
+from aiogram.exceptions import TelegramRetryAfter
+
+import config
+
+# После скольких отслеживаемых чатов удалять неактивные
+MAX_TRACKED_CHATS = 10000
+
+
+class Priority(IntEnum):
+    """Приоритеты исходящих запросов: чем меньше значение, тем раньше отправка"""
+    USER = 0  # ответы на действия пользователя
+    NOTIFICATION = 1  # отложенные уведомления
+    REPORT = 2  # отчеты администратора
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Сколько секунд ждать до появления токена (0 - можно отправлять)"""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class Outbox:
+    """Единая очередь исходящих запросов к Telegram Bot API.
+
+    Запросы отправляются в порядке приоритета с ограничением скорости: общий
+    token bucket на бота и отдельный на каждый чат. При ответе RetryAfter
+    запрос повторяется после указанной паузы, а чат (или весь бот) ставится
+    на паузу. Запросы в один чат выполняются строго по очереди.
+    """
+
+    def __init__(self, global_rate=None, chat_rate=None, chat_burst=None, max_retries=3):
+        self.global_bucket = TokenBucket(global_rate or config.OUTBOX_GLOBAL_RATE, global_rate or config.OUTBOX_GLOBAL_RATE)
+        self.chat_rate = chat_rate or config.OUTBOX_CHAT_RATE
+        self.chat_burst = chat_burst or config.OUTBOX_CHAT_BURST
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._chat_locks = {}
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._deferred = 0
+        self._task = None
+        # Ссылки на выполняемые запросы: задачу без ссылки может собрать сборщик мусора
+        self._running = set()
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def send(self, method, priority=Priority.USER):
+        """Ставит запрос в очередь и возвращает future с его результатом.
+
+        method - объект запроса aiogram, привязанный к боту, например
+        message.answer(...) или SendMessage(...).as_(bot).
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        chat_id = getattr(method, 'chat_id', None)
+        self._queue.put_nowait((priority, next(self._seq), time.monotonic(), chat_id, method, future, 0))
+        return future
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_TRACKED_CHATS:
+                self._prune()
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune(self):
+        """Забывает чаты, квота которых полностью восстановилась"""
+        now = time.monotonic()
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            bucket._refill(now)
+            lock = self._chat_locks.get(chat_id)
+            if bucket.tokens >= bucket.capacity and now >= bucket.paused_until and not (lock and lock.locked()):
+                del self._chat_buckets[chat_id]
+                self._chat_locks.pop(chat_id, None)
+
+    def _defer(self, item, delay):
+        """Возвращает запрос в очередь через delay секунд, сохраняя его место в порядке"""
+        self._deferred += 1
+
+        def put_back():
+            self._deferred -= 1
+            self._queue.put_nowait(item)
+
+        asyncio.get_running_loop().call_later(delay, put_back)
+
+    async def _dispatch(self):
+        while True:
+            item = await self._queue.get()
+            chat_id = item[3]
+
+            if chat_id is not None:
+                chat_delay = self._chat_bucket(chat_id).delay()
+                if chat_delay > 0:
+                    # Не задерживаем другие чаты, пока этот ждет своей квоты
+                    self._defer(item, chat_delay)
+                    continue
+
+            global_delay = self.global_bucket.delay()
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                global_delay = self.global_bucket.delay()
+                if global_delay > 0:
+                    self._defer(item, global_delay)
+                    continue
+
+            self.global_bucket.take()
+            if chat_id is not None:
+                self._chat_bucket(chat_id).take()
+            task = asyncio.create_task(self._execute(item))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, item):
+        priority, seq, enqueued_at, chat_id, method, future, attempt = item
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock()) if chat_id is not None else None
+
+        if attempt == 0:
+            wait = time.monotonic() - enqueued_at
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+        try:
+            if lock is not None:
+                async with lock:
+                    result = await method
+            else:
+                result = await method
+        except TelegramRetryAfter as e:
+            if attempt >= self.max_retries:
+                self.failed += 1
+                future.set_exception(e)
+                return
+            logging.warning(f"Превышен лимит Telegram, повтор через {e.retry_after} с")
+            self.retries += 1
+            if chat_id is not None:
+                self._chat_bucket(chat_id).pause(e.retry_after)
+            else:
+                self.global_bucket.pause(e.retry_after)
+            self._defer((priority, seq, enqueued_at, chat_id, method, future, attempt + 1), e.retry_after)
+            return
+        except Exception as e:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        self.sent += 1
+        if not future.done():
+            future.set_result(result)
+
+    def stats(self):
+        """Метрики очереди: глубина, ожидание и счетчики отправок"""
+        started = self.sent + self.failed
+        return {
+            'queue_depth': self._queue.qsize() + self._deferred,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'wait_avg': self.wait_total / started if started else 0.0,
+            'wait_max': self.wait_max,
+        }
+
+
+outbox = Outbox()
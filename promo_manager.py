@@ -0,0 +1,122 @@
+import argparse
+from datetime import datetime, timedelta
+from database import Session, Product, Promotion, bump_version
+
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def parse_time(value):
+    return datetime.strptime(value, DATE_FORMAT)
+
+
+def add_promotion(discount, starts_at, ends_at, product_id=None, category=None, title=None):
+    """Добавляет акцию на товар или категорию"""
+    session = Session()
+    if product_id is not None and session.get(Product, product_id) is None:
+        print(f"Товар с ID {product_id} не найден")
+        session.close()
+        return
+
+    promotion = Promotion(
+        title=title,
+        product_id=product_id,
+        category=category,
+        discount=discount / 100,
+        starts_at=starts_at,
+        ends_at=ends_at,
+    )
+    session.add(promotion)
+    # Бот перечитает акции без перезапуска
+    session.execute(bump_version('promotions'))
+    session.commit()
+    print(f"Акция #{promotion.id} добавлена: -{discount:g}% с {starts_at:{DATE_FORMAT}} до {ends_at:{DATE_FORMAT}}")
+    session.close()
+
+
+def list_promotions(show_all=False):
+    """Выводит действующие и будущие акции (с show_all - все)"""
+    session = Session()
+    query = session.query(Promotion).order_by(Promotion.starts_at)
+    if not show_all:
+        query = query.filter(Promotion.ends_at > datetime.now())
+    promotions = query.all()
+
+    if not promotions:
+        print("Акции не найдены")
+        session.close()
+        return
+
+    print("\nСписок акций:")
+    print("-" * 80)
+    print(f"{'ID':<6} {'Товар/категория':<20} {'Скидка':<8} {'Начало':<18} {'Конец':<18} {'Название'}")
+    print("-" * 80)
+    for promotion in promotions:
+        target = f"товар {promotion.product_id}" if promotion.product_id is not None else promotion.category
+        discount = f"{promotion.discount * 100:g}%"
+        print(
+            f"{promotion.id:<6} {target:<20} {discount:<8} "
+            f"{promotion.starts_at:{DATE_FORMAT}}  {promotion.ends_at:{DATE_FORMAT}}  {promotion.title or ''}"
+        )
+    session.close()
+
+
+def remove_promotion(promotion_id):
+    """Удаляет акцию по id"""
+    session = Session()
+    promotion = session.get(Promotion, promotion_id)
+
+    if not promotion:
+        print(f"Акция с ID {promotion_id} не найдена")
+        session.close()
+        return
+
+    session.delete(promotion)
+    session.execute(bump_version('promotions'))
+    session.commit()
+    print(f"Акция #{promotion_id} удалена")
+    session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Управление акциями бота')
+    subparsers = parser.add_subparsers(dest='command', help='Команды')
+
+    # Команда добавления акции
+    add_parser = subparsers.add_parser('add', help='Добавить акцию')
+    target = add_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--product', type=int, help='ID товара')
+    target.add_argument('--category', choices=['sweet', 'savory'], help='Категория товаров')
+    add_parser.add_argument('--discount', type=float, required=True, help='Скидка в процентах')
+    add_parser.add_argument('--start', type=parse_time, help=f'Начало, {DATE_FORMAT.replace("%", "")} (по умолчанию сейчас)')
+    add_parser.add_argument('--end', type=parse_time, help=f'Конец, {DATE_FORMAT.replace("%", "")}')
+    add_parser.add_argument('--hours', type=float, default=24, help='Длительность в часах, если не указан конец')
+    add_parser.add_argument('--title', help='Название акции')
+
+    # Команда удаления акции
+    remove_parser = subparsers.add_parser('remove', help='Удалить акцию')
+    remove_parser.add_argument('promotion_id', type=int, help='ID акции')
+
+    # Команда просмотра списка акций
+    list_parser = subparsers.add_parser('list', help='Показать действующие и будущие акции')
+    list_parser.add_argument('--all', action='store_true', help='Показать и закончившиеся акции')
+
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        if not 0 < args.discount < 100:
+            parser.error("скидка должна быть от 0 до 100 процентов")
+        starts_at = args.start or datetime.now().replace(second=0, microsecond=0)
+        ends_at = args.end or starts_at + timedelta(hours=args.hours)
+        if ends_at <= starts_at:
+            parser.error("конец акции должен быть позже начала")
+        add_promotion(args.discount, starts_at, ends_at, args.product, args.category, args.title)
+    elif args.command == 'remove':
+        remove_promotion(args.promotion_id)
+    elif args.command == 'list':
+        list_promotions(args.all)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import logging
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+
+import config
+from catalog import catalog
+from database import async_session, dialect_insert, Product, Promotion, CacheVersion
+
+
+@dataclass(frozen=True)
+class PromoWindow:
+    id: int
+    title: str
+    product_id: int
+    category: str
+    discount: float
+    starts_at: datetime
+    ends_at: datetime
+    key: str
+
+    def products(self):
+        """id товаров, на которые действует акция"""
+        if self.product_id is not None:
+            return (self.product_id,)
+        return tuple(item.id for item in catalog.by_category(self.category))
+
+
+class PromotionEngine:
+    """Акции по расписанию из таблицы promotions.
+
+    Окна акций, которые еще не закончились, держатся в памяти, а их начала
+    и концы - в куче, поэтому фоновая задача просыпается ровно на ближайшей
+    границе окна (и не реже refresh_interval, чтобы заметить новые акции по
+    версии 'promotions' в cache_versions). Действующие скидки собраны в
+    индекс product_id -> скидка; при пересчете в базе и в каталоге меняются
+    только товары, скидка которых изменилась. Если на товар действует
+    несколько акций, берется наибольшая скидка.
+
+    Каждый час создается автоматическая акция на случайный товар со скидкой
+    rotation_discount; ключ часа не дает репликам создать ее дважды.
+    """
+
+    def __init__(self, refresh_interval=None, rotation_discount=None):
+        self.refresh_interval = refresh_interval or config.PROMO_REFRESH_INTERVAL
+        self.rotation_discount = config.PROMO_ROTATION_DISCOUNT if rotation_discount is None else rotation_discount
+        self.version = None
+        self._windows = {}
+        self._boundaries = []
+        self._active = {}
+        self._task = None
+
+    def active_windows(self, now=None):
+        now = now or datetime.now()
+        return [window for window in self._windows.values() if window.starts_at <= now < window.ends_at]
+
+    async def _get_version(self, session):
+        result = await session.execute(select(CacheVersion.version).where(CacheVersion.name == 'promotions'))
+        return result.scalar()
+
+    async def load(self):
+        """Перечитывает незакончившиеся акции и применяет действующие скидки"""
+        now = datetime.now()
+        async with async_session() as session:
+            version = await self._get_version(session)
+            result = await session.execute(select(Promotion).where(Promotion.ends_at > now))
+            windows = [
+                PromoWindow(
+                    id=promotion.id,
+                    title=promotion.title,
+                    product_id=promotion.product_id,
+                    category=promotion.category,
+                    discount=promotion.discount,
+                    starts_at=promotion.starts_at,
+                    ends_at=promotion.ends_at,
+                    key=promotion.key,
+                )
+                for promotion in result.scalars()
+            ]
+        self.version = version
+        self._windows = {window.id: window for window in windows}
+        self._boundaries = []
+        for window in windows:
+            if window.starts_at > now:
+                self._boundaries.append(window.starts_at)
+            self._boundaries.append(window.ends_at)
+        heapq.heapify(self._boundaries)
+        # Новые скидки сравниваются с каталогом; товар с флагом акции без скидки тоже сбрасывается
+        self._active = {
+            item.id: item.discount if item.discount and item.is_special else None
+            for item in catalog.all() if item.discount or item.is_special
+        }
+        await self._recompute(now)
+
+    async def _recompute(self, now):
+        active = {}
+        for window in self.active_windows(now):
+            for product_id in window.products():
+                active[product_id] = max(active.get(product_id, 0.0), window.discount)
+
+        changes = {
+            product_id: active.get(product_id, 0.0)
+            for product_id in self._active.keys() | active.keys()
+            if self._active.get(product_id, 0.0) != active.get(product_id, 0.0)
+        }
+        self._active = active
+        if not changes:
+            return
+        async with async_session() as session:
+            await session.execute(update(Product), [
+                {'id': product_id, 'discount': discount, 'is_special': int(discount > 0)}
+                for product_id, discount in changes.items()
+            ])
+            await session.commit()
+        await catalog.set_discounts(changes)
+        logging.info(f"Акции пересчитаны, изменены скидки товаров: {sorted(changes)}")
+
+    async def _ensure_rotation(self, now):
+        """Создает акцию часа, если ее еще нет; возвращает True, если акции нужно перечитать"""
+        if not self.rotation_discount:
+            return False
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        key = f"rotation:{hour:%Y%m%d%H}"
+        if any(window.key == key for window in self._windows.values()):
+            return False
+        products = catalog.all()
+        if not products:
+            return False
+        product = random.choice(products)
+        async with async_session() as session:
+            await session.execute(
+                dialect_insert(Promotion)
+                .values(
+                    title="Акция часа",
+                    product_id=product.id,
+                    discount=self.rotation_discount,
+                    starts_at=hour,
+                    ends_at=hour + timedelta(hours=1),
+                    key=key,
+                    created_at=now,
+                )
+                .on_conflict_do_nothing(index_elements=[Promotion.key])
+            )
+            await session.commit()
+        return True
+
+    async def refresh(self):
+        """Применяет наступившие границы окон и изменения таблицы акций"""
+        now = datetime.now()
+        async with async_session() as session:
+            version = await self._get_version(session)
+        changed = version != self.version
+        if await self._ensure_rotation(now):
+            changed = True
+        if changed:
+            await self.load()
+            return
+        due = False
+        while self._boundaries and self._boundaries[0] <= now:
+            heapq.heappop(self._boundaries)
+            due = True
+        if due:
+            # Закончившиеся окна больше не нужны
+            self._windows = {window.id: window for window in self._windows.values() if window.ends_at > now}
+            await self._recompute(now)
+
+    def _sleep_time(self):
+        if not self._boundaries:
+            return self.refresh_interval
+        until_boundary = (self._boundaries[0] - datetime.now()).total_seconds()
+        return max(0.0, min(self.refresh_interval, until_boundary))
+
+    async def start(self):
+        await self.load()
+        if await self._ensure_rotation(datetime.now()):
+            await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._sleep_time())
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Ошибка при обновлении акций: {e}")
+                await asyncio.sleep(self.refresh_interval)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+
+promotion_engine = PromotionEngine()
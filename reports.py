@@ -0,0 +1,197 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from aiogram.types import InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy import select, func, cast, String
+
+from callbacks import ReportCallback
+from database import async_session, Order, OrderItem, Cart, CartItem, Product, Feedback
+
+# Количество строк на странице отчета
+PAGE_SIZE = 10
+# Ограничение Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+
+
+def _format_order(row):
+    return (
+        f"Заказ #{row.id}\n"
+        f"Пользователь: {row.user_id}\n"
+        f"Товары: {row.items}\n"
+        f"Сумма: {row.total:.2f} руб.\n"
+        f"Дата: {row.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"Статус: {row.status}\n\n"
+    )
+
+
+def _format_cart(row):
+    return (
+        f"Корзина пользователя: {row.user_id}\n"
+        f"Товар: {row.name}\n"
+        f"Количество: {row.quantity}\n"
+        f"Дата добавления: {row.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+    )
+
+
+# Длинные отзывы в отчете обрезаются, чтобы на странице помещалось несколько записей
+FEEDBACK_PREVIEW = 500
+
+
+def _format_feedback(row):
+    text = row.text if len(row.text) <= FEEDBACK_PREVIEW else row.text[:FEEDBACK_PREVIEW] + "…"
+    author = f"@{row.username} ({row.user_id})" if row.username else row.user_id
+    return (
+        f"Отзыв #{row.id} от {author}\n"
+        f"Дата: {row.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"{text}\n\n"
+    )
+
+
+# Позиции заказа одной строкой: "Название x2, Название x1"
+_ORDER_ITEMS = (
+    select(func.aggregate_strings(OrderItem.name + " x" + cast(OrderItem.quantity, String), ", "))
+    .where(OrderItem.order_id == Order.id)
+    .scalar_subquery()
+)
+
+# Вид отчета: (запрос, колонки id/пользователя/даты для фильтра и пагинации,
+# заголовок, текст для пустого отчета, форматирование строки)
+REPORTS = {
+    'o': (
+        select(Order.id, Order.user_id, Order.total, Order.created_at, Order.status, _ORDER_ITEMS.label('items'))
+        .where(Order.status == 'completed'),
+        (Order.id, Order.user_id, Order.created_at),
+        "Список оформленных заказов:", "Нет оформленных заказов", _format_order,
+    ),
+    'c': (
+        select(CartItem.id, Cart.user_id, CartItem.quantity, CartItem.created_at, Product.name)
+        .join(Cart, Cart.id == CartItem.cart_id)
+        .join(Product, Product.id == CartItem.product_id),
+        (CartItem.id, Cart.user_id, CartItem.created_at),
+        "Список активных корзин:", "Нет активных корзин", _format_cart,
+    ),
+    'f': (
+        select(Feedback.id, Feedback.user_id, Feedback.username, Feedback.text, Feedback.created_at),
+        (Feedback.id, Feedback.user_id, Feedback.created_at),
+        "Отзывы пользователей:", "Отзывов пока нет", _format_feedback,
+    ),
+}
+
+
+@dataclass(frozen=True)
+class ReportFilter:
+    user_id: int = None
+    date_from: date = None
+    date_to: date = None
+
+    def callback(self, kind, direction, cursor):
+        """Упаковывает фильтр и позицию страницы в callback_data кнопки"""
+        return ReportCallback(
+            kind=kind,
+            direction=direction,
+            cursor=cursor,
+            user_id=self.user_id,
+            date_from=self.date_from.strftime('%Y%m%d') if self.date_from else None,
+            date_to=self.date_to.strftime('%Y%m%d') if self.date_to else None,
+        ).pack()
+
+    @classmethod
+    def from_callback(cls, callback_data):
+        return cls(
+            user_id=callback_data.user_id,
+            date_from=datetime.strptime(callback_data.date_from, '%Y%m%d').date() if callback_data.date_from else None,
+            date_to=datetime.strptime(callback_data.date_to, '%Y%m%d').date() if callback_data.date_to else None,
+        )
+
+    def criteria(self, user_id_column=Order.user_id, created_at_column=Order.created_at):
+        criteria = []
+        if self.user_id:
+            criteria.append(user_id_column == self.user_id)
+        if self.date_from:
+            criteria.append(created_at_column >= datetime.combine(self.date_from, datetime.min.time()))
+        if self.date_to:
+            # Дата окончания включается в отчет целиком
+            criteria.append(created_at_column < datetime.combine(self.date_to + timedelta(days=1), datetime.min.time()))
+        return criteria
+
+
+def parse_filter(args):
+    """Разбирает аргументы команды вида: user=123 from=2024-01-01 to=2024-01-31
+
+    При неверном формате выбрасывает ValueError.
+    """
+    values = {}
+    for arg in (args or "").split():
+        key, _, value = arg.partition("=")
+        if key == "user":
+            values['user_id'] = int(value)
+        elif key == "from":
+            values['date_from'] = datetime.strptime(value, '%Y-%m-%d').date()
+        elif key == "to":
+            values['date_to'] = datetime.strptime(value, '%Y-%m-%d').date()
+        else:
+            raise ValueError(f"Неизвестный параметр: {arg}")
+    return ReportFilter(**values)
+
+
+async def build_page(kind, report_filter, cursor=None, direction='n'):
+    """Строит страницу отчета с keyset-пагинацией по id (новые записи сверху).
+
+    direction 'n' - записи старше cursor, 'p' - записи новее cursor.
+    Возвращает (текст, клавиатура); клавиатура None, если листать некуда.
+    """
+    query, (id_column, user_id_column, created_at_column), title, empty_text, format_row = REPORTS[kind]
+
+    stmt = query.where(*report_filter.criteria(user_id_column, created_at_column))
+    if direction == 'p':
+        stmt = stmt.where(id_column > cursor).order_by(id_column.asc())
+    else:
+        if cursor is not None:
+            stmt = stmt.where(id_column < cursor)
+        stmt = stmt.order_by(id_column.desc())
+    # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+    stmt = stmt.limit(PAGE_SIZE + 1).execution_options(yield_per=PAGE_SIZE + 1)
+
+    rows = []
+    has_more = False
+    length = len(title) + 2
+    async with async_session() as session:
+        result = await session.stream(stmt)
+        async for row in result:
+            text = format_row(row)
+            if len(rows) == PAGE_SIZE or length + len(text) > MESSAGE_LIMIT:
+                has_more = True
+                break
+            rows.append((row.id, text))
+            length += len(text)
+        await result.close()
+
+    if direction == 'p':
+        rows.reverse()
+
+    if not rows:
+        return empty_text, None
+
+    # Для прямого направления "еще" означает более старые записи, для обратного - более новые
+    has_newer = has_more if direction == 'p' else cursor is not None
+    has_older = True if direction == 'p' else has_more
+
+    keyboard = InlineKeyboardBuilder()
+    if has_newer:
+        keyboard.add(InlineKeyboardButton(text="⬅️ Назад", callback_data=report_filter.callback(kind, 'p', rows[0][0])))
+    if has_older:
+        keyboard.add(InlineKeyboardButton(text="Далее ➡️", callback_data=report_filter.callback(kind, 'n', rows[-1][0])))
+
+    text = title + "\n\n" + "".join(text for _, text in rows)
+    markup = keyboard.adjust(2).as_markup() if (has_newer or has_older) else None
+    return text, markup
+
+
+async def revenue(report_filter):
+    """Количество заказов и выручка по фиксированным суммам заказов"""
+    async with async_session() as session:
+        result = await session.execute(
+            select(func.count(Order.id), func.coalesce(func.sum(Order.total), 0))
+            .where(Order.status == 'completed', *report_filter.criteria())
+        )
+        return tuple(result.one())
@@ -0,0 +1,74 @@
+import inspect
+
+
+def _wants_state(handler):
+    return 'state' in inspect.signature(handler).parameters
+
+
+class Routes:
+    """Маршрутизация обновлений поиском по словарю.
+
+    Вместо последовательной проверки фильтров каждого обработчика текст кнопки
+    главного меню и префикс callback_data ищутся в словарях за O(1).
+    callback_data разбирается фабрикой CallbackData и передается обработчику
+    аргументом callback_data. Обработчикам с параметром state передается
+    FSMContext пользователя.
+    """
+
+    def __init__(self):
+        self._texts = {}
+        self._callbacks = {}
+
+    def text(self, *texts):
+        """Регистрирует обработчик сообщений с одним из указанных текстов"""
+        def decorator(handler):
+            route = (handler, _wants_state(handler))
+            for text in texts:
+                self._texts[text] = route
+            return handler
+        return decorator
+
+    def callback(self, factory):
+        """Регистрирует обработчик нажатий кнопок с callback_data фабрики"""
+        def decorator(handler):
+            self._callbacks[factory.__prefix__] = (factory, (handler, _wants_state(handler)))
+            return handler
+        return decorator
+
+    def match_text(self, message):
+        route = self._texts.get(message.text)
+        if route is None:
+            return False
+        return {'route': route}
+
+    def match_callback(self, callback):
+        data = callback.data or ""
+        prefix = data.split(":", 1)[0]
+        entry = self._callbacks.get(prefix)
+        if entry is None:
+            return False
+        factory, route = entry
+        try:
+            callback_data = factory.unpack(data)
+        except (TypeError, ValueError):
+            return False
+        return {'route': route, 'callback_data': callback_data}
+
+    def setup(self, dp):
+        """Подключает маршрутизатор к диспетчеру одним обработчиком на тип обновления"""
+        dp.message.register(_dispatch_message, self.match_text)
+        dp.callback_query.register(_dispatch_callback, self.match_callback)
+
+
+async def _dispatch_message(message, route, state):
+    handler, wants_state = route
+    if wants_state:
+        return await handler(message, state=state)
+    return await handler(message)
+
+
+async def _dispatch_callback(callback, route, callback_data, state):
+    handler, wants_state = route
+    if wants_state:
+        return await handler(callback, callback_data, state=state)
+    return await handler(callback, callback_data)
@@ -0,0 +1,125 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from aiogram.methods import SendMessage
+from sqlalchemy import select, update
+
+import config
+from database import async_session, ScheduledMessage
+from outbox import outbox, Priority
+
+
+class MessageScheduler:
+    """Планировщик отложенных сообщений.
+
+    Задания хранятся в таблице scheduled_messages и переживают перезапуск бота.
+    В памяти держится min-heap по времени отправки, а единственная фоновая
+    задача спит до ближайшего срока и отправляет созревшие сообщения пачками.
+    """
+
+    def __init__(self, batch_size=None, batch_interval=None):
+        self.batch_size = batch_size or config.SCHEDULER_BATCH_SIZE
+        self.batch_interval = batch_interval or config.SCHEDULER_BATCH_INTERVAL
+        self.bot = None
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def start(self, bot):
+        """Загружает неотправленные задания из базы и запускает таймер"""
+        self.bot = bot
+        async with async_session() as session:
+            result = await session.execute(
+                select(ScheduledMessage.id, ScheduledMessage.run_at, ScheduledMessage.chat_id, ScheduledMessage.text)
+                .where(ScheduledMessage.sent_at.is_(None))
+            )
+            self._heap = [(row.run_at, row.id, row.chat_id, row.text) for row in result]
+        heapq.heapify(self._heap)
+        if self._heap:
+            logging.info(f"Загружено отложенных сообщений: {len(self._heap)}")
+        self._task = asyncio.create_task(self._run())
+
+    async def schedule(self, chat_id, text, delay, session=None):
+        """Сохраняет сообщение и ставит его в очередь; возвращает время отправки.
+
+        Если передана сессия, задание записывается в ее транзакцию и фиксируется
+        вместе с остальными изменениями вызывающего кода.
+        """
+        run_at = datetime.now() + timedelta(seconds=delay)
+        job = ScheduledMessage(chat_id=chat_id, text=text, run_at=run_at)
+        if session is not None:
+            session.add(job)
+            await session.flush()
+        else:
+            async with async_session() as own_session:
+                own_session.add(job)
+                await own_session.commit()
+        job_id = job.id
+
+        heapq.heappush(self._heap, (run_at, job_id, chat_id, text))
+        # Будим таймер, только если новое задание стало ближайшим
+        if self._heap[0][1] == job_id:
+            self._wakeup.set()
+        return run_at
+
+    async def _wait(self):
+        self._wakeup.clear()
+        timeout = None
+        if self._heap:
+            timeout = max((self._heap[0][0] - datetime.now()).total_seconds(), 0)
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            try:
+                now = datetime.now()
+                if not self._heap or self._heap[0][0] > now:
+                    await self._wait()
+                    continue
+
+                batch = []
+                while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                    batch.append(heapq.heappop(self._heap))
+
+                await self._send_batch(batch)
+
+                # Ограничиваем скорость отправки, если созревших заданий больше одной пачки
+                if self._heap and self._heap[0][0] <= datetime.now():
+                    await asyncio.sleep(self.batch_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка при отправке отложенных сообщений: {e}")
+                await asyncio.sleep(self.batch_interval)
+
+    async def _send_batch(self, batch):
+        # Отмечаем задания отправленными до отправки: если бот запущен в нескольких
+        # репликах, каждое сообщение заберет только одна из них
+        async with async_session() as session:
+            result = await session.execute(
+                update(ScheduledMessage)
+                .where(ScheduledMessage.id.in_([job[1] for job in batch]), ScheduledMessage.sent_at.is_(None))
+                .values(sent_at=datetime.now())
+                .returning(ScheduledMessage.id)
+            )
+            claimed = set(result.scalars().all())
+            await session.commit()
+
+        for run_at, job_id, chat_id, text in batch:
+            if job_id not in claimed:
+                continue
+            try:
+                await outbox.send(SendMessage(chat_id=chat_id, text=text).as_(self.bot), priority=Priority.NOTIFICATION)
+            except Exception as e:
+                logging.error(f"Не удалось отправить отложенное сообщение {job_id}: {e}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+
+scheduler = MessageScheduler()
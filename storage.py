@@ -0,0 +1,210 @@
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from sqlalchemy import select, delete, func
+
+import config
+from database import async_session, dialect_insert, FsmRecord
+
+
+def _state_name(state):
+    return state.state if isinstance(state, State) else state
+
+
+def _data_size(data):
+    # Оценка памяти по размеру сериализованных данных
+    return len(json.dumps(data, ensure_ascii=False, default=str)) if data else 0
+
+
+class MemoryLRUStorage(BaseStorage):
+    """Хранилище FSM в памяти процесса с ограничением размера и временем жизни.
+
+    При переполнении вытесняются пользователи, дольше всех не обращавшиеся
+    к боту; записи старше ttl секунд считаются пустыми и удаляются.
+    """
+
+    def __init__(self, max_size=config.FSM_MAX_SIZE, ttl=config.FSM_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder()
+        # ключ -> [состояние, данные, время последнего обращения]
+        self._records = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    def _get(self, key):
+        key = self.key_builder.build(key)
+        record = self._records.get(key)
+        if record is None:
+            return None
+        if self.ttl and time.monotonic() - record[2] > self.ttl:
+            del self._records[key]
+            self.expired += 1
+            return None
+        record[2] = time.monotonic()
+        self._records.move_to_end(key)
+        return record
+
+    def _put(self, key, state=None, data=None):
+        self._expire()
+        key = self.key_builder.build(key)
+        record = self._records.get(key)
+        if record is None:
+            record = self._records[key] = [None, {}, 0]
+        if state is not None:
+            record[0] = state or None
+        if data is not None:
+            record[1] = data
+        record[2] = time.monotonic()
+        self._records.move_to_end(key)
+        if record[0] is None and not record[1]:
+            # Пустые записи не храним
+            del self._records[key]
+        while len(self._records) > self.max_size:
+            self._records.popitem(last=False)
+            self.evicted += 1
+
+    def _expire(self):
+        # Записи упорядочены по времени обращения, устаревшие всегда в начале
+        if not self.ttl:
+            return 0
+        deadline = time.monotonic() - self.ttl
+        count = 0
+        while self._records:
+            record = next(iter(self._records.values()))
+            if record[2] >= deadline:
+                break
+            self._records.popitem(last=False)
+            count += 1
+        self.expired += count
+        return count
+
+    async def set_state(self, key, state=None):
+        # Пустая строка означает сброс состояния, в отличие от None "не менять"
+        self._put(key, state=_state_name(state) or "")
+
+    async def get_state(self, key):
+        record = self._get(key)
+        return record[0] if record else None
+
+    async def set_data(self, key, data):
+        self._put(key, data=dict(data))
+
+    async def get_data(self, key):
+        record = self._get(key)
+        return dict(record[1]) if record else {}
+
+    async def cleanup(self):
+        """Удаляет записи, к которым не обращались дольше ttl"""
+        return self._expire()
+
+    async def close(self):
+        self._records.clear()
+
+    async def stats(self):
+        """Количество пользователей и примерный объем данных в байтах"""
+        return {
+            'keys': len(self._records),
+            'bytes': sum(_data_size(data) + len(state or "") for state, data, _ in self._records.values()),
+            'max_size': self.max_size,
+            'evicted': self.evicted,
+            'expired': self.expired,
+        }
+
+
+class SQLStorage(BaseStorage):
+    """Хранилище FSM в таблице fsm_states.
+
+    Состояния переживают перезапуск и общие для всех реплик бота,
+    работающих с одной базой данных. Записи старше ttl секунд
+    не читаются и удаляются методом cleanup().
+    """
+
+    def __init__(self, ttl=config.FSM_TTL):
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder()
+
+    def _alive(self):
+        criteria = []
+        if self.ttl:
+            criteria.append(FsmRecord.updated_at >= datetime.now() - timedelta(seconds=self.ttl))
+        return criteria
+
+    async def _upsert(self, key, **values):
+        values['updated_at'] = datetime.now()
+        stmt = dialect_insert(FsmRecord).values(key=key, **values)
+        stmt = stmt.on_conflict_do_update(index_elements=[FsmRecord.key], set_=values)
+        async with async_session() as session:
+            await session.execute(stmt)
+            # Пустые записи удаляются, чтобы таблица не росла от сброшенных состояний
+            await session.execute(
+                delete(FsmRecord).where(
+                    FsmRecord.key == key,
+                    FsmRecord.state.is_(None),
+                    FsmRecord.data.is_(None),
+                )
+            )
+            await session.commit()
+
+    async def _get(self, key, column):
+        async with async_session() as session:
+            result = await session.execute(
+                select(column).where(FsmRecord.key == self.key_builder.build(key), *self._alive())
+            )
+            return result.scalar()
+
+    async def set_state(self, key, state=None):
+        await self._upsert(self.key_builder.build(key), state=_state_name(state))
+
+    async def get_state(self, key):
+        return await self._get(key, FsmRecord.state)
+
+    async def set_data(self, key, data):
+        data = json.dumps(data, ensure_ascii=False) if data else None
+        await self._upsert(self.key_builder.build(key), data=data)
+
+    async def get_data(self, key):
+        data = await self._get(key, FsmRecord.data)
+        return json.loads(data) if data else {}
+
+    async def cleanup(self):
+        """Удаляет записи, к которым не обращались дольше ttl"""
+        if not self.ttl:
+            return 0
+        async with async_session() as session:
+            result = await session.execute(
+                delete(FsmRecord).where(FsmRecord.updated_at < datetime.now() - timedelta(seconds=self.ttl))
+            )
+            await session.commit()
+            return result.rowcount
+
+    async def close(self):
+        pass
+
+    async def stats(self):
+        """Количество записей и объем данных в базе"""
+        async with async_session() as session:
+            result = await session.execute(
+                select(func.count(), func.coalesce(func.sum(func.length(FsmRecord.data)), 0))
+            )
+            keys, size = result.one()
+        return {'keys': keys, 'bytes': size}
+
+
+STORAGES = {
+    'memory': MemoryLRUStorage,
+    'sqlite': SQLStorage,
+    'sql': SQLStorage,
+}
+
+
+def create_storage(kind=None):
+    """Создает хранилище FSM по имени из настройки FSM_STORAGE"""
+    kind = kind or config.FSM_STORAGE
+    try:
+        return STORAGES[kind]()
+    except KeyError:
+        raise ValueError(f"Неизвестное хранилище FSM: {kind}") from None
@@ -0,0 +1,91 @@
+"""Общие настройки тестов.
+
+Окружение задается здесь, до импорта модулей бота (isolated_env):
+отдельная временная база SQLite, снятые ограничения скорости отправки и
+короткие задержки фоновых задач. Все тесты работают в одном цикле событий:
+соединения из пула движка привязаны к нему.
+
+Запуск:
+    python -m pytest -q
+"""
+import asyncio
+import os
+import socket
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from isolated_env import configure, temp_database_url  # noqa: E402
+
+DATABASE_URL = temp_database_url("bakery-tests-")
+configure(DATABASE_URL, token="123456:test")
+os.environ["CART_EDIT_DELAY"] = "0.2"
+
+import config  # noqa: E402  окружение должно быть задано до импорта
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    # Фоновые задачи бота (очередь отправки и т. п.) завершаются вместе с циклом
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def run(loop):
+    """Выполняет корутину в общем цикле событий"""
+    return loop.run_until_complete
+
+
+@pytest.fixture(scope="session")
+def db(run):
+    """База с примененными миграциями и товарами из init_db"""
+    from catalog import catalog
+    from init_db import init_db
+    init_db()
+    run(catalog.reload())
+
+
+@pytest.fixture(scope="session")
+def api(run):
+    """Фейковый сервер Bot API из нагрузочного теста"""
+    from loadtest import FakeBotAPI
+    api = FakeBotAPI(port=free_port())
+    run(api.start())
+    yield api
+    run(api.stop())
+
+
+@pytest.fixture(scope="session")
+def bot(run, api):
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    bot = Bot(token=config.BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    yield bot
+    run(bot.session.close())
+
+
+@pytest.fixture
+def feed(db, bot):
+    """Передает обновление диспетчеру бота"""
+    import main
+
+    async def feed(update):
+        await main.dp.feed_update(bot, update)
+    return feed
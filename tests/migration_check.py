@@ -0,0 +1,178 @@
+"""Проверка миграций и оформления заказа на базе из DATABASE_URL.
+
+Запускается тестом test_migrations.py в отдельном процессе: движки базы
+создаются при импорте модулей бота, а dialect_insert выбирает диалект по
+глобальному асинхронному движку. Все таблицы в базе удаляются, поэтому
+нужна отдельная тестовая база.
+
+Сценарий: база в исходной схеме бота (без schema_version) с корзинами и
+заказами в одной таблице orders -> миграции 1-12 -> добавление в корзину
+и оформление заказа через cart_service. На PostgreSQL затем проверяется
+одновременный запуск нескольких реплик на исходной базе.
+"""
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import MetaData, create_engine, func, select, text  # noqa: E402
+
+from cart_service import add_item, claim_checkout, load_summary, place_order  # noqa: E402
+from database import (  # noqa: E402
+    _setup_engine, engine, async_session, dialect_insert, Cart, CartItem, Order, OrderItem, SalesDaily, DemandHourly,
+    CacheVersion, Promotion,
+)
+from migrations import MIGRATIONS, _initial_schema, get_version, upgrade  # noqa: E402
+
+# Id пользователя Telegram больше 32 бит
+CART_USER = 5_000_000_000
+ORDER_USER = 11
+ORDER_DAY = date(2024, 1, 1)
+
+
+def reset():
+    with engine.begin() as conn:
+        metadata = MetaData()
+        metadata.reflect(conn)
+        metadata.drop_all(conn)
+
+
+def seed_original_schema():
+    """База, какой ее создавала первая версия бота"""
+    with engine.begin() as conn:
+        _initial_schema(conn)
+        metadata = MetaData()
+        metadata.reflect(conn)
+        products, orders, admins = (metadata.tables[name] for name in ('products', 'orders', 'admins'))
+        conn.execute(products.insert(), [
+            {'id': 1, 'name': "Яблочный пирог", 'price': 10.0, 'category': 'sweet', 'is_special': 0, 'discount': 0.0},
+            {'id': 2, 'name': "Мясной пирог", 'price': 20.0, 'category': 'savory', 'is_special': 1, 'discount': 0.5},
+        ])
+        conn.execute(orders.insert(), [
+            # Повторяющиеся строки корзины объединяет миграция 2
+            {'user_id': CART_USER, 'product_id': 1, 'quantity': 1, 'status': 'pending', 'created_at': datetime(2024, 1, 2, 9)},
+            {'user_id': CART_USER, 'product_id': 1, 'quantity': 2, 'status': 'pending', 'created_at': datetime(2024, 1, 2, 9, 5)},
+            {'user_id': CART_USER, 'product_id': 2, 'quantity': 1, 'status': 'pending', 'created_at': datetime(2024, 1, 2, 9, 6)},
+            # Оформленные строки без оформления становятся отдельными заказами (миграция 9)
+            {'user_id': ORDER_USER, 'product_id': 1, 'quantity': 2, 'status': 'completed', 'created_at': datetime(2024, 1, 1, 10)},
+            {'user_id': ORDER_USER, 'product_id': 2, 'quantity': 1, 'status': 'completed', 'created_at': datetime(2024, 1, 1, 11)},
+        ])
+        conn.execute(admins.insert(), [{'user_id': CART_USER, 'username': "admin", 'is_active': True}])
+
+
+def check_migrated():
+    with engine.begin() as conn:
+        assert get_version(conn) == 0
+        assert upgrade(conn) == MIGRATIONS[-1][0]
+        # Повторный запуск ничего не меняет
+        assert upgrade(conn) == MIGRATIONS[-1][0]
+
+        metadata = MetaData()
+        metadata.reflect(conn)
+        assert 'legacy_orders' not in metadata.tables
+        assert 'product_id' not in metadata.tables['orders'].columns
+
+        cart = conn.execute(select(Cart.id, Cart.version).where(Cart.user_id == CART_USER)).one()
+        assert cart.version == 0
+        items = dict(conn.execute(select(CartItem.product_id, CartItem.quantity).where(CartItem.cart_id == cart.id)).all())
+        assert items == {1: 3, 2: 1}, items
+
+        totals = conn.execute(select(Order.total).where(Order.user_id == ORDER_USER).order_by(Order.id)).scalars().all()
+        assert totals == [20.0, 10.0], totals
+        prices = conn.execute(select(OrderItem.product_id, OrderItem.unit_price).order_by(OrderItem.id)).all()
+        assert [tuple(row) for row in prices] == [(1, 10.0), (2, 10.0)], prices
+
+        # Сводки продаж миграции 10 по перенесенным заказам
+        sales = conn.execute(
+            select(SalesDaily.product_id, SalesDaily.promo, SalesDaily.units, SalesDaily.revenue)
+            .where(SalesDaily.day == ORDER_DAY).order_by(SalesDaily.product_id)
+        ).all()
+        assert [tuple(row) for row in sales] == [(1, False, 2, 20.0), (2, True, 1, 10.0)], sales
+        demand = dict(conn.execute(select(DemandHourly.hour, DemandHourly.units).where(DemandHourly.day == ORDER_DAY)).all())
+        assert demand == {10: 2, 11: 1}, demand
+
+        versions = set(conn.execute(select(CacheVersion.name)).scalars())
+        assert {'admins', 'promotions'} <= versions, versions
+
+
+async def check_checkout():
+    async with async_session() as session:
+        _, quantity = await add_item(session, CART_USER, 1)
+        assert quantity == 4
+        await session.commit()
+
+    async with async_session() as session:
+        checkout_id, text = await claim_checkout(session, CART_USER, "check:1")
+        assert text is None
+        order_id, lines, total = await place_order(session, CART_USER, checkout_id)
+        assert {line.product_id: line.quantity for line in lines} == {1: 4, 2: 1}
+        assert total == 50.0
+        await session.commit()
+
+    async with async_session() as session:
+        # Повторное нажатие находит то же оформление
+        assert (await claim_checkout(session, CART_USER, "check:1"))[0] == checkout_id
+        await session.rollback()
+        summary = await load_summary(session, CART_USER)
+        assert summary.quantities == {}
+        units = (await session.execute(
+            select(func.sum(SalesDaily.units)).where(SalesDaily.day == date.today())
+        )).scalar()
+        assert units == 5, units
+        order = (await session.execute(select(Order.user_id, Order.checkout_id).where(Order.id == order_id))).one()
+        assert tuple(order) == (CART_USER, checkout_id)
+
+        # Уникальный ключ акции часа из миграции 12
+        for _ in range(2):
+            await session.execute(
+                dialect_insert(Promotion)
+                .values(title="Акция", product_id=1, discount=0.1, starts_at=datetime.now(), ends_at=datetime.now(), key="rotation:test")
+                .on_conflict_do_nothing(index_elements=[Promotion.key])
+            )
+        await session.commit()
+        assert (await session.execute(select(func.count()).select_from(Promotion))).scalar() == 1
+
+
+def check_concurrent_upgrade(replicas=3):
+    """Реплики, запущенные одновременно, применяют каждую миграцию один раз"""
+    engines = [create_engine(engine.url) for _ in range(replicas)]
+    for replica_engine in engines:
+        _setup_engine(replica_engine)
+    barrier = threading.Barrier(replicas)
+
+    def start(replica_engine):
+        with replica_engine.begin() as conn:
+            barrier.wait()
+            return upgrade(conn)
+
+    try:
+        with ThreadPoolExecutor(replicas) as pool:
+            results = list(pool.map(start, engines))
+    finally:
+        for replica_engine in engines:
+            replica_engine.dispose()
+    assert results == [MIGRATIONS[-1][0]] * replicas, results
+    with engine.begin() as conn:
+        counts = dict(conn.execute(text("SELECT version, COUNT(*) FROM schema_version GROUP BY version")).all())
+    assert counts == {version: 1 for version, _, _ in MIGRATIONS}, counts
+
+
+def main():
+    reset()
+    seed_original_schema()
+    check_migrated()
+    asyncio.run(check_checkout())
+    # Блокировка миграций есть только у PostgreSQL
+    if engine.dialect.name == 'postgresql':
+        reset()
+        seed_original_schema()
+        check_concurrent_upgrade()
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+from admin_manager import toggle_admin
+from admins import AdminCache
+from init_db import add_admin
+
+REFRESH_INTERVAL = 0.2
+
+
+async def _wait_for(predicate, timeout):
+    """Время до выполнения условия или None, если не дождались"""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if predicate():
+            return time.monotonic() - started
+        await asyncio.sleep(0.01)
+    return None
+
+
+def test_toggle_applies_within_refresh_interval(run, db):
+    user_id = 1701
+    add_admin(user_id, "admin")
+    cache = AdminCache(refresh_interval=REFRESH_INTERVAL)
+
+    async def scenario():
+        await cache.start()
+        try:
+            assert user_id in cache
+            toggle_admin(user_id)
+            disabled = await _wait_for(lambda: user_id not in cache, 2 * REFRESH_INTERVAL)
+            toggle_admin(user_id)
+            enabled = await _wait_for(lambda: user_id in cache, 2 * REFRESH_INTERVAL)
+            return disabled, enabled
+        finally:
+            await cache.stop()
+
+    disabled, enabled = run(scenario())
+    assert disabled is not None and disabled <= REFRESH_INTERVAL + 0.1
+    assert enabled is not None and enabled <= REFRESH_INTERVAL + 0.1
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from loadtest import UserSession
+
+
+@pytest.fixture
+def product():
+    from catalog import catalog
+    return catalog.by_category('sweet')[0]
+
+
+async def _quantity(user_id, product_id):
+    from cart_service import load_summary
+    from database import async_session
+    async with async_session() as session:
+        summary = await load_summary(session, user_id)
+    return summary.quantities.get(product_id, 0)
+
+
+def test_fast_taps_are_added_up(run, api, feed, product):
+    user = UserSession(2401, api)
+
+    async def scenario():
+        await feed(user.message("/start"))
+        await feed(user.callback(f"add:{product.id}"))
+        # Все нажатия приходят с одной и той же клавиатуры
+        for _ in range(3):
+            await feed(user.callback(f"cqty:{product.id}:1"))
+        await feed(user.callback(f"cqty:{product.id}:-1"))
+        await asyncio.sleep(0.5)
+        return await _quantity(user.user_id, product.id)
+
+    assert run(scenario()) == 3
+
+
+def test_quantity_is_clamped(run, api, feed, product):
+    from keyboards import MAX_QUANTITY
+    user = UserSession(2402, api)
+
+    async def scenario():
+        await feed(user.message("/start"))
+        await feed(user.callback(f"add:{product.id}"))
+        await feed(user.callback(f"cqty:{product.id}:-1"))
+        await feed(user.callback(f"cqty:{product.id}:-1"))
+        await asyncio.sleep(0.5)
+        removed = await _quantity(user.user_id, product.id)
+        await feed(user.callback(f"setq:{product.id}"))
+        await feed(user.message(str(MAX_QUANTITY)))
+        await feed(user.callback(f"cqty:{product.id}:1"))
+        await asyncio.sleep(0.5)
+        return removed, await _quantity(user.user_id, product.id)
+
+    assert run(scenario()) == (0, MAX_QUANTITY)
+
+
+def test_stop_writes_pending_edits(run, api, feed, product):
+    from cart_editor import cart_editor
+    user = UserSession(2403, api)
+
+    async def scenario():
+        await feed(user.message("/start"))
+        await feed(user.callback(f"add:{product.id}"))
+        await feed(user.callback(f"cqty:{product.id}:1"))
+        await cart_editor.stop()
+        return await _quantity(user.user_id, product.id)
+
+    assert run(scenario()) == 2
@@ -0,0 +1,106 @@
+"""Одновременные изменения одной корзины и повторные оформления заказа"""
+import asyncio
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from cart_service import add_item, claim_checkout, load_summary, place_order
+from catalog import catalog
+from database import async_session, _engine_options, _setup_engine, DATABASE_URL, Order, OrderItem
+
+
+async def _add(user_id, product_id):
+    async with async_session() as session:
+        await add_item(session, user_id, product_id)
+        await session.commit()
+
+
+async def _checkout(user_id, key):
+    """То же, что обработчик оформления: возвращает id нового заказа или None"""
+    async with async_session() as session:
+        checkout_id, confirmed_text = await claim_checkout(session, user_id, key)
+        if confirmed_text is not None:
+            await session.rollback()
+            return None
+        order_id, lines, _ = await place_order(session, user_id, checkout_id)
+        if not lines:
+            await session.rollback()
+            return None
+        await session.commit()
+        return order_id
+
+
+def test_concurrent_adds_keep_exact_quantity(run, db):
+    user_id = 1801
+    product = catalog.by_category('sweet')[0]
+
+    async def scenario():
+        await asyncio.gather(*(_add(user_id, product.id) for _ in range(300)))
+        async with async_session() as session:
+            summary = await load_summary(session, user_id)
+        return summary.quantities
+
+    assert run(scenario()) == {product.id: 300}
+
+
+def test_concurrent_checkouts_create_one_order(run, db):
+    user_id = 1802
+    first, second = catalog.by_category('savory')[:2]
+
+    async def scenario():
+        await _add(user_id, first.id)
+        await _add(user_id, second.id)
+        await _add(user_id, second.id)
+        results = await asyncio.gather(*(_checkout(user_id, "1802:1:1") for _ in range(100)))
+        async with async_session() as session:
+            orders = (await session.execute(
+                select(Order.id).where(Order.user_id == user_id)
+            )).scalars().all()
+            quantity = (await session.execute(
+                select(func.sum(OrderItem.quantity)).where(OrderItem.order_id.in_(orders))
+            )).scalar()
+        return [order_id for order_id in results if order_id is not None], orders, quantity
+
+    created, orders, quantity = run(scenario())
+    assert len(created) == 1
+    assert orders == created
+    assert quantity == 3
+
+
+async def _place(sessionmaker, user_id, key):
+    """Оформление с отдельным ключом; возвращает результат place_order"""
+    async with sessionmaker() as session:
+        checkout_id, _ = await claim_checkout(session, user_id, key)
+        result = await place_order(session, user_id, checkout_id)
+        await session.commit()
+        return result
+
+
+def test_checkouts_with_different_keys_take_cart_once(run, db):
+    # Две реплики или два сообщения с корзиной: ключи разные, корзина одна.
+    # У каждой "реплики" свой движок и свое соединение с базой
+    user_id = 1803
+    first, second = catalog.by_category('sweet')[:2]
+    engines = [create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL)) for _ in range(4)]
+    for engine in engines:
+        _setup_engine(engine.sync_engine)
+    sessionmakers = [async_sessionmaker(engine, expire_on_commit=False) for engine in engines]
+
+    async def scenario():
+        await _add(user_id, first.id)
+        await _add(user_id, second.id)
+        await _add(user_id, second.id)
+        try:
+            return await asyncio.gather(*(
+                _place(sessionmakers[i % len(sessionmakers)], user_id, f"1803:{i}:1") for i in range(40)
+            ))
+        finally:
+            for engine in engines:
+                await engine.dispose()
+
+    results = run(scenario())
+    placed = [result for result in results if result[0] is not None]
+    assert len(placed) == 1
+    order_id, lines, _ = placed[0]
+    assert {line.product_id: line.quantity for line in lines} == {first.id: 1, second.id: 2}
+    assert all(result == (None, [], 0) for result in results if result[0] is None)
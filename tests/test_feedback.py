@@ -0,0 +1,40 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from database import async_session, Feedback
+from feedback import FeedbackWriter
+
+
+async def _count(user_id):
+    async with async_session() as session:
+        result = await session.execute(select(func.count()).select_from(Feedback).where(Feedback.user_id == user_id))
+        return result.scalar()
+
+
+def test_stop_writes_buffer(run, db):
+    writer = FeedbackWriter(batch_size=100, flush_interval=60)
+
+    async def scenario():
+        for i in range(10):
+            writer.add(1601, "user", f"отзыв {i}")
+        await asyncio.sleep(0)
+        await writer.stop()
+        return await _count(1601)
+
+    assert run(scenario()) == 10
+
+
+def test_stop_during_write_keeps_each_row_once(run, db):
+    async def scenario(user_id, steps):
+        writer = FeedbackWriter(batch_size=5, flush_interval=60)
+        for i in range(23):
+            writer.add(user_id, "user", f"отзыв {i}")
+        # Остановка приходит на разных этапах записи пачек
+        for _ in range(steps):
+            await asyncio.sleep(0)
+        await writer.stop()
+        return await _count(user_id), writer.written
+
+    for steps in range(0, 60, 2):
+        assert run(scenario(16000 + steps, steps)) == (23, 23), steps
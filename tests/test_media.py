@@ -0,0 +1,31 @@
+import asyncio
+from types import SimpleNamespace
+
+from catalog import catalog
+from media import remember_photo
+
+
+def _photo_message(file_id):
+    return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+
+def test_file_id_is_saved_after_sending_by_url(run, db):
+    product = next(item for item in catalog.all() if item.image_file_id is None)
+    run(remember_photo(product, _photo_message("first")))
+    assert catalog.get(product.id).image_file_id == "first"
+
+
+def test_saved_file_id_is_not_overwritten(run, db):
+    product = catalog.all()[-1]
+    run(remember_photo(product, _photo_message("stored")))
+    product = catalog.get(product.id)
+    # Повторная отправка по file_id вернула другую строку для того же файла
+    run(remember_photo(product, _photo_message("returned")))
+    assert catalog.get(product.id).image_file_id == "stored"
+
+
+def test_concurrent_first_views_save_one_file_id(run, db):
+    product = next(item for item in catalog.all() if item.image_file_id is None)
+    # Все показы начались до сохранения file_id и отправили фото по адресу
+    run(asyncio.gather(*(remember_photo(product, _photo_message(f"view{i}")) for i in range(20))))
+    assert catalog.get(product.id).image_file_id == "view0"
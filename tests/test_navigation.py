@@ -0,0 +1,53 @@
+"""Число запросов к Bot API на нажатие в основных сценариях навигации.
+
+Экран меняется правкой сообщения (один запрос). Удаление и новое
+сообщение (два запроса) остаются только при переходе между текстом и фото.
+"""
+import pytest
+from sqlalchemy import select
+
+from catalog import catalog
+from database import async_session, Cart
+from loadtest import UserSession
+
+
+def _sweet(index):
+    return catalog.by_category('sweet')[index].id
+
+
+FLOWS = {
+    # Текстовые экраны: только правка сообщения
+    'categories': [("cat:sweet", 1), ("categories", 1), ("cat:savory", 1), ("categories", 1)],
+    # Список -> фото товара -> список: смена типа сообщения
+    'product': [("cat:sweet", 1), (lambda: f"prod:{_sweet(0)}", 2), ("prods:sweet", 2)],
+    # Добавление с экрана товара: корзина вместо фото и ответ на нажатие
+    'add': [("cat:sweet", 1), (lambda: f"prod:{_sweet(1)}", 2), (lambda: f"add:{_sweet(1)}", 3), ("prods:sweet", 1)],
+    # Оформление правит сообщение с корзиной
+    'checkout': [("cat:savory", 1), (lambda: f"add:{catalog.by_category('savory')[0].id}", 2), ("checkout", 1)],
+}
+
+
+@pytest.mark.parametrize("flow", FLOWS)
+def test_api_calls_per_tap(run, api, feed, flow):
+    user = UserSession(1300 + list(FLOWS).index(flow), api)
+    run(feed(user.message("🍰 Меню")))
+    calls = []
+    for data, _ in FLOWS[flow]:
+        api.calls = 0
+        run(feed(user.callback(data() if callable(data) else data)))
+        calls.append(api.calls)
+    assert calls == [expected for _, expected in FLOWS[flow]]
+
+
+@pytest.mark.parametrize("data", ["prod:999999", "add:999999"])
+def test_unknown_product_is_answered(run, api, feed, data):
+    user = UserSession(1350, api)
+    api.calls = 0
+    # Устаревшая или подделанная кнопка: только ответ на нажатие
+    run(feed(user.callback(data)))
+    assert api.calls == 1
+
+    async def cart():
+        async with async_session() as session:
+            return (await session.execute(select(Cart).where(Cart.user_id == 1350))).scalar()
+    assert run(cart()) is None
@@ -0,0 +1,15 @@
+"""Просмотр меню с постоянной частотой при одновременных оформлениях заказов"""
+from conftest import free_port
+
+# Граница с запасом для медленных машин; на рабочей машине p99 около 100-150 мс
+BROWSE_P99_LIMIT_MS = 500
+
+
+def test_browse_p99_stays_bounded_under_checkouts(run, db):
+    from loadtest import run_open_loop
+    result = run(run_open_loop(rate=20, duration=3, buyers=10, port=free_port(), browsers=20))
+    for name in ('browse_only', 'with_checkouts'):
+        assert result[name]['errors'] == 0
+        assert result[name]['browse_updates'] == 60
+        assert result[name]['browse_latency_ms']['p99'] < BROWSE_P99_LIMIT_MS, (name, result[name])
+    assert result['with_checkouts']['checkouts_per_sec'] > 0
@@ -0,0 +1,60 @@
+"""Число SQL-запросов обработчиков не зависит от размера корзины и числа заказов"""
+import pytest
+
+from admins import admin_cache
+from init_db import add_admin
+from cart_service import add_item, cart_summaries
+from catalog import catalog
+from database import async_engine, async_session
+from loadtest import StatementCounter, UserSession
+
+CART_SIZES = (1, 4, 10)
+
+
+@pytest.fixture(scope="module")
+def statements(db):
+    return StatementCounter(async_engine)
+
+
+async def _fill_cart(user_id, size):
+    async with async_session() as session:
+        for product in catalog.all()[:size]:
+            await add_item(session, user_id, product.id, quantity=2)
+        await session.commit()
+
+
+def _count(run, statements, action):
+    statements.count = 0
+    run(action())
+    return statements.count
+
+
+def test_cart_and_checkout_statements_are_constant(run, api, feed, statements):
+    counts = {}
+    for size in CART_SIZES:
+        user = UserSession(4000 + size, api)
+        run(feed(user.message("/start")))
+        run(_fill_cart(user.user_id, size))
+        # Сводка корзины не закэширована: учитываем и ее загрузку
+        cart_summaries.forget(user.user_id)
+        counts[size] = (
+            _count(run, statements, lambda: feed(user.message("🛒 Корзина"))),
+            _count(run, statements, lambda: feed(user.callback("checkout"))),
+        )
+    assert len(set(counts.values())) == 1, counts
+
+
+def test_report_statements_are_constant(run, api, feed, statements):
+    admin = UserSession(4100, api)
+    add_admin(admin.user_id, "admin")
+    run(admin_cache.load())
+    counts = {}
+    for size in CART_SIZES:
+        user = UserSession(4100 + size, api)
+        run(_fill_cart(user.user_id, size))
+        run(feed(user.callback("checkout")))
+        counts[size] = tuple(
+            _count(run, statements, lambda: feed(admin.message(text)))
+            for text in ("📋 Заказы", "🧺 Корзины")
+        )
+    assert len(set(counts.values())) == 1, counts
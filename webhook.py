@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from aiohttp import web
+from aiogram.types import Update
+
+import config
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Принимает обновления от Telegram по HTTP и раздает их пулу обработчиков.
+
+    HTTP-ответ отправляется сразу после постановки обновления в очередь,
+    поэтому Telegram не ждет окончания обработки. Очередь ограничена: при
+    переполнении сервер отвечает 503, и Telegram повторит доставку позже.
+    Несколько таких процессов можно запускать за балансировщиком нагрузки.
+    """
+
+    def __init__(self, dp, bot, workers=None, queue_size=None):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers or config.WEBHOOK_WORKERS
+        self.queue = asyncio.Queue(maxsize=queue_size or config.WEBHOOK_QUEUE_SIZE)
+        self._tasks = []
+
+    async def handle(self, request):
+        if config.WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != config.WEBHOOK_SECRET:
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:
+            return web.Response(status=400)
+
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logging.warning("Очередь обновлений переполнена, обновление отклонено")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logging.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Даем обработать уже принятые обновления, затем останавливаем обработчики
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=10)
+        except asyncio.TimeoutError:
+            logging.warning(f"Не обработано обновлений: {self.queue.qsize()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_post(config.WEBHOOK_PATH, self.handle)
+        return app
+
+
+async def run_webhook(dp, bot):
+    """Запускает бота в режиме webhook"""
+    server = WebhookServer(dp, bot)
+    await server.start()
+
+    if config.WEBHOOK_URL:
+        await bot.set_webhook(
+            url=config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    await site.start()
+    logging.info(f"Webhook-сервер запущен на {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await server.stop()
+        await bot.session.close()